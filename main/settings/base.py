@@ -209,6 +209,27 @@ LINK_PATTERNS = [
 # the maximum number of images to include in the report for each project.
 MAX_REPORT_IMG_COUNT = 2
 
+# limits on the spatial points that can be uploaded for a project at
+# one time, and should the points be checked against the lake polygon
+# (rather than just its bounding box)?
+MAX_UPLOAD_POINTS = 50000
+MAX_POINTS_FILE_SIZE = 10 * 1024 * 1024
+CHECK_POINTS_IN_LAKE = False
+
+# the number of seconds browsers (and proxies) can cache the sample
+# point vector tiles for:
+TILE_CACHE_MAX_AGE = 3600
+
+# the maximum number of seconds the milestones are kept in each
+# process before they are reloaded (None to keep them until a milestone
+# changes - only safe if CACHES is shared between processes):
+MILESTONE_REGISTRY_TIMEOUT = 60
+
+# if True, messages are queued rather than delivered to each recipient
+# when they are sent - run 'python manage.py send_queued_messages'
+# periodically to deliver them.
+DEFER_MESSAGE_DELIVERY = False
+
 
 # a dictionary of attributes used to create links to project details in
 # associated (but currently distinct) apps - fisheye, fsis-II and
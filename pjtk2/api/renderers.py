@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class GeoJSONRenderer(JSONRenderer):
+    """Selected with ?format=geojson or 'Accept: application/geo+json'.
+    Views that support it stream their features directly (see
+    pjtk2.utils.geojson_stream) - this renderer is only used to render
+    any other responses (e.g. errors) as json."""
+
+    media_type = "application/geo+json"
+    format = "geojson"
@@ -177,9 +177,20 @@ class ProjectPointSerializer(serializers.ModelSerializer):
 
 
 class ProjectPolygonSerializer(serializers.HyperlinkedModelSerializer):
+    """The polygon is returned at the resolution in the serializer
+    context ('high' - the full polygon - by default).  For the other
+    resolutions, the queryset must be annotated with the simplified
+    polygon (see PolygonResolutionMixin) - it is returned in the same
+    (ewkt) format as geom."""
 
     prj_cd = serializers.CharField(source="project.prj_cd", read_only=True)
 
     class Meta:
         model = ProjectPolygon
         fields = ("prj_cd", "geom")
+
+    def get_fields(self):
+        fields = super(ProjectPolygonSerializer, self).get_fields()
+        if self.context.get("resolution", "high") != "high":
+            fields["geom"] = serializers.CharField(source="simplified", read_only=True)
+        return fields
@@ -14,9 +14,11 @@ from .views import (
     ProjectTypeViewSet,
     ProjectPointViewSet,
     ProjectPolygonViewSet,
+    ProjectPolygonListView,
     ProjectAbstractViewSet,
     points_roi,
     SamplePointListView,
+    sample_point_tiles,
     ReportListView,
     AssociatedFilesListView,
 )
@@ -49,6 +51,11 @@ urlpatterns = [
         ProjectPolygonViewSet.as_view({"get": "list"}),
         name="project_polygon",
     ),
+    path(
+        "project_polygons/",
+        ProjectPolygonListView.as_view(),
+        name="project_polygon_list",
+    ),
     # just the points - regardless of project
     path("points_in_roi/", points_roi, {"how": "points_in"}, name="get_points_in_roi"),
     # points for projects were ALL points are in roi
@@ -70,6 +77,11 @@ urlpatterns = [
         SamplePointListView.as_view(),
         name="sample_point_list",
     ),
+    path(
+        "tiles/points/<int:z>/<int:x>/<int:y>.pbf",
+        sample_point_tiles,
+        name="sample_point_tiles",
+    ),
     path(
         "reports/",
         ReportListView.as_view(),
@@ -1,5 +1,17 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.gis.db.models import PolygonField
 from django.db.models import Q, Prefetch, F
-from django.http import Http404
+from django.db.models.functions import Coalesce
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import GEOSGeometry, Polygon
 
@@ -7,15 +19,17 @@ from rest_framework import generics, viewsets, status
 from rest_framework.generics import RetrieveAPIView, ListAPIView
 from rest_framework.response import Response
 
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import AllowAny, BasePermission, SAFE_METHODS
 
 from django_filters import rest_framework as filters
 
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
 
 
+from .renderers import GeoJSONRenderer
 from .serializers import (
     ProjectSerializer,
     ProjectAbstractSerializer,
@@ -44,10 +58,33 @@ from pjtk2.filters import (
 )
 
 from pjtk2.utils.spatial_utils import find_roi_points
+from pjtk2.utils.geojson_stream import stream_feature_collection
+from pjtk2.utils.vector_tiles import get_sample_point_tile
 
 User = get_user_model()
 
 
+# the default renderers plus geojson - for the endpoints that can
+# stream their points as a feature collection:
+GEOJSON_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [
+    GeoJSONRenderer
+]
+
+
+def is_geojson_request(request):
+    """Did the request ask for geojson (?format=geojson or 'Accept:
+    application/geo+json')?"""
+    return request.accepted_renderer.format == GeoJSONRenderer.format
+
+
+def geojson_response(points):
+    """Stream the sample points in the queryset points as a geojson
+    feature collection built by the database."""
+    return StreamingHttpResponse(
+        stream_feature_collection(points), content_type=GeoJSONRenderer.media_type
+    )
+
+
 class ReadOnly(BasePermission):
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS
@@ -127,17 +164,77 @@ class ProjectPointViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset.filter(project__slug=slug)
 
 
-class ProjectPolygonViewSet(viewsets.ReadOnlyModelViewSet):
+class PolygonResolutionMixin(object):
+    """Return the project polygons at the resolution in the
+    'resolution' parameter (one of the keys of
+    ProjectPolygon.RESOLUTIONS).  Only the geometry for that
+    resolution is retrieved from the database."""
+
+    def get_resolution(self):
+        resolution = self.request.query_params.get("resolution", "high")
+        if resolution not in ProjectPolygon.RESOLUTIONS:
+            errmsg = "resolution must be one of: {}.".format(
+                ", ".join(ProjectPolygon.RESOLUTIONS)
+            )
+            raise ValidationError(errmsg)
+        return resolution
+
+    def defer_geometries(self, queryset):
+        """Only select the polygon for the requested resolution - the
+        simplified polygons are annotated as 'simplified' (falling back
+        to the full polygon if they are missing)."""
+
+        field = ProjectPolygon.RESOLUTIONS[self.get_resolution()][0]
+        geometries = [x for x, _ in ProjectPolygon.RESOLUTIONS.values()]
+        if field == "geom":
+            geometries.remove("geom")
+            return queryset.defer(*geometries)
+        return queryset.defer(*geometries).annotate(
+            simplified=Coalesce(field, "geom", output_field=PolygonField(srid=4326))
+        )
+
+    def get_serializer_context(self):
+        context = super(PolygonResolutionMixin, self).get_serializer_context()
+        context["resolution"] = self.get_resolution()
+        return context
+
+
+class ProjectPolygonViewSet(PolygonResolutionMixin, viewsets.ReadOnlyModelViewSet):
 
     serializer_class = ProjectPolygonSerializer
 
     def get_queryset(self):
         slug = self.kwargs.get("slug").lower()
-        return ProjectPolygon.objects.filter(project__slug=slug)
+        return self.defer_geometries(ProjectPolygon.objects.filter(project__slug=slug))
+
+
+class ProjectPolygonListView(PolygonResolutionMixin, ListAPIView):
+    """A read-only endpoint to return the polygons of the projects
+    matching the project filters - e.g. ?lake=HU&resolution=low for an
+    overview map of every project in Lake Huron."""
+
+    serializer_class = ProjectPolygonSerializer
+    permission_classes = [ReadOnly]
+    pagination_class = LargeResultsSetPagination
+    filter_backends = []
+
+    def get_queryset(self):
+        project_filter = ProjectFilter(
+            self.request.query_params, queryset=Project.objects.all()
+        )
+        if not project_filter.is_valid():
+            raise ValidationError(project_filter.errors)
+        queryset = (
+            ProjectPolygon.objects.filter(project__in=project_filter.qs.values("id"))
+            .select_related("project")
+            .order_by("project__prj_cd")
+        )
+        return self.defer_geometries(queryset)
 
 
 @api_view(["POST"])
 @permission_classes((AllowAny,))
+@renderer_classes(GEOJSON_RENDERER_CLASSES)
 def points_roi(request, how="contained"):
     """A view to return all of the sampling points either contained in or
     overlapping the region of interest.  Overlapping projects will have at
@@ -147,6 +244,9 @@ def points_roi(request, how="contained"):
     projects that were completely contained in the region of interest
     or have some of their samples in the region of interest.
 
+    If geojson is requested, the points are streamed as a feature
+    collection rather than serialized.
+
     """
 
     first_year = request.GET.get("first_year")
@@ -217,6 +317,9 @@ def points_roi(request, how="contained"):
     if last_year:
         sample_points = sample_points.filter(project__year__lte=last_year)
 
+    if is_geojson_request(request):
+        return geojson_response(sample_points)
+
     serializer = ProjectPointSerializer(
         sample_points, many=True, context={"request": request}
     )
@@ -262,16 +365,65 @@ def points_roi(request, how="contained"):
 
 
 class SamplePointListView(ListAPIView):
-    """A read-only endpoint to return sampling points."""
+    """A read-only endpoint to return sampling points.  If geojson is
+    requested, all of the matching points are streamed as a feature
+    collection (without pagination)."""
 
     serializer_class = ProjectPointSerializer
     permission_classes = [ReadOnly]
     pagination_class = LargeResultsSetPagination
     filterset_class = SamplePointFilter
+    renderer_classes = GEOJSON_RENDERER_CLASSES
     queryset = SamplePoint.objects.select_related(
         "project", "project__project_type"
     ).all()
 
+    def list(self, request, *args, **kwargs):
+        if is_geojson_request(request):
+            return geojson_response(self.filter_queryset(self.get_queryset()))
+        return super(SamplePointListView, self).list(request, *args, **kwargs)
+
+
+@require_safe
+def sample_point_tiles(request, z, x, y):
+    """Return a Mapbox vector tile of the sample points in tile z/x/y.
+    The points can be filtered using the same parameters as the sample
+    points endpoint, and by any of the project filters (which are
+    applied to the projects the points belong to).  The tile is built
+    by PostGIS and includes an ETag so unchanged tiles are not sent
+    again.
+
+    """
+
+    point_filter = SamplePointFilter(request.GET, queryset=SamplePoint.objects.all())
+    if not point_filter.is_valid():
+        return HttpResponseBadRequest(point_filter.errors.as_json())
+    points = point_filter.qs
+
+    project_params = set(ProjectFilter.base_filters) - set(
+        SamplePointFilter.base_filters
+    )
+    if project_params.intersection(request.GET):
+        project_filter = ProjectFilter(request.GET, queryset=Project.objects.all())
+        if not project_filter.is_valid():
+            return HttpResponseBadRequest(project_filter.errors.as_json())
+        points = points.filter(project__in=project_filter.qs.values("id"))
+
+    try:
+        tile = get_sample_point_tile(points, z, x, y)
+    except ValueError:
+        raise Http404
+
+    etag = '"{}"'.format(hashlib.md5(tile).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+    response["ETag"] = etag
+    patch_cache_control(
+        response, public=True, max_age=getattr(settings, "TILE_CACHE_MAX_AGE", 3600)
+    )
+    return response
+
 
 class ReportListView(ListAPIView):
     """A read-only endpoint to return currently available reports."""
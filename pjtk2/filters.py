@@ -1,8 +1,9 @@
-from django.db import connection
 from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos.error import GEOSException
 import django_filters
 
 from pjtk2.models import Project, ProjectType, SamplePoint, Report, AssociatedFile
+from pjtk2.utils.geography import DWithin, WithinBuffer
 
 
 # from crispy_forms.helper import FormHelper
@@ -17,23 +18,6 @@ class ValueInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
     pass
 
 
-def point_to_polygon(pt, radius_m):
-    """a helper function to connect directly to postgis trasform, buffer
-    and transform back our point.  The build in django functions do
-    not currenly return a correctly transormed polygon (way too tall).
-
-    """
-    with connection.cursor() as cursor:
-        sql = (
-            """select st_transform(st_buffer(st_transform(
-        st_geomfromtext(%s, 4326), 26916),%s), 4326) as poly;"""
-            ""
-        )
-        cursor.execute(sql, [pt, radius_m])
-        row = cursor.fetchone()
-    return row
-
-
 def get_year_choices():
     """a little helper function to get a distinct list of years that can
     be used for the years filter.  The function returns a list of two
@@ -90,18 +74,19 @@ class GeoFilterSet(django_filters.FilterSet):
             else:
                 geom = value
                 radius = 5000
-                # get the buffered point (now a polygon from postgis) NOTE
-                # - this a work-around for transform-buffer-backtransform
-                # bug in django library
-            polygon = point_to_polygon(geom, radius)
-            roi = GEOSGeometry(polygon[0], srid=4326)
-
-            geofilter = {}
-            geofilter[name] = roi
+            point = GEOSGeometry(geom, srid=4326)
+        except (ValueError, GEOSException):
+            return queryset
 
-            queryset = queryset.filter(**geofilter)
-        except ValueError:
-            pass
+        # the distances are calculated on geography in a single
+        # query - ST_DWithin can use the geography index on the
+        # geometry, and 'within' also requires all of the geometry
+        # (points, multipoints or polygons) to be inside the buffered
+        # point.
+        field, lookup = name.rsplit("__", 1)
+        queryset = queryset.filter(DWithin(field, point, radius))
+        if lookup == "within":
+            queryset = queryset.filter(WithinBuffer(field, point, radius))
         return queryset
 
 
@@ -2,21 +2,19 @@
 # E1120 - No value passed for parameter 'cls' in function call
 # pylint: disable=E1101, E1120
 
-import csv
 import datetime
 import hashlib
-import io
 import re
-from itertools import chain
+from itertools import chain, islice
 
 import pytz
 from common.models import Lake
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
 # from django.contrib.gis import forms
 from django.contrib.gis.forms.fields import PolygonField
-from django.contrib.gis.geos import Point
 from django.core.validators import FileExtensionValidator
 from django.db.models.aggregates import Max, Min
 from django.forms import (
@@ -35,7 +33,6 @@ from django.utils.safestring import mark_safe
 
 # from olwidget.fields import MapField, EditableLayerField
 from leaflet.forms.widgets import LeafletWidget
-from openpyxl import load_workbook
 from taggit.forms import TagField
 
 from .models import (
@@ -48,11 +45,14 @@ from .models import (
     ProjectFunding,
     ProjectImage,
     ProjectMilestones,
+    ProjectMilestoneStatus,
     ProjectProtocol,
     ProjectType,
     Report,
-    SamplePoint,
+    milestone_registry,
 )
+from .utils.point_ingestion import insert_sample_points, iter_point_rows
+from .utils.point_validation import PointValidator, get_project_lake
 
 User = get_user_model()
 
@@ -130,7 +130,7 @@ class ReadOnlyText(forms.TextInput):
 
     def render(self, name, value, attrs=None, renderer=None):
         if name.startswith("projectmilestone"):
-            value = Milestone.objects.get(id=value).label
+            value = milestone_registry.get(id=value).label
         elif value is None:
             value = ""
         return mark_safe(value)
@@ -523,6 +523,10 @@ class ReportsForm(forms.Form):
                     project=project, required=True, milestone_id=milestone
                 )
 
+        # update() doesn't send the signals that keep the milestone
+        # status up to date:
+        ProjectMilestoneStatus.refresh([project.id])
+
 
 # class ReportUploadFormSet(BaseFormSet):
 #    '''modified from
@@ -1283,59 +1287,43 @@ class SpatialPointUploadForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self.project = kwargs.pop("project")
-        self.lake_geom = self.project.lake.geom
+        self.lake = get_project_lake(self.project)
+        self.lake_geom = self.lake.geom if self.lake else None
         super(SpatialPointUploadForm, self).__init__(*args, **kwargs)
         self.fields["points_file"].widget.attrs["class"] = "fileinput"
         self.fields["points_file"].widget.attrs["accept"] = ".csv,.txt,.xlsx"
 
-    def handle_csv_data(self, csv_file):
-        # encoding catches the byte-order-mark that can cause issues:
-        csv_file = io.TextIOWrapper(csv_file, encoding="utf-8-sig")
-        reader = csv.reader(csv_file, delimiter=",", quotechar='"')
-        pts = [x for x in list(reader) if x != []]
-        for i, row in enumerate(pts):
-            pts[i] = [x.replace('"', "") for x in row]
-
-        return pts
-
-    def handle_xlsx_data(self, xlsx_file):
-        wb = load_workbook(filename=xlsx_file)
-        pts = []
-
-        for row in wb.worksheets[0]:
-            pts.append([cell.value for cell in row])
-        return pts
-
     def clean_points_file(self):
         """verify that our file can be parsed, contains the data we think it
         contains, and that the points are actually in the bounding box of the
         lake assoicated with this project.
+
+        The rows are read and validated one at a time so the file is
+        never held in memory - only the (label, dd_lon, dd_lat) tuples
+        of the valid points are kept for save().
         """
         validation_errors = []
-        geoPoints = None
+
+        if self.lake is None:
+            raise ValidationError(
+                "This project is not associated with a lake - "
+                "its points can't be validated."
+            )
 
         points_file = self.cleaned_data.get("points_file", False)
         if points_file:
-            if points_file.size > 0.5 * 1024 * 1024:
-                raise ValidationError("Points_File file way too large ( > 0.5mb )")
-
-            if points_file.name.endswith("xlsx"):
-                pts = self.handle_xlsx_data(points_file.file)
-            else:
-                pts = self.handle_csv_data(points_file.file)
-
-            MAX_UPLOAD_POINTS = 1000
-            if len(pts) > MAX_UPLOAD_POINTS:
-                error_msg = (
-                    "The points file contains more than {} points! ".format(
-                        MAX_UPLOAD_POINTS
+            max_size = getattr(settings, "MAX_POINTS_FILE_SIZE", 10 * 1024 * 1024)
+            if points_file.size > max_size:
+                raise ValidationError(
+                    "Points_File file way too large ( > {:g}mb )".format(
+                        max_size / (1024 * 1024)
                     )
-                    + "Reduce the number of points and try again."
                 )
-                raise ValidationError(error_msg)
+
+            rows = iter_point_rows(points_file.file, points_file.name)
 
             expected_header = ["POINT_LABEL", "DD_LAT", "DD_LON"]
-            recieved_header = [x for x in pts.pop(0) if x is not None]
+            recieved_header = [x for x in next(rows, None) or [] if x is not None]
 
             if not recieved_header == expected_header:
                 validation_errors.append(
@@ -1346,31 +1334,29 @@ class SpatialPointUploadForm(forms.Form):
                     )
                 )
 
-            if not len(pts):
-                raise ValidationError(
-                    "Points_File does not appear to contain any data!"
-                )
+            # the labels, coordinates and lake bounds of every row are
+            # checked in a single pass as the rows are read:
+            max_points = getattr(settings, "MAX_UPLOAD_POINTS", 50000)
+            validator = PointValidator(
+                self.lake_geom,
+                check_polygon=getattr(settings, "CHECK_POINTS_IN_LAKE", False),
+            )
+            geoPoints = list(validator.validate(islice(rows, max_points)))
 
-            empty_labels = [x for x in pts if x[0] == "" or x[0] is None]
-            if len(empty_labels):
-                validation_errors.append("At least one point is missing a label")
+            if next(rows, None) is not None:
+                rows.close()
+                error_msg = (
+                    "The points file contains more than {} points! ".format(max_points)
+                    + "Reduce the number of points and try again."
+                )
+                raise ValidationError(error_msg)
 
-            try:
-                geoPoints = [[x[0], Point(float(x[2]), float(x[1]))] for x in pts]
-            except (ValueError, TypeError, IndexError):
-                validation_errors.append(
-                    "At least one point has an invalid latitude or longitude."
+            if not validator.count:
+                raise ValidationError(
+                    "Points_File does not appear to contain any data!"
                 )
 
-            if geoPoints and self.lake_geom:
-                envelope = self.lake_geom.envelope
-                out_of_bounds = [x for x in geoPoints if not envelope.contains(x[1])]
-                if len(out_of_bounds):
-                    msg = """{} of the supplied points are not within the bounds of the lake
-                    associated with this project.""".format(
-                        len(out_of_bounds)
-                    )
-                    validation_errors.append(msg)
+            validation_errors.extend(validator.errors)
 
             if len(validation_errors):
                 raise ValidationError(" ".join(validation_errors))
@@ -1382,18 +1368,12 @@ class SpatialPointUploadForm(forms.Form):
     def save(self):
         """when we save the form - we need to create a bunch of project sample
         points, and either append them to our project or replace the
-        existing ones.
+        existing ones.  The points are copied into the database in
+        chunks rather than building a SamplePoint for each of them.
 
         """
-        sample_points = []
-        project = self.project
-        for pt in self.cleaned_data["points_file"]:
-            sample_points.append(SamplePoint(project=project, label=pt[0], geom=pt[1]))
-
-        if self.cleaned_data["replace"] == "replace":
-            SamplePoint.objects.filter(project=project).delete()
-
-        SamplePoint.objects.bulk_create(sample_points)
-
-        project.update_multipoints()
-        project.update_convex_hull()
+        insert_sample_points(
+            self.project,
+            self.cleaned_data["points_file"],
+            replace=self.cleaned_data["replace"] == "replace",
+        )
@@ -0,0 +1,61 @@
+"""=============================================================
+ ~/pjtk2/management/commands/check_project_status.py
+
+ DESCRIPTION:
+
+  Project.status is used to decide if a project is submitted, ongoing,
+  complete or cancelled without looking at its milestones.  This
+  command compares the status of every project to its cancelled flag
+  and its approved and sign off milestones and reports any projects
+  that do not agree.  If --fix is included, the status of those
+  projects is updated to match their milestones.  The status of the
+  existing projects was synced by migration 0014 - this command is
+  only needed if the milestones are changed without the status (e.g.
+  by hand in the database).
+
+  python manage.py check_project_status
+  python manage.py check_project_status --fix
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.core.management.base import BaseCommand
+
+from pjtk2.models import Project
+
+
+class Command(BaseCommand):
+    help = "Compare the status of each project to its milestones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Update the status of projects that do not match their milestones.",
+        )
+
+    def handle(self, *args, **options):
+
+        if options["fix"]:
+            drift = Project.sync_status()
+        else:
+            drift = Project.get_status_drift()
+
+        for project in drift:
+            self.stdout.write(
+                "{prj_cd}: status is '{status}' but should be '{expected_status}'".format(
+                    **project
+                )
+            )
+
+        if not drift:
+            msg = "The status of every project matches its milestones."
+        elif options["fix"]:
+            msg = "Updated the status of {} projects.".format(len(drift))
+        else:
+            msg = "{} projects need to be updated - re-run with --fix.".format(
+                len(drift)
+            )
+        self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,102 @@
+"""=============================================================
+ ~/pjtk2/management/commands/load_sample_points.py
+
+ DESCRIPTION:
+
+  Load the sample points for a project from a csv or xlsx file that
+  is too large to upload through the web form.  The file must have
+  the same POINT_LABEL, DD_LAT, DD_LON header as the uploaded files.
+  The rows are validated as they are read and copied into the
+  database in chunks, so the size of the file does not affect the
+  amount of memory used.  If any of the rows are invalid, nothing is
+  saved and the problems are reported.
+
+  python manage.py load_sample_points LHA_IA12_123 points.csv
+  python manage.py load_sample_points LHA_IA12_123 points.xlsx --replace
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from pjtk2.models import Project
+from pjtk2.utils.point_ingestion import (
+    CHUNK_SIZE,
+    insert_sample_points,
+    iter_point_rows,
+)
+from pjtk2.utils.point_validation import PointValidator, get_project_lake
+
+
+class Command(BaseCommand):
+    help = "Load the sample points for a project from a csv or xlsx file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("prj_cd", help="Project code of the project.")
+        parser.add_argument("file", help="Path to the csv or xlsx file.")
+        parser.add_argument(
+            "--replace",
+            action="store_true",
+            help="Replace the existing points rather than appending to them.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of points to write with each COPY statement.",
+        )
+
+    def handle(self, *args, **options):
+
+        try:
+            project = Project.all_objects.select_related("lake").get(
+                prj_cd=options["prj_cd"]
+            )
+        except Project.DoesNotExist:
+            raise CommandError("Project '{}' does not exist.".format(options["prj_cd"]))
+
+        lake = get_project_lake(project)
+        if lake is None:
+            raise CommandError(
+                "Project '{}' is not associated with a lake - its points "
+                "can't be validated.".format(project.prj_cd)
+            )
+
+        validator = PointValidator(
+            lake.geom,
+            check_polygon=getattr(settings, "CHECK_POINTS_IN_LAKE", False),
+        )
+
+        with open(options["file"], "rb") as points_file:
+            rows = iter_point_rows(points_file, options["file"])
+
+            header = [x for x in next(rows, None) or [] if x is not None]
+            if header != ["POINT_LABEL", "DD_LAT", "DD_LON"]:
+                raise CommandError(
+                    "The header must contain the fields: 'POINT_LABEL', 'DD_LAT' "
+                    "and 'DD_LON'. The header is {}".format(
+                        ", ".join([f"'{x}'" for x in header])
+                    )
+                )
+
+            # the points are validated as they are inserted - if any of
+            # the rows are invalid, the transaction is rolled back.
+            with transaction.atomic():
+                inserted = insert_sample_points(
+                    project,
+                    validator.validate(rows),
+                    replace=options["replace"],
+                    chunk_size=options["chunk_size"],
+                )
+                if validator.errors:
+                    raise CommandError(" ".join(validator.errors))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Loaded {} sample points for {}.".format(inserted, project.prj_cd)
+            )
+        )
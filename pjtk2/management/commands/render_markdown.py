@@ -0,0 +1,66 @@
+"""=============================================================
+ ~/pjtk2/management/commands/render_markdown.py
+
+ DESCRIPTION:
+
+  Project.save() only converts the markdown in the abstract, comment
+  and risk fields to html when the markdown has changed.  If
+  LINK_PATTERNS or the markdown settings change, the html of existing
+  projects will be out of date - this command re-renders the html for
+  every project and saves it in batches without re-saving the rest of
+  the project.
+
+  python manage.py render_markdown
+  python manage.py render_markdown --batch-size 500
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.core.management.base import BaseCommand
+
+from pjtk2.models import Project
+
+
+class Command(BaseCommand):
+    help = "Re-render the html of the markdown fields of every project."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of projects to update in each statement.",
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options["batch_size"]
+        markdown_fields = [x for x, _ in Project.MARKDOWN_FIELDS]
+        html_fields = [x for _, x in Project.MARKDOWN_FIELDS]
+
+        projects = Project.all_objects.order_by("id").only(
+            "id", *(markdown_fields + html_fields)
+        )
+
+        batch = []
+        updated = 0
+        for project in projects.iterator(chunk_size=batch_size):
+            if project.render_markdown(force=True):
+                batch.append(project)
+            if len(batch) >= batch_size:
+                updated += self.save_batch(batch, html_fields)
+                batch = []
+        if batch:
+            updated += self.save_batch(batch, html_fields)
+
+        self.stdout.write(
+            self.style.SUCCESS("Re-rendered the markdown for {} projects.".format(updated))
+        )
+
+    def save_batch(self, projects, fields):
+        """Update the html fields of projects with a single statement and
+        return the number of projects updated."""
+        Project.all_objects.bulk_update(projects, fields)
+        return len(projects)
@@ -0,0 +1,48 @@
+"""=============================================================
+ ~/pjtk2/management/commands/send_queued_messages.py
+
+ DESCRIPTION:
+
+  If settings.DEFER_MESSAGE_DELIVERY is True, messages are queued in
+  the MessageJob table rather than being delivered to each recipient
+  when they are sent.  This command delivers the queued messages in
+  batches and removes their jobs.  It is intended to be run
+  periodically (e.g. from cron).  Jobs that are locked by another
+  instance of the command are skipped, so overlapping runs are safe.
+
+  python manage.py send_queued_messages
+  python manage.py send_queued_messages --batch-size 100
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.core.management.base import BaseCommand
+
+from pjtk2.models import MessageJob
+
+
+class Command(BaseCommand):
+    help = "Deliver messages that have been queued for their recipients."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of queued messages to deliver in each transaction.",
+        )
+
+    def handle(self, *args, **options):
+
+        delivered = 0
+        while True:
+            count = MessageJob.deliver_queued(options["batch_size"])
+            if not count:
+                break
+            delivered += count
+
+        self.stdout.write(
+            self.style.SUCCESS("Delivered {} queued messages.".format(delivered))
+        )
@@ -0,0 +1,48 @@
+"""=============================================================
+ ~/pjtk2/management/commands/update_search_vectors.py
+
+ DESCRIPTION:
+
+  A management command to (re)build the weighted full text search
+  vector (Project.content_search) for existing projects.  Projects are
+  updated in batches so that a single long running update statement
+  does not lock the whole project table.
+
+  python manage.py update_search_vectors
+  python manage.py update_search_vectors --batch-size 500
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.core.management.base import BaseCommand
+
+from pjtk2.models import Project
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search vectors for all projects."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of projects to update in each statement.",
+        )
+
+    def handle(self, *args, **options):
+
+        batch_size = options["batch_size"]
+        project_ids = list(
+            Project.all_objects.order_by("id").values_list("id", flat=True)
+        )
+
+        updated = 0
+        for i in range(0, len(project_ids), batch_size):
+            updated += Project.update_content_search(project_ids[i : i + batch_size])
+
+        self.stdout.write(
+            self.style.SUCCESS("Updated search vectors for {} projects.".format(updated))
+        )
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.12 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_milestone_status(project_milestones):
+    """A copy of pjtk2.utils.helpers.build_milestone_status as it was
+    when this migration was written - the status code of each
+    non-custom milestone keyed by milestone id, plus a single 'custom'
+    entry for each project."""
+
+    status = {}
+    custom = {}
+
+    for item in project_milestones:
+        project_id = item["project_id"]
+        project_status = status.setdefault(project_id, {})
+        if item["milestone__category"] == "Custom":
+            custom.setdefault(project_id, []).append(item)
+            continue
+        code = "R" if item["required"] else "N"
+        code += "D" if item["completed"] else "N"
+        project_status[str(item["milestone_id"])] = code
+
+    for project_id, project_status in status.items():
+        milestones = custom.get(project_id)
+        if not milestones:
+            project_status["custom"] = "NN"
+        elif all(x["completed"] is not None for x in milestones if x["required"]):
+            project_status["custom"] = "RD"
+        else:
+            project_status["custom"] = "RN"
+
+    return status
+
+
+def populate_milestone_status(apps, schema_editor):
+    """Build the status row for every existing project."""
+
+    ProjectMilestones = apps.get_model("pjtk2", "ProjectMilestones")
+    ProjectMilestoneStatus = apps.get_model("pjtk2", "ProjectMilestoneStatus")
+
+    project_milestones = ProjectMilestones.objects.values(
+        "project_id", "milestone_id", "milestone__category", "required", "completed"
+    ).iterator()
+    status = build_milestone_status(project_milestones)
+
+    ProjectMilestoneStatus.objects.bulk_create(
+        [
+            ProjectMilestoneStatus(project_id=project_id, status=project_status)
+            for project_id, project_status in status.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pjtk2', '0008_make_projectimage_alt_text_required'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMilestoneStatus',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('status', models.JSONField(default=dict)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='milestone_status', to='pjtk2.project')),
+            ],
+            options={
+                'verbose_name_plural': 'Project Milestone Status',
+            },
+        ),
+        migrations.RunPython(populate_milestone_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.12 on 2026-10-18 11:40
+
+from django.db import migrations
+
+# A copy of Project.update_content_search() as it was when this
+# migration was written - the project code and name carry the most
+# weight, followed by the tags and abstract and finally the comment.
+REBUILD_SEARCH_VECTORS = """
+UPDATE pjtk2_project AS project SET content_search =
+  setweight(to_tsvector('simple', COALESCE(project.prj_cd, '')), 'A') ||
+  setweight(to_tsvector('english', COALESCE(project.prj_nm, '')), 'A') ||
+  setweight(to_tsvector('english', COALESCE((
+    SELECT string_agg(tag.name, ' ')
+    FROM taggit_taggeditem AS tagged
+      JOIN taggit_tag AS tag ON tag.id = tagged.tag_id
+      JOIN django_content_type AS ct ON ct.id = tagged.content_type_id
+    WHERE tagged.object_id = project.id
+      AND ct.app_label = 'pjtk2' AND ct.model = 'project'
+  ), '')), 'B') ||
+  setweight(to_tsvector('english', COALESCE(project.abstract, '')), 'B') ||
+  setweight(to_tsvector('english', COALESCE(project.comment, '')), 'C');
+"""
+
+
+class Migration(migrations.Migration):
+    """The trigger added in 0002 rebuilt content_search from the abstract,
+    comment and project name whenever a project was updated - including
+    updates of content_search itself.  The weighted vector (which also
+    includes the project code and tags) is now maintained by
+    Project.update_content_search(), so the trigger has to go or it would
+    overwrite it.  The vectors of the existing projects are rebuilt with
+    the new weights once the trigger is gone.  (The
+    update_search_vectors management command rebuilds them in batches
+    if they ever need to be rebuilt again.)
+    """
+
+    dependencies = [
+        ('pjtk2', '0009_projectmilestonestatus'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0003_taggeditem_add_unique_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            DROP TRIGGER IF EXISTS project_update_trigger
+            ON pjtk2_project;
+            """,
+            reverse_sql="""
+            CREATE TRIGGER project_update_trigger
+            BEFORE INSERT OR UPDATE OF abstract, comment, prj_nm, content_search
+            ON pjtk2_project
+            FOR EACH ROW EXECUTE PROCEDURE
+            tsvector_update_trigger(
+              content_search, 'pg_catalog.english', abstract, comment, prj_nm);
+            """,
+        ),
+        migrations.RunSQL(
+            sql=REBUILD_SEARCH_VECTORS, reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.12 on 2026-10-18 14:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pjtk2', '0010_drop_fulltextsearch_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('recipients', models.JSONField(default=list)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pjtk2.message')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
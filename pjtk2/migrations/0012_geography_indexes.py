@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:02
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+import pjtk2.utils.geography
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pjtk2', '0011_messagejob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectmultipoints',
+            index=django.contrib.postgres.indexes.GistIndex(pjtk2.utils.geography.Geography('geom'), name='pjtk2_multipoints_geog_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='samplepoint',
+            index=django.contrib.postgres.indexes.GistIndex(pjtk2.utils.geography.Geography('geom'), name='pjtk2_samplepoint_geog_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.12 on 2026-10-18 16:40
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pjtk2', '0012_geography_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectpolygon',
+            name='geom_low',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='projectpolygon',
+            name='geom_medium',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, null=True, srid=4326),
+        ),
+        # simplify the existing polygons - the same tolerances as
+        # ProjectPolygon.RESOLUTIONS:
+        migrations.RunSQL(
+            sql="""
+            UPDATE pjtk2_projectpolygon SET
+              geom_medium = ST_SimplifyPreserveTopology(geom, 0.001),
+              geom_low = ST_SimplifyPreserveTopology(geom, 0.01);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.12 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def sync_project_status(apps, schema_editor):
+    """A copy of Project.sync_status() as it was when this migration was
+    written - set the status column of every project (active or not)
+    from its cancelled flag and its approved and sign off milestones.
+    Before 0014, the status was not updated by every view that changed
+    those milestones, so existing rows can not be trusted."""
+
+    Project = apps.get_model("pjtk2", "Project")
+    ProjectMilestones = apps.get_model("pjtk2", "ProjectMilestones")
+
+    completed = ProjectMilestones.objects.filter(
+        project=models.OuterRef("pk"), completed__isnull=False
+    )
+    expected_status = models.Case(
+        models.When(cancelled=True, then=models.Value("cancelled")),
+        models.When(
+            models.Exists(completed.filter(milestone__label__iexact="Sign Off")),
+            then=models.Value("complete"),
+        ),
+        models.When(
+            models.Exists(completed.filter(milestone__label="Approved")),
+            then=models.Value("ongoing"),
+        ),
+        default=models.Value("submitted"),
+        output_field=models.CharField(),
+    )
+
+    drift = (
+        Project.objects.annotate(expected_status=expected_status)
+        .exclude(status=models.F("expected_status"))
+        .values_list("id", "expected_status")
+    )
+
+    new_status = {}
+    for project_id, status in drift:
+        new_status.setdefault(status, []).append(project_id)
+    for status, ids in new_status.items():
+        Project.objects.filter(pk__in=ids).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pjtk2", "0013_projectpolygon_simplified"),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_project_status, migrations.RunPython.noop),
+    ]
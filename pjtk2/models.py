@@ -5,7 +5,10 @@
 # from collections import OrderedDict
 import collections
 import datetime
+import json
 import os
+import threading
+import time
 
 import pytz
 from common.models import Lake
@@ -14,20 +17,38 @@ from django.contrib.auth import get_user_model
 from django.contrib.gis.db import models
 from django.contrib.gis.db.models import Collect, Union
 from django.contrib.gis.geos import MultiPoint
-from django.contrib.postgres.indexes import GinIndex
-from django.contrib.postgres.search import SearchVectorField
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
 from django.template.defaultfilters import slugify
 from django.urls import reverse
 from markdown2 import markdown
 from taggit.managers import TaggableManager
 
-from .utils.helpers import get_supervisors, replace_links, strip_carriage_returns
+from .utils.geography import Geography
+from .utils.helpers import (
+    LinkRewriter,
+    build_milestone_status,
+    clear_employee_hierarchy_cache,
+    get_supervisors,
+    strip_carriage_returns,
+)
 
 User = get_user_model()
 
 LINK_PATTERNS = getattr(settings, "LINK_PATTERNS", None)
+# compiled once and used whenever project markdown is rendered:
+LINK_REWRITER = LinkRewriter(LINK_PATTERNS)
 # for markdown2 (<h1> becomes <h3>)
 DEMOTE_HEADERS = 2
 
@@ -43,37 +64,38 @@ class ProjectsManager(models.Manager):
     def submitted(self):
         """return a queryset containing only those projects that have been
         submitted, but have not yet been approved or completed.
+
+        These methods all use the status column (which is kept in sync
+        with the approved and sign off milestones, and was backfilled
+        for existing projects by migration 0014) rather than joining to
+        the project milestones.
+
+        Cancelled projects that were never approved or signed off are
+        included - their status is 'cancelled', so their milestones are
+        checked with two (correlated) subqueries.
         """
-        return (
-            self.prefetch_related("projectmilestones__milestone")
-            .filter(
-                active=True,
-                projectmilestones__milestone__label="Approved",
-                projectmilestones__completed__isnull=True,
-            )
-            .filter(
-                projectmilestones__milestone__label="Sign off",
-                projectmilestones__completed__isnull=True,
+
+        def incomplete(label):
+            return models.Exists(
+                ProjectMilestones.objects.filter(
+                    project=models.OuterRef("pk"),
+                    milestone__label=label,
+                    completed__isnull=True,
+                )
             )
+
+        cancelled = (
+            models.Q(status="cancelled")
+            & incomplete("Approved")
+            & incomplete("Sign off")
         )
+        return self.filter(models.Q(status="submitted") | cancelled, active=True)
 
     def approved(self):
         """return a queryset containing only those projects that have been
         approved, but have not been completed or cancelled.
         """
-        return (
-            self.prefetch_related("projectmilestones__milestone")
-            .filter(
-                active=True,
-                cancelled=False,
-                projectmilestones__milestone__label="Approved",
-                projectmilestones__completed__isnull=False,
-            )
-            .filter(
-                projectmilestones__milestone__label="Sign off",
-                projectmilestones__completed__isnull=True,
-            )
-        )
+        return self.filter(active=True, cancelled=False, status="ongoing")
 
     def cancelled(self):
         """return a queryset containing only those projects that have been
@@ -85,19 +107,7 @@ class ProjectsManager(models.Manager):
         """return a queryset containing only those projects that have been
         both approved and completed but not cancelled.
         """
-        return (
-            self.prefetch_related("projectmilestones__milestone")
-            .filter(
-                active=True,
-                cancelled=False,
-                projectmilestones__milestone__label="Approved",
-                projectmilestones__completed__isnull=False,
-            )
-            .filter(
-                projectmilestones__milestone__label="Sign off",
-                projectmilestones__completed__isnull=False,
-            )
-        )
+        return self.filter(active=True, cancelled=False, status="complete")
 
 
 class ProjectsThisYear(models.Manager):
@@ -171,6 +181,85 @@ class Messages2UsersManager(models.Manager):
         )
 
 
+class ProjectMilestonesManager(models.Manager):
+    """Adds a bulk transition method to the default manager for project
+    milestones."""
+
+    def transition(self, ids, completed):
+        """Mark the project milestones in ids as completed (if completed is
+        a datetime) or not completed (if completed is None).  A
+        shortcut for transition_many() when all of the milestones are
+        changed the same way.  The list of changed project milestones
+        is returned.
+
+        Arguments:
+        - `ids`: an iterable of project milestone ids
+        - `completed`: the completed datetime or None
+
+        """
+
+        if completed is None:
+            return self.transition_many(cleared=ids)[1]
+        return self.transition_many(completed=ids, timestamp=completed)[0]
+
+    def transition_many(self, completed=(), cleared=(), timestamp=None):
+        """Mark the project milestones in completed as completed (at
+        timestamp, or now) and clear the completed date of those in
+        cleared.  Project milestones that are already in the requested
+        state are left alone.  Both sets of changes are applied in a
+        single transaction, with one update statement each.
+
+        The pre_save and post_save signals are not sent.  Instead, the
+        milestone status of each affected project is refreshed, the
+        status column is synced, and milestones_transitioned is sent
+        once with all of the changed project milestones so that the
+        recipients are found once per project and the notifications
+        are sent as a single batch.  Returns a tuple containing the
+        lists of completed and cleared project milestones.
+
+        Arguments:
+        - `completed`: an iterable of project milestone ids to complete
+        - `cleared`: an iterable of project milestone ids to clear
+        - `timestamp`: the completed datetime (defaults to now)
+
+        """
+
+        if timestamp is None:
+            timestamp = datetime.datetime.now(pytz.utc)
+        related = ("project", "project__owner", "project__dba", "milestone")
+
+        with transaction.atomic():
+            # only the milestones that are not already in the requested state:
+            done = list(
+                self.filter(id__in=completed, completed__isnull=True).select_related(
+                    *related
+                )
+            )
+            undone = list(
+                self.filter(id__in=cleared, completed__isnull=False).select_related(
+                    *related
+                )
+            )
+            if not (done or undone):
+                return [], []
+
+            if done:
+                self.filter(id__in=[x.id for x in done]).update(completed=timestamp)
+            if undone:
+                self.filter(id__in=[x.id for x in undone]).update(completed=None)
+            project_ids = {x.project_id for x in done + undone}
+            ProjectMilestoneStatus.refresh(project_ids)
+            Project.sync_status(project_ids)
+
+        for prjms in done:
+            prjms.completed = timestamp
+        for prjms in undone:
+            prjms.completed = None
+
+        milestones_transitioned.send(sender=self.model, project_milestones=done + undone)
+        return done, undone
+
+
 class Milestone(models.Model):
     """
     Look-up table of reporting milestone and their attributes.  Not all
@@ -213,6 +302,113 @@ class Milestone(models.Model):
         return self.label
 
 
+MILESTONE_REGISTRY_VERSION_KEY = "pjtk2_milestone_registry_version"
+
+
+class MilestoneRegistry(object):
+    """
+    A process level catalogue of milestones.  The milestone table is
+    small and rarely changes, but it is needed to build almost every
+    page - rather than querying it again and again, all of the
+    milestones are loaded with a single query the first time they are
+    needed and kept until a milestone is saved or deleted, or until
+    they are older than MILESTONE_REGISTRY_TIMEOUT seconds.
+
+    A version number stored in the cache is incremented whenever a
+    milestone changes.  If the cache is shared (e.g. memcached or
+    redis), other processes reload their copy right away - with the
+    default (per-process) cache, changes made in another process are
+    picked up when the timeout expires.  A milestone that isn't in the
+    registry is always looked up in the database before giving up.
+
+    The milestones returned by the registry are shared - treat them as
+    read only.
+
+    """
+
+    def __init__(self):
+        self._milestones = None
+        self._version = None
+        self._loaded = None
+
+    def _expired(self):
+        """Have the milestones been kept longer than the timeout?"""
+        timeout = getattr(settings, "MILESTONE_REGISTRY_TIMEOUT", 60)
+        if timeout is None:
+            return False
+        return time.monotonic() - self._loaded >= timeout
+
+    def _load(self, reload=False):
+        """Return the list of all milestones (including 'Submitted')
+        ordered by their order attribute, loading them if they haven't
+        been loaded yet, have changed or have expired."""
+
+        version = cache.get_or_set(MILESTONE_REGISTRY_VERSION_KEY, 1, None)
+        if (
+            reload
+            or self._milestones is None
+            or version != self._version
+            or self._expired()
+        ):
+            milestones = list(Milestone.allmilestones.order_by("order", "id"))
+            self._by_id = {x.id: x for x in milestones}
+            self._by_label = {x.label.lower(): x for x in milestones}
+            self._milestones = milestones
+            self._version = version
+            self._loaded = time.monotonic()
+        return self._milestones
+
+    def clear(self):
+        """Forget the milestones - they will be reloaded the next time
+        they are needed."""
+
+        self._milestones = None
+        try:
+            cache.incr(MILESTONE_REGISTRY_VERSION_KEY)
+        except ValueError:
+            cache.set(MILESTONE_REGISTRY_VERSION_KEY, 1, None)
+
+    def _find(self, label=None, id=None):
+        if id is not None:
+            return self._by_id.get(int(id))
+        return self._by_label.get(label.lower())
+
+    def get(self, label=None, id=None):
+        """Return the milestone with the given label (case insensitive)
+        or id.  If it isn't in the registry (e.g. - it was created by
+        another process), the milestones are reloaded from the
+        database.  Raises Milestone.DoesNotExist if there still isn't
+        one."""
+
+        self._load()
+        milestone = self._find(label, id)
+        if milestone is None:
+            self._load(reload=True)
+            milestone = self._find(label, id)
+        if milestone is None:
+            raise Milestone.DoesNotExist(
+                "Milestone matching label={} id={} does not exist.".format(label, id)
+            )
+        return milestone
+
+    def filter(self, category=None, report=None, exclude=("Submitted",)):
+        """Return a list of the milestones in the given category (and/or
+        that are or are not reports) ordered by their order attribute.
+        Like Milestone.objects, 'Submitted' is excluded by default -
+        exclude is a list of labels to leave out."""
+
+        return [
+            x
+            for x in self._load()
+            if (category is None or x.category == category)
+            and (report is None or x.report == report)
+            and x.label not in exclude
+        ]
+
+
+milestone_registry = MilestoneRegistry()
+
+
 class ProjectType(models.Model):
     """A look-up table to hold project type and attributes of those
     project types. For example - is the project type dependent or
@@ -449,6 +645,13 @@ class Project(models.Model):
     last_year = ProjectsLastYear()
     this_year = ProjectsThisYear()
 
+    # the fields containing markdown and the fields their html is saved in:
+    MARKDOWN_FIELDS = (
+        ("abstract", "abstract_html"),
+        ("comment", "comment_html"),
+        ("risk", "risk_html"),
+    )
+
     class Meta:
         ordering = ["-prj_date1"]
         indexes = [GinIndex(fields=["content_search"])]
@@ -468,34 +671,89 @@ class Project(models.Model):
             self.year = "20" + yr if int(yr) < 50 else "19" + yr
             new = True
 
-        if self.abstract:
-            self.abstract = strip_carriage_returns(self.abstract)
-            self.abstract_html = markdown(
-                self.abstract, extras={"demote-headers": DEMOTE_HEADERS}
-            )
-            self.abstract_html = replace_links(
-                self.abstract_html, link_patterns=LINK_PATTERNS
-            )
+        # only re-render the markdown if it could have changed:
+        update_fields = kwargs.get("update_fields")
+        markdown_fields = {x for x, _ in self.MARKDOWN_FIELDS}
+        if update_fields is None:
+            self.render_markdown()
+        elif markdown_fields.intersection(update_fields):
+            rendered = self.render_markdown()
+            kwargs["update_fields"] = set(update_fields).union(rendered)
 
-        if self.comment:
-            self.comment = strip_carriage_returns(self.comment)
-            self.comment_html = markdown(
-                self.comment, extras={"demote-headers": DEMOTE_HEADERS}
-            )
-            self.comment_html = replace_links(
-                self.comment_html, link_patterns=LINK_PATTERNS
-            )
-
-        if self.risk:
-            self.risk = strip_carriage_returns(self.risk)
-            self.risk_html = markdown(
-                self.risk, extras={"demote-headers": DEMOTE_HEADERS}
-            )
-            self.risk_html = replace_links(self.risk_html, link_patterns=LINK_PATTERNS)
+        self.clear_status_cache()
         super(Project, self).save(*args, **kwargs)
+        self._remember_markdown()
         if new:
             self.initialize_milestones()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Project, cls).from_db(db, field_names, values)
+        instance._remember_markdown()
+        return instance
+
+    def _remember_markdown(self, fields=None):
+        """Keep a copy of the markdown fields as they were loaded from
+        (or saved to) the database so that save() can tell if they have
+        changed.  If fields is provided, only those fields were
+        reloaded - the copies of the others are kept."""
+        deferred = self.get_deferred_fields()
+        saved = {} if fields is None else getattr(self, "_saved_markdown", {})
+        for field, _ in self.MARKDOWN_FIELDS:
+            if field in deferred or (fields is not None and field not in fields):
+                continue
+            saved[field] = getattr(self, field)
+        self._saved_markdown = saved
+
+    def render_markdown(self, force=False):
+        """Convert the markdown in abstract, comment and risk to html (with
+        our link patterns applied).  Fields that have not changed since
+        they were loaded from the database are skipped unless force is
+        True (their markdown is rendered again but left as it is).
+        Returns a list of the html fields that were updated.
+        """
+
+        saved = getattr(self, "_saved_markdown", {})
+        deferred = self.get_deferred_fields()
+        rendered = []
+        for field, html_field in self.MARKDOWN_FIELDS:
+            if field in deferred:
+                continue
+            text = getattr(self, field)
+            if not text:
+                continue
+            changed = field not in saved or saved[field] != text
+            if not (changed or force):
+                continue
+            if changed:
+                text = strip_carriage_returns(text)
+                setattr(self, field, text)
+            html = markdown(text, extras={"demote-headers": DEMOTE_HEADERS})
+            setattr(self, html_field, LINK_REWRITER.rewrite(html))
+            rendered.append(html_field)
+        return rendered
+
+    def refresh_from_db(self, using=None, fields=None):
+        self.clear_status_cache()
+        super(Project, self).refresh_from_db(using=using, fields=fields)
+        self._remember_markdown(fields)
+
+    def clear_status_cache(self):
+        """Forget any status predicates (is_approved(), is_complete(),
+        can_edit()) that have been evaluated for this project instance.
+        Called whenever the project is saved or its milestones are
+        changed by one of the helper methods below."""
+        self._status_cache = {}
+
+    def get_status_cache(self):
+        """Return the dictionary used to remember the status predicates
+        for this instance.  Project instances are created for each
+        request, so each predicate is evaluated at most once per request
+        no matter how many times the views and templates ask for it."""
+        if getattr(self, "_status_cache", None) is None:
+            self._status_cache = {}
+        return self._status_cache
+
     # @models.permalink
     def get_absolute_url(self):
         """
@@ -505,6 +763,41 @@ class Project(models.Model):
         url = reverse("project_detail", kwargs={"slug": self.slug})
         return url
 
+    @classmethod
+    def update_content_search(cls, project_ids=None):
+        """Rebuild the full text search vector for the projects with
+        the given ids (or all projects if project_ids is None).  The
+        project code and name carry the most weight, followed by the
+        tags and abstract and finally the comment.  The vector is
+        calculated by the database in a single update statement and
+        the number of projects updated is returned.
+        """
+
+        tags = (
+            cls.tags.through.objects.filter(
+                object_id=models.OuterRef("pk"),
+                content_type__app_label=cls._meta.app_label,
+                content_type__model=cls._meta.model_name,
+            )
+            .order_by()
+            .values("object_id")
+            .annotate(names=StringAgg("tag__name", " "))
+            .values("names")
+        )
+
+        vector = (
+            SearchVector("prj_cd", config="simple", weight="A")
+            + SearchVector("prj_nm", config="english", weight="A")
+            + SearchVector(models.Subquery(tags), config="english", weight="B")
+            + SearchVector("abstract", config="english", weight="B")
+            + SearchVector("comment", config="english", weight="C")
+        )
+
+        projects = cls.all_objects.all()
+        if project_ids is not None:
+            projects = projects.filter(pk__in=project_ids)
+        return projects.update(content_search=vector)
+
     def approve(self):
         """
         a helper method to make approving projects easier.  A
@@ -513,7 +806,7 @@ class Project(models.Model):
         """
         now = datetime.datetime.now(pytz.utc)
 
-        milestone = Milestone.objects.get(label="Approved")
+        milestone = milestone_registry.get("Approved")
         projectmilestone, created = ProjectMilestones.objects.get_or_create(
             project=self, milestone=milestone, required=True
         )
@@ -523,7 +816,7 @@ class Project(models.Model):
         projectmilestone.save()
 
         self.status = "ongoing"
-        self.save()
+        self.save(update_fields=["status"])
 
     def unapprove(self):
         """
@@ -540,7 +833,7 @@ class Project(models.Model):
         except ProjectMilestones.DoesNotExist:
             pass
         self.status = "submitted"
-        self.save()
+        self.save(update_fields=["status"])
 
     def cancel(self, user):
         """
@@ -550,7 +843,7 @@ class Project(models.Model):
         """
         now = datetime.datetime.now(pytz.utc)
 
-        milestone = Milestone.objects.get(label="Cancelled")
+        milestone = milestone_registry.get("Cancelled")
         projectmilestone, created = ProjectMilestones.objects.get_or_create(
             project=self, milestone=milestone, required=True
         )
@@ -562,7 +855,7 @@ class Project(models.Model):
         self.status = "cancelled"
         self.cancelled = True
         self.cancelled_by = user
-        self.save()
+        self.save(update_fields=["status", "cancelled", "cancelled_by"])
 
     def uncancel(self):
         """
@@ -581,22 +874,34 @@ class Project(models.Model):
         self.status = "ongoing"
         self.cancelled = False
         self.cancelled_by = None
-        self.save()
+        self.save(update_fields=["status", "cancelled", "cancelled_by"])
 
     def is_approved(self):
         """Is the current project approved?  Returns true if it is, otherwise
-        false."""
-        approved = ProjectMilestones.objects.filter(
-            project=self, milestone__label="Approved"
-        ).first()
-        if approved is None:
-            return False
+        false.
 
-        if approved.completed is not None:
+        Ongoing and completed projects have been approved, submitted
+        projects have not.  The status of cancelled projects doesn't
+        tell us if they were approved before they were cancelled, so
+        the approved milestone is checked for them.
+        """
+        if self.status in ("ongoing", "complete"):
             return True
-        else:
+        if self.status != "cancelled":
             return False
 
+        status_cache = self.get_status_cache()
+        if "approved" in status_cache:
+            return status_cache["approved"]
+
+        approved = ProjectMilestones.objects.filter(
+            project=self, milestone__label="Approved"
+        ).first()
+        status_cache["approved"] = approved is not None and (
+            approved.completed is not None
+        )
+        return status_cache["approved"]
+
     def signoff(self, user):
         """A helper function to make it easier to sign off a project"""
         # TODO - add logic here to make sure all previous requirements
@@ -604,7 +909,7 @@ class Project(models.Model):
         # approved or completed.
 
         now = datetime.datetime.now(pytz.utc)
-        milestone = Milestone.objects.get(label__iexact="Sign Off")
+        milestone = milestone_registry.get("Sign Off")
         prjms, created = ProjectMilestones.objects.get_or_create(
             project=self, milestone=milestone
         )
@@ -613,36 +918,27 @@ class Project(models.Model):
 
         self.signoff_by = user
         self.status = "complete"
-        self.save()
+        self.save(update_fields=["status", "signoff_by"])
 
     def reopen(self):
         """A helper function to reopen a project.  This does not keep track of
         whether or not the project had been previously closed or how many
         times it has been closed or re-activated."""
 
-        milestone = Milestone.objects.get(label__iexact="Sign Off")
+        milestone = milestone_registry.get("Sign Off")
         prjms, created = ProjectMilestones.objects.get_or_create(
             project=self, milestone=milestone
         )
         prjms.completed = None
-        self.status = "ongoing"
         prjms.save()
+        self.status = "ongoing"
+        self.save(update_fields=["status"])
 
     def is_complete(self):
         """Is the current project completed (ie. signoff=True)?  Returns true
         if it is, otherwise false.
         """
-        try:
-            completed = ProjectMilestones.objects.get(
-                project=self, milestone__label__iexact="Sign Off"
-            )
-        except ProjectMilestones.DoesNotExist:
-            return False
-
-        if completed.completed is not None:
-            return True
-        else:
-            return False
+        return self.status == "complete"
 
     def _get_status(self):
         """
@@ -660,12 +956,64 @@ class Project(models.Model):
 
         if self.cancelled:
             return "Cancelled"
-        elif self.is_complete():
-            return "Complete"
-        elif not self.is_approved():
-            return "Submitted"
-        else:
-            return "Ongoing"
+        return self.get_status_display()
+
+    @classmethod
+    def get_status_drift(cls, project_ids=None):
+        """Compare the status column of each project to the status implied
+        by its cancelled flag and its approved and sign off milestones.
+        Returns a list of dictionaries (id, prj_cd, status and
+        expected_status) for the projects that do not agree.  The
+        comparison is done by the database in a single query.
+
+        Arguments:
+        - `project_ids`: only check these projects (all projects if None)
+        """
+
+        completed = ProjectMilestones.objects.filter(
+            project=models.OuterRef("pk"), completed__isnull=False
+        )
+        expected_status = models.Case(
+            models.When(cancelled=True, then=models.Value("cancelled")),
+            models.When(
+                models.Exists(completed.filter(milestone__label__iexact="Sign Off")),
+                then=models.Value("complete"),
+            ),
+            models.When(
+                models.Exists(completed.filter(milestone__label="Approved")),
+                then=models.Value("ongoing"),
+            ),
+            default=models.Value("submitted"),
+            output_field=models.CharField(),
+        )
+
+        projects = cls.all_objects.all()
+        if project_ids is not None:
+            projects = projects.filter(pk__in=project_ids)
+
+        return list(
+            projects.annotate(expected_status=expected_status)
+            .exclude(status=models.F("expected_status"))
+            .order_by("prj_cd")
+            .values("id", "prj_cd", "status", "expected_status")
+        )
+
+    @classmethod
+    def sync_status(cls, project_ids=None):
+        """Update the status column of any project that does not agree
+        with its milestones (see get_status_drift()).  Projects are
+        updated with one statement per status and the list of projects
+        that were changed is returned."""
+
+        drift = cls.get_status_drift(project_ids)
+
+        new_status = collections.defaultdict(list)
+        for project in drift:
+            new_status[project["expected_status"]].append(project["id"])
+        for status, ids in new_status.items():
+            cls.all_objects.filter(pk__in=ids).update(status=status)
+
+        return drift
 
     def project_suffix(self):
         """
@@ -782,75 +1130,82 @@ class Project(models.Model):
         the ordered dictionary and reflects the status of all required
         additional reporting requirements.
 
+        Use get_milestone_status_dicts() if the status of more than
+        one project is needed.
+
         """
 
-        milestone_status = collections.OrderedDict()
+        return Project.get_milestone_status_dicts([self])[self.id]
+
+    @classmethod
+    def get_milestone_status_dicts(cls, projects):
+        """
+        The bulk equivalent of get_milestone_status_dict() - return a
+        dictionary containing the milestone status dictionary of each of
+        the projects (a list or queryset) keyed by project id.  The
+        project milestones of all of the projects are retrieved with a
+        single query, so tables of projects and their milestones don't
+        need three queries for each row.
+
+        """
+
+        project_ids = [x.id for x in projects]
 
         # we need to instantiate an order dictionary that has all of
         # the milestone keys - ensures that they are reported for every
         # project (and in the same order) - without this, some of our
         # rows will have different lengths.
+        core_milestones = milestone_registry.filter(category="Core")
+        statuses = {}
+        for project_id in project_ids:
+            milestone_status = collections.OrderedDict()
+            for ms in core_milestones:
+                key = ms.label_abbrev.lower().replace(" ", "-")
+                milestone_status[key] = {
+                    "status": None,
+                    "type": "report" if ms.report else "milestone",
+                }
+            statuses[project_id] = milestone_status
 
-        all_milestones = (
-            Milestone.objects.filter(category="Core").order_by("order").all()
-        )
-        for ms in all_milestones:
-            key = ms.label_abbrev.lower().replace(" ", "-")
-            milestone_status[key] = {
-                "status": None,
-                "type": "report" if ms.report else "milestone",
-            }
-
-        milestones = (
-            self.projectmilestones.filter(milestone__category="Core")
+        project_milestones = (
+            ProjectMilestones.objects.filter(project__in=project_ids)
             .exclude(milestone__label="Submitted")
             .select_related("milestone")
             .order_by("milestone__order")
-            .all()
         )
 
-        for ms in milestones:
+        custom = collections.defaultdict(list)
+        for ms in project_milestones:
+            if ms.milestone.category.lower() == "custom":
+                custom[ms.project_id].append(ms)
+                continue
+            if ms.milestone.category != "Core":
+                continue
             key = ms.milestone.label_abbrev.lower().replace(" ", "-")
             if ms.required:
-                value = {
-                    "status": ("required-done" if ms.completed else "required-notDone"),
-                    "type": "report" if ms.milestone.report else "milestone",
-                }
+                status = "required-done" if ms.completed else "required-notDone"
             else:
-                value = {
-                    "status": (
-                        "notRequired-done" if ms.completed else "notRequired-notDone"
-                    ),
-                    "type": "report" if ms.milestone.report else "milestone",
-                }
-
-            milestone_status[key] = value
+                status = "notRequired-done" if ms.completed else "notRequired-notDone"
+            statuses[ms.project_id][key] = {
+                "status": status,
+                "type": "report" if ms.milestone.report else "milestone",
+            }
 
         # finally for each project, we need to know if this project has any
         # custom reporting requirements and their status:
-        milestones = self.projectmilestones.select_related("milestone").filter(
-            milestone__category="custom"
-        )
-        if not milestones:
-            milestone_status["custom"] = {
-                "status": "notRequired-notDone",
-                "type": "report",
-            }
-        else:
-            # if the status of all custom milestones are complete then
-            # required-done else 'required-notDone'
-            done = [x.completed is not None for x in milestones if x.required == True]
-            if all(x == True for x in done):
-                milestone_status["custom"] = {
-                    "status": "required-done",
-                    "type": "report",
-                }
+        for project_id, milestone_status in statuses.items():
+            milestones = custom.get(project_id)
+            if not milestones:
+                status = "notRequired-notDone"
+            elif all(x.completed is not None for x in milestones if x.required):
+                # if the status of all custom milestones are complete then
+                # required-done else 'required-notDone'
+                status = "required-done"
             else:
-                milestone_status["custom"] = {
-                    "status": "required-notDone",
-                    "type": "report",
-                }
-        return milestone_status
+                status = "required-notDone"
+            milestone_status["custom"] = {"status": status, "type": "report"}
+
+        return statuses
 
     def get_custom_assignments(self):
         """get a list of any custom reports that have been assigned to
@@ -889,14 +1244,14 @@ class Project(models.Model):
         # TODO Filter for report=True
 
         # get a queryset of all reports we consider 'core'
-        milestones = Milestone.objects.filter(report=False)
-        corereports = Milestone.objects.filter(category="Core", report=True)
-        customreports = Milestone.objects.filter(category="Custom", report=True)
+        milestones = milestone_registry.filter(report=False)
+        corereports = milestone_registry.filter(category="Core", report=True)
+        customreports = milestone_registry.filter(category="Custom", report=True)
 
-        # we need to convert the querset to a tuple of tuples
-        milestones = tuple([(x[0], x[1]) for x in milestones.values_list()])
-        corereports = tuple([(x[0], x[1]) for x in corereports.values_list()])
-        customreports = tuple([(x[0], x[1]) for x in customreports.values_list()])
+        # we need to convert the milestones to a tuple of tuples
+        milestones = tuple([(x.id, x.label) for x in milestones])
+        corereports = tuple([(x.id, x.label) for x in corereports])
+        customreports = tuple([(x.id, x.label) for x in customreports])
 
         # get the milestones currently assigned to this project, if not return a
         # dictionary with all reports assigned
@@ -952,7 +1307,7 @@ class Project(models.Model):
         A function that will add a record into "ProjectMilestones" for
         each of the core reports and milestones for newly created projects"""
 
-        corereports = Milestone.allmilestones.filter(category="Core")
+        corereports = milestone_registry.filter(category="Core", exclude=())
         for report in corereports:
             if report.label == "Submitted":
                 now = datetime.datetime.now(pytz.utc)
@@ -1254,7 +1609,11 @@ class SamplePoint(models.Model):
     objects = models.Manager()
 
     class Meta:
-        indexes = [models.Index(fields=["project", "geom"])]
+        indexes = [
+            models.Index(fields=["project", "geom"]),
+            # used by ST_DWithin on geography (e.g. - buffered point filters)
+            GistIndex(Geography("geom"), name="pjtk2_samplepoint_geog_idx"),
+        ]
 
     @property
     def dd_lat(self):
@@ -1343,6 +1702,12 @@ class ProjectMultiPoints(models.Model):
 
     objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            # used by ST_DWithin on geography (e.g. - buffered point filters)
+            GistIndex(Geography("geom"), name="pjtk2_multipoints_geog_idx")
+        ]
+
     def __str__(self):
         """
         Return a string that include the project code
@@ -1366,6 +1731,19 @@ class ProjectPolygon(models.Model):
     )
     geom = models.PolygonField(srid=4326)
 
+    # simplified versions of the polygon for overview maps - created
+    # whenever the polygon is saved:
+    geom_medium = models.PolygonField(srid=4326, null=True, blank=True)
+    geom_low = models.PolygonField(srid=4326, null=True, blank=True)
+
+    # the field and simplification tolerance (in decimal degrees) used
+    # for each resolution:
+    RESOLUTIONS = {
+        "high": ("geom", None),
+        "medium": ("geom_medium", 0.001),
+        "low": ("geom_low", 0.01),
+    }
+
     objects = models.Manager()
 
     def __str__(self):
@@ -1374,6 +1752,26 @@ class ProjectPolygon(models.Model):
         """
         return "<{}>".format(self.project.prj_cd)
 
+    def save(self, *args, **kwargs):
+        self.simplify()
+        super(ProjectPolygon, self).save(*args, **kwargs)
+
+    def simplify(self):
+        """Update the simplified versions of the polygon.  Topology is
+        preserved (the same as ST_SimplifyPreserveTopology) so each of
+        them is still a valid polygon - if simplification doesn't
+        return a polygon, the full polygon is used instead."""
+
+        for field, tolerance in self.RESOLUTIONS.values():
+            if tolerance is None:
+                continue
+            simplified = None
+            if self.geom:
+                simplified = self.geom.simplify(tolerance, preserve_topology=True)
+                if simplified.geom_type != "Polygon" or simplified.empty:
+                    simplified = self.geom
+            setattr(self, field, simplified)
+
 
 class ProjectMilestones(models.Model):
     """
@@ -1393,6 +1791,8 @@ class ProjectMilestones(models.Model):
     required = models.BooleanField(default=True, db_index=True)
     completed = models.DateTimeField(blank=True, null=True, db_index=True)
 
+    objects = ProjectMilestonesManager()
+
     class Meta:
         # unique_together = ("project", "report_type",)
         unique_together = ("project", "milestone")
@@ -1403,6 +1803,101 @@ class ProjectMilestones(models.Model):
         return "%s - %s" % (self.project.prj_cd, self.milestone.label)
 
 
+class ProjectMilestoneStatus(models.Model):
+    """
+    A denormalized summary of the milestones associated with a
+    project - one row per project.  The status of each core milestone
+    is stored as a two letter code keyed by milestone id, along with a
+    single entry ('custom') that reflects the status of all of the
+    custom reporting requirements.  The rows are refreshed by the
+    ProjectMilestones signals so that the my_projects and
+    employee_projects views can be built from a single query rather
+    than pivoting every project milestone each time they are rendered.
+
+    """
+
+    STATUS_CODES = {
+        "RD": "required-done",
+        "RN": "required-notDone",
+        "ND": "notRequired-done",
+        "NN": "notRequired-notDone",
+    }
+
+    id = models.AutoField(primary_key=True)
+
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, related_name="milestone_status"
+    )
+    status = models.JSONField(default=dict)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Project Milestone Status"
+
+    def __str__(self):
+        """Return a string that include the project code"""
+        return "<{}>".format(self.project.prj_cd)
+
+    def get_code(self, milestone_id):
+        """Return the status code for the milestone or None if the
+        milestone has not been assigned to this project."""
+        return self.status.get(str(milestone_id))
+
+    def get_status(self, milestone_id):
+        """Return the status string (e.g. 'required-done') used by our
+        templates for the milestone with the given id."""
+        return self.STATUS_CODES.get(self.get_code(milestone_id), "notRequired-notDone")
+
+    def is_done(self, milestone_id):
+        """Return True if the milestone has been completed for this project."""
+        code = self.get_code(milestone_id)
+        return code is not None and code[1] == "D"
+
+    @classmethod
+    def refresh(cls, project_ids):
+        """Re-calculate the status rows for each of the projects in
+        project_ids using a single query of the project milestones.
+
+        The rows are upserted (INSERT ... ON CONFLICT) rather than
+        deleted and re-created, so two concurrent refreshes of the same
+        project can't both insert a row for it.  The rows of projects
+        that no longer have any milestones are deleted.
+        """
+
+        project_ids = set(project_ids)
+        if not project_ids:
+            return
+
+        project_milestones = ProjectMilestones.objects.filter(
+            project_id__in=project_ids
+        ).values(
+            "project_id", "milestone_id", "milestone__category", "required", "completed"
+        )
+        status = build_milestone_status(project_milestones)
+
+        with transaction.atomic():
+            empty = project_ids - set(status)
+            if empty:
+                cls.objects.filter(project_id__in=empty).delete()
+            if not status:
+                return
+
+            values = []
+            params = []
+            now = datetime.datetime.now(pytz.utc)
+            for project_id, project_status in status.items():
+                values.append("(%s, %s::jsonb, %s)")
+                params.extend([project_id, json.dumps(project_status), now])
+
+            sql = (
+                "INSERT INTO {table} (project_id, status, updated) VALUES {values} "
+                "ON CONFLICT (project_id) DO UPDATE SET "
+                "status = EXCLUDED.status, updated = EXCLUDED.updated"
+            ).format(table=cls._meta.db_table, values=", ".join(values))
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+
 class Report(models.Model):
     """
     A class for reports.  A single report can be linked to multiple
@@ -1652,6 +2147,53 @@ class Messages2Users(models.Model):
         self.save()
 
 
+class MessageJob(models.Model):
+    """A queued message that has not yet been delivered to its
+    recipients.  If settings.DEFER_MESSAGE_DELIVERY is True, messages
+    are created immediately but the Messages2Users records for each
+    recipient are created later by the send_queued_messages management
+    command so that saving a project milestone does not wait for them.
+    """
+
+    id = models.AutoField(primary_key=True)
+    message = models.ForeignKey(Message, on_delete=models.CASCADE)
+    # the ids of the users the message will be delivered to:
+    recipients = models.JSONField(default=list)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        """return the messsage and the number of recipients."""
+        return "%s (%s recipients)" % (self.message, len(self.recipients))
+
+    @classmethod
+    def deliver_queued(cls, batch_size=500):
+        """Deliver up to batch_size queued messages and delete their jobs.
+        Jobs locked by another worker are skipped.  Returns the number
+        of jobs that were delivered."""
+
+        with transaction.atomic():
+            jobs = list(
+                cls.objects.select_for_update(skip_locked=True).order_by("id")[
+                    :batch_size
+                ]
+            )
+            if not jobs:
+                return 0
+            Messages2Users.objects.bulk_create(
+                [
+                    Messages2Users(user_id=user_id, message_id=job.message_id)
+                    for job in jobs
+                    for user_id in job.recipients
+                ],
+                ignore_conflicts=True,
+            )
+            cls.objects.filter(id__in=[x.id for x in jobs]).delete()
+        return len(jobs)
+
+
 # =========================
 #   Message functions
 
@@ -1693,6 +2235,76 @@ def build_msg_recipients(project, level=None, dba=True, ops=True):
     return recipients
 
 
+def build_msg_recipients_by_project(projects, dba=True):
+    """The bulk equivalent of build_msg_recipients() - return a
+    dictionary containing the list of recipients for each project
+    keyed by project id.  The chain of supervisors is only resolved
+    once for each project owner and the watchers of all of the
+    projects are retrieved with a single query.  Owners that are not
+    employees are notified directly.
+
+    projects - a list of project instances
+    dba - should the dba of each project be notified too?
+    """
+
+    supervisors = {}
+    owner_ids = {x.owner_id for x in projects}
+    for employee in Employee.objects.filter(user__id__in=owner_ids):
+        supervisors[employee.user_id] = [x.user for x in get_supervisors(employee)]
+
+    watchers = collections.defaultdict(list)
+    bookmarks = Bookmark.objects.filter(project__in=projects).select_related("user")
+    for bookmark in bookmarks:
+        watchers[bookmark.project_id].append(bookmark.user)
+
+    recipients = {}
+    for project in projects:
+        users = supervisors.get(project.owner_id, [project.owner])
+        users = users + watchers[project.id]
+        if dba and project.dba is not None:
+            users.append(project.dba)
+        recipients[project.id] = list(set(users))
+    return recipients
+
+
+def deliver_messages(distribution):
+    """Send each message to its recipients.
+
+    distribution - a list of (message, recipients) tuples, where
+                   recipients is a user or an iterable of users.
+
+    All of the Messages2Users records are inserted with a single
+    statement (duplicates are ignored).  If
+    settings.DEFER_MESSAGE_DELIVERY is True, a MessageJob is queued for
+    each message instead and the messages are delivered by the
+    send_queued_messages management command.
+    """
+
+    distribution = [
+        (message, [recipients] if isinstance(recipients, User) else recipients)
+        for message, recipients in distribution
+    ]
+
+    if getattr(settings, "DEFER_MESSAGE_DELIVERY", False):
+        MessageJob.objects.bulk_create(
+            [
+                MessageJob(
+                    message=message, recipients=sorted({x.id for x in recipients})
+                )
+                for message, recipients in distribution
+            ]
+        )
+    else:
+        Messages2Users.objects.bulk_create(
+            [
+                Messages2Users(user=recipient, message=message)
+                for message, recipients in distribution
+                for recipient in recipients
+            ],
+            ignore_conflicts=True,
+        )
+
+
 def send_message(msgtxt, recipients, project, milestone):
     """Create a record in the message database and send it to each user in
     recipients by appending a record to Messages2Users for each one."""
@@ -1705,23 +2317,16 @@ def send_message(msgtxt, recipients, project, milestone):
 
     # create a message object using the message text and the project-milestone
     message = Message.objects.create(msgtxt=msgtxt, project_milestone=prjms)
-    # then loop through the list of recipients and add one record to
-    # Messages2Users for each one:
-    try:
-        for recipient in recipients:
-            # user = User.objects.get(Employee=emp)
-            # Messages2Users.objects.create(user=recipient, msg=message)
-            msg4u = Messages2Users(user=recipient, message=message)
-            msg4u.save()
-    except TypeError:
-        # Messages2Users.objects.create(user=recipients, msg=message)
-        msg4u = Messages2Users(user=recipients, message=message)
-        msg4u.save()
+    deliver_messages([(message, recipients)])
 
 
 # =====================================
 #    Signals
 
+# sent by ProjectMilestones.objects.transition_many() with the list of
+# project milestones that were changed (with their new completed value).
+milestones_transitioned = Signal()
+
 # TODO Complete the pre_save signal to ProjectMilestones - send
 # message to appropriate people whenever a record in this table is
 # added or updated.
@@ -1765,6 +2370,36 @@ def send_notice_prjms_changed(sender, instance, **kwargs):
 # pre_save.connect(send_notice_prjms_changed, sender=ProjectMilestones)
 
 
+@receiver(milestones_transitioned, sender=ProjectMilestones)
+def send_notice_prjms_transitioned(sender, project_milestones, **kwargs):
+    """The bulk equivalent of send_notice_prjms_changed().  The
+    recipients are determined once for all of the projects and all of
+    the messages (and their distribution lists) are inserted together.
+    """
+
+    by_project = collections.OrderedDict()
+    for prjms in project_milestones:
+        by_project.setdefault(prjms.project_id, []).append(prjms)
+
+    projects = [x[0].project for x in by_project.values()]
+    recipients_by_project = build_msg_recipients_by_project(projects)
+
+    messages = []
+    distribution = []
+    for project_id, prjms_list in by_project.items():
+        recipients = recipients_by_project[project_id]
+        for prjms in prjms_list:
+            if prjms.completed:
+                msgtxt = prjms.milestone.label
+            else:
+                msgtxt = "The milestone '%s' has been revoked" % prjms.milestone.label
+            messages.append(Message(msgtxt=msgtxt, project_milestone=prjms))
+            distribution.append(recipients)
+
+    messages = Message.objects.bulk_create(messages)
+    deliver_messages(list(zip(messages, distribution)))
+
+
 @receiver(post_save, sender=ProjectMilestones)
 def send_notice_project_submitted(sender, instance, **kwargs):
     """If the status of a milestone has changed, send a message to the
@@ -1779,3 +2414,95 @@ def send_notice_project_submitted(sender, instance, **kwargs):
         send_message(
             msgtxt, recipients, project=instance.project, milestone=instance.milestone
         )
+
+
+# the ids of the projects that are being deleted (in this thread).  Their
+# project milestones are deleted first by the cascade, and there is no
+# point refreshing the status of a project that is about to disappear.
+_deleted_projects = threading.local()
+
+
+def project_is_being_deleted(project_id):
+    """Is project_id one of the projects that is being deleted?"""
+    return project_id in getattr(_deleted_projects, "ids", set())
+
+
+@receiver(pre_delete, sender=Project)
+def remember_deleted_project(sender, instance, **kwargs):
+    """Note that the project is being deleted - the pre_delete signals
+    are sent before any of the cascaded rows are deleted."""
+
+    if not hasattr(_deleted_projects, "ids"):
+        _deleted_projects.ids = set()
+    _deleted_projects.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Project)
+def forget_deleted_project(sender, instance, **kwargs):
+    """The project (and its project milestones) have been deleted."""
+
+    getattr(_deleted_projects, "ids", set()).discard(instance.pk)
+
+
+@receiver(post_save, sender=ProjectMilestones)
+@receiver(post_delete, sender=ProjectMilestones)
+def refresh_project_milestone_status(sender, instance, **kwargs):
+    """Keep the denormalized ProjectMilestoneStatus row for the project
+    in sync with its project milestones."""
+
+    if project_is_being_deleted(instance.project_id):
+        return
+    ProjectMilestoneStatus.refresh([instance.project_id])
+
+
+@receiver(post_save, sender=ProjectMilestones)
+@receiver(post_delete, sender=ProjectMilestones)
+def sync_project_status(sender, instance, **kwargs):
+    """The status of a project depends on its approved and sign off
+    milestones - if one of them changes, make sure the status column
+    still agrees with them."""
+
+    if project_is_being_deleted(instance.project_id):
+        return
+    if instance.milestone.label.lower() in ("approved", "sign off"):
+        Project.sync_status([instance.project_id])
+
+
+@receiver(post_save, sender=Milestone)
+@receiver(post_delete, sender=Milestone)
+def invalidate_milestone_registry(sender, instance, **kwargs):
+    """Reload the milestone registry whenever a milestone changes."""
+
+    milestone_registry.clear()
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_employee_hierarchy(sender, instance, **kwargs):
+    """Any change to an employee could change the supervisor chain or
+    the list of minions, so clear the cached hierarchy."""
+
+    clear_employee_hierarchy_cache()
+
+
+@receiver(post_save, sender=Project)
+def update_project_content_search(sender, instance, **kwargs):
+    """Keep the full text search vector up to date whenever a project
+    is saved - unless none of the fields it is built from were saved."""
+
+    update_fields = kwargs.get("update_fields")
+    search_fields = {"prj_cd", "prj_nm", "abstract", "comment"}
+    if update_fields is not None and not search_fields.intersection(update_fields):
+        return
+    Project.update_content_search([instance.id])
+
+
+@receiver(m2m_changed, sender=Project.tags.through)
+def update_tagged_project_content_search(sender, instance, action, **kwargs):
+    """Tags are part of the search vector, so it needs to be rebuilt
+    when tags are added to or removed from a project."""
+
+    if action in ("post_add", "post_remove", "post_clear") and isinstance(
+        instance, Project
+    ):
+        Project.update_content_search([instance.id])
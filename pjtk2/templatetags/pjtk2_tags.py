@@ -1,6 +1,7 @@
 from django import template
 from django.conf import settings
-from pjtk2.models import Project, Bookmark, ProjectType, Milestone
+from pjtk2.models import Project, ProjectType, Milestone, milestone_registry
+from pjtk2.utils.helpers import get_bookmarked_ids
 
 from django.template.defaultfilters import stringfilter
 
@@ -40,7 +41,8 @@ class IfBookmarkedNode(template.Node):
             project = self.project.resolve(context)
         except template.VariableDoesNotExist:
             return ""
-        if Bookmark.objects.filter(user__pk=user.id, project__slug=project.slug):
+        # the user's bookmarks are only retrieved once per request:
+        if project.id in get_bookmarked_ids(user):
             return self.nodelist_true.render(context)
         else:
             return self.nodelist_false.render(context)
@@ -66,6 +68,23 @@ def milestone_status_glyph(status):
     return mark_safe(glyphs.get(status, default))
 
 
+@register.filter
+def with_milestone_status(projects):
+    """Return the projects as a list with the milestone status dictionary
+    of each project attached as project.milestone_status.  The
+    milestones of all of the projects are retrieved with one query
+    rather than one for each row of the table.
+
+    {% for project in projects|with_milestone_status %}
+    """
+
+    projects = list(projects)
+    statuses = Project.get_milestone_status_dicts(projects)
+    for project in projects:
+        project.milestone_status = statuses[project.id]
+    return projects
+
+
 @register.filter
 def highlight_status(status):
     """a little filter to colour our status entires in project lists."""
@@ -76,7 +95,7 @@ def highlight_status(status):
 
 
 @register.filter
-def fisheye_button(project):
+def fisheye_button(project, merged=None):
     """a template filter to return a bootstrap styled button link to the
     project detail page in fisheye, fsis-ii or the creel portal.
     Controlled by the values in LOCAL_LINKS in settings/base.py
@@ -99,31 +118,37 @@ def fisheye_button(project):
       list of projects included in local links, the function retuns an
       empty string.
 
+    - merged is optional.  If the status of the 'Data Merged' milestone
+      is already known (e.g. from ProjectDetailBundle), it can be passed
+      in as an argument ({{ project|fisheye_button:merged }}) to avoid
+      looking it up again.
+
     """
     local_links = settings.LOCAL_LINKS
     if local_links is None:
         return ""
     else:
-        merged = Milestone.objects.filter(label="Data Merged").first()
         if merged is None:
-            return ""
-        else:
-            project_type = project.project_type.project_type
-            project_vals = local_links.get("project_types").get(project_type)
-
-            if project_vals and project.milestone_complete(merged):
-                project_vals["ipaddress"] = local_links.get("ipaddress")
-                project_vals["id_val"] = getattr(
-                    project, project_vals.get("identifier")
-                )
-                url = "http://{ipaddress}:{port}/{detail_url}/{id_val}".format(
-                    **project_vals
-                )
-                link = '<a class="btn btn-primary" href="{}" role="button">{}</a>'
-                link = link.format(url, project_vals["button_label"])
-                return mark_safe(link)
-            else:
+            try:
+                milestone = milestone_registry.get("Data Merged")
+            except Milestone.DoesNotExist:
                 return ""
+            merged = project.milestone_complete(milestone)
+
+        project_type = project.project_type.project_type
+        project_vals = local_links.get("project_types").get(project_type)
+
+        if project_vals and merged:
+            project_vals["ipaddress"] = local_links.get("ipaddress")
+            project_vals["id_val"] = getattr(project, project_vals.get("identifier"))
+            url = "http://{ipaddress}:{port}/{detail_url}/{id_val}".format(
+                **project_vals
+            )
+            link = '<a class="btn btn-primary" href="{}" role="button">{}</a>'
+            link = link.format(url, project_vals["button_label"])
+            return mark_safe(link)
+        else:
+            return ""
 
 
 @register.filter(name="addcss")
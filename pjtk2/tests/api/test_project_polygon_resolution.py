@@ -0,0 +1,89 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/api/test_project_polygon_resolution.py
+
+DESCRIPTION:
+
+Tests of the simplified project polygons - they should be updated
+whenever the convex hull is, and the polygon endpoints should return
+the resolution selected by the 'resolution' parameter.
+
+A. Cottrill
+=============================================================
+"""
+
+import math
+
+import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.urls import reverse
+
+from pjtk2.models import ProjectPolygon
+from pjtk2.tests.factories import LakeFactory, ProjectFactory, SamplePointFactory
+from pjtk2.tests.pytest_fixtures import *
+
+
+@pytest.fixture
+def round_project(db, user):
+    """A project with 200 sample points on a circle - so its convex
+    hull has lots of vertices that can be simplified."""
+
+    project = ProjectFactory.create(prj_cd="LHA_IA16_RND", owner=user)
+    for i in range(200):
+        angle = 2 * math.pi * i / 200
+        pt = "POINT({} {})".format(
+            -82.0 + 0.1 * math.cos(angle), 44.5 + 0.1 * math.sin(angle)
+        )
+        SamplePointFactory.create(
+            project=project, label=str(i), geom=GEOSGeometry(pt, srid=4326)
+        )
+    project.update_convex_hull()
+    return project
+
+
+@pytest.mark.django_db
+def test_update_convex_hull_simplifies_polygon(round_project):
+    """Each resolution should have fewer vertices than the one before."""
+
+    polygon = ProjectPolygon.objects.get(project=round_project)
+    assert polygon.geom_medium.geom_type == "Polygon"
+    assert polygon.geom_low.geom_type == "Polygon"
+    assert (
+        polygon.geom.num_points
+        > polygon.geom_medium.num_points
+        > polygon.geom_low.num_points
+    )
+
+
+@pytest.mark.django_db
+def test_project_polygon_list_resolution(client, round_project):
+    """The low resolution polygons should be smaller than the full
+    polygons, and the project filters should be applied."""
+
+    url = reverse("api:project_polygon_list")
+    lake = round_project.lake.abbrev
+
+    high = client.get(url, {"lake": lake})
+    low = client.get(url, {"lake": lake, "resolution": "low"})
+    assert high.status_code == 200
+    assert low.status_code == 200
+
+    assert [x["prj_cd"] for x in low.data["results"]] == ["LHA_IA16_RND"]
+    polygon = ProjectPolygon.objects.get(project=round_project)
+    assert low.data["results"][0]["geom"] == str(polygon.geom_low)
+    assert high.data["results"][0]["geom"] == str(polygon.geom)
+    assert len(str(low.data["results"][0]["geom"])) < len(
+        str(high.data["results"][0]["geom"])
+    )
+
+    LakeFactory.create(lake_name="Lake Superior", abbrev="SU")
+    response = client.get(url, {"lake": "SU", "resolution": "low"})
+    assert response.data["results"] == []
+
+
+@pytest.mark.django_db
+def test_project_polygon_bad_resolution(client, round_project):
+    """An unknown resolution should return a 400 error."""
+
+    url = reverse("api:project_polygon", kwargs={"slug": round_project.slug})
+    assert client.get(url, {"resolution": "medium"}).status_code == 200
+    assert client.get(url, {"resolution": "ultra"}).status_code == 400
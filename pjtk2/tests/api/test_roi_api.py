@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from django.contrib.gis.geos import GEOSGeometry
 from django.db.models import Q
@@ -161,6 +163,34 @@ class ProjectAPITest(APITestCase):
         self.assertEqual(len(response.data), len(serializer.data))
         self.assertEqual(set(expected), set(observed))
 
+    def test_points_in_roi_api_post_geojson(self):
+        """If geojson is requested, the same points should be streamed as
+        a feature collection with the serializer fields as properties.
+        """
+
+        url = reverse("api:get_points_in_roi")
+        data = {"roi": self.roi.wkt}
+        expected = self.client.post(url, data).data
+
+        response = self.client.post(url + "?format=geojson", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        self.assertTrue(response.streaming)
+
+        geojson = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(geojson["type"], "FeatureCollection")
+        observed = [x["properties"] for x in geojson["features"]]
+        self.assertEqual(
+            sorted(observed, key=lambda x: x["label"]),
+            sorted([dict(x) for x in expected], key=lambda x: x["label"]),
+        )
+        point = geojson["features"][0]
+        self.assertEqual(point["geometry"]["type"], "Point")
+        self.assertEqual(
+            point["geometry"]["coordinates"],
+            [point["properties"]["dd_lon"], point["properties"]["dd_lat"]],
+        )
+
     def test_points_in_roi_api_post_no_points(self):
         """If we pass in a valid roi, that does not include any sample points,
         the api shouldn't return any data, but should not fail or
@@ -0,0 +1,68 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/api/test_sample_point_geojson.py
+
+DESCRIPTION:
+
+Tests of the geojson mode of the sample point list endpoint - the
+filtered points should be streamed as a single feature collection
+rather than returned one page at a time.
+
+A. Cottrill
+=============================================================
+"""
+
+import json
+
+import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.urls import reverse
+
+from pjtk2.tests.factories import ProjectFactory, SamplePointFactory
+from pjtk2.tests.pytest_fixtures import *
+
+
+@pytest.fixture
+def sample_points(db, user):
+    """Two projects with sample points - one from 2016 and one from 2017."""
+
+    for prj_cd in ["LHA_IA16_INN", "LHA_IA17_INN"]:
+        project = ProjectFactory.create(prj_cd=prj_cd, owner=user)
+        for i in range(3):
+            SamplePointFactory.create(
+                project=project,
+                label="{}".format(i + 1) if i else "",
+                geom=GEOSGeometry("POINT(-82.0{} 44.0{})".format(i, i), srid=4326),
+            )
+
+
+@pytest.mark.django_db
+def test_sample_point_list_geojson(client, sample_points):
+    """All of the filtered points should be returned as features, and
+    the popup text should match the one created by the model."""
+
+    url = reverse("api:sample_point_list")
+    response = client.get(url, {"format": "geojson", "year": 2016})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/geo+json"
+
+    geojson = json.loads(b"".join(response.streaming_content))
+    features = sorted(geojson["features"], key=lambda x: x["properties"]["label"])
+    assert len(features) == 3
+
+    assert [x["properties"]["popup_text"] for x in features] == [
+        "LHA_IA16_INN",
+        "LHA_IA16_INN - 1",
+        "LHA_IA16_INN - 2",
+    ]
+    assert features[1]["geometry"]["coordinates"] == [-82.01, 44.01]
+
+
+@pytest.mark.django_db
+def test_sample_point_list_json_is_paginated(client, sample_points):
+    """Without the geojson format, the points should still be paginated."""
+
+    url = reverse("api:sample_point_list")
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data["count"] == 6
@@ -0,0 +1,101 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/api/test_sample_point_tiles.py
+
+DESCRIPTION:
+
+Tests of the sample point vector tile endpoint - tiles should be
+built from the filtered sample points, include ETag and
+Cache-Control headers, and return 404 for tiles that don't exist.
+
+A. Cottrill
+=============================================================
+"""
+
+import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.urls import reverse
+
+from pjtk2.tests.factories import ProjectFactory, SamplePointFactory
+from pjtk2.tests.pytest_fixtures import *
+
+from ...utils.vector_tiles import tile_bounds
+
+
+@pytest.fixture
+def sample_points(db, user):
+    """A project with three sample points in Lake Huron."""
+
+    project = ProjectFactory.create(prj_cd="LHA_IA16_INN", owner=user)
+    pts = ["POINT(-82.08 44.00)", "POINT(-82.04 44.06)", "POINT(-82.02 44.01)"]
+    for i, pt in enumerate(pts):
+        SamplePointFactory.create(
+            project=project, label="In-{}".format(i), geom=GEOSGeometry(pt, srid=4326)
+        )
+    return project
+
+
+def test_tile_bounds():
+    """Tile 0/0/0 covers the whole web mercator world, and tiles outside
+    of the grid should raise a ValueError."""
+
+    west, south, east, north = tile_bounds(0, 0, 0)
+    assert (west, east) == (-180.0, 180.0)
+    assert north == pytest.approx(85.0511, abs=1e-4)
+    assert south == pytest.approx(-85.0511, abs=1e-4)
+
+    assert tile_bounds(1, 0, 0) == pytest.approx((-180.0, 0.0, 0.0, 85.0511), abs=1e-4)
+
+    with pytest.raises(ValueError):
+        tile_bounds(1, 2, 0)
+
+
+@pytest.mark.django_db
+def test_sample_point_tile(client, sample_points):
+    """The tile should include the points and the caching headers.  If
+    the ETag matches, a 304 should be returned instead of the tile."""
+
+    url = reverse("api:sample_point_tiles", kwargs={"z": 0, "x": 0, "y": 0})
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/vnd.mapbox-vector-tile"
+    assert b"LHA_IA16_INN" in response.content
+    assert "max-age=3600" in response["Cache-Control"]
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_sample_point_tile_filters(client, sample_points):
+    """The sample point and project filters should be applied to the
+    points in the tile."""
+
+    url = reverse("api:sample_point_tiles", kwargs={"z": 0, "x": 0, "y": 0})
+
+    response = client.get(url, {"year": 2016})
+    assert b"LHA_IA16_INN" in response.content
+
+    response = client.get(url, {"year": 2015})
+    assert response.status_code == 200
+    assert response.content == b""
+
+    response = client.get(url, {"prj_cd__not": "LHA_IA16_INN"})
+    assert response.content == b""
+
+    # scope is only a project filter:
+    scope = sample_points.project_type.scope
+    response = client.get(url, {"scope": scope})
+    assert b"LHA_IA16_INN" in response.content
+
+    response = client.get(url, {"scope": "XX"})
+    assert response.content == b""
+
+
+@pytest.mark.django_db
+def test_sample_point_tile_does_not_exist(client):
+    """A 404 should be returned for tiles outside of the grid."""
+
+    url = reverse("api:sample_point_tiles", kwargs={"z": 1, "x": 5, "y": 0})
+    response = client.get(url)
+    assert response.status_code == 404
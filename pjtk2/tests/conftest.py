@@ -0,0 +1,25 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/conftest.py
+
+DESCRIPTION:
+
+Fixtures that apply to every test in pjtk2 (including the TestCase
+classes).  Milestones are cached by the milestone registry for the
+life of the process, but each test rolls back the milestones it
+created without sending any signals - the registry is cleared before
+each test so it can't return milestones from a previous one.
+
+A. Cottrill
+=============================================================
+"""
+
+import pytest
+
+from pjtk2.models import milestone_registry
+
+
+@pytest.fixture(autouse=True)
+def clear_milestone_registry():
+    """Make sure each test starts with an empty milestone registry."""
+    milestone_registry.clear()
+    yield
@@ -365,6 +365,7 @@ def test_point_out_of_bounds(client, user, project, pts):
     messages = [
         "1 of the supplied points are not within the bounds of the lake",
         "associated with this project.",
+        "See row(s): 2.",
     ]
     for msg in messages:
         assert msg in content
@@ -606,12 +607,15 @@ def test_project_polygon_updated(client, project, user, pts):
     assert geom_after != geom_prior
 
 
-def test_project_maximum_upload_size(client, project, user, pts):
+def test_project_maximum_upload_size(client, project, user, pts, settings):
     """We should have a limit on the number of rows/points that can be
-    uploaded at one time.  If the user tries to upload more than that, a
-    warning should be returned to the user.
+    uploaded at one time (MAX_UPLOAD_POINTS).  If the user tries to
+    upload more than that, a warning should be returned to the user.
 
     """
+    MAX_UPLOAD_POINTS = 1000
+    settings.MAX_UPLOAD_POINTS = MAX_UPLOAD_POINTS
+
     # grab the points without the header and add a bunch of copies
     pts.extend(pts[1:] * 500)
     points_file = csv_file_upload(pts)
@@ -626,7 +630,6 @@ def test_project_maximum_upload_size(client, project, user, pts):
     assert response.status_code == 200
     content = response.content.decode("utf-8")
 
-    MAX_UPLOAD_POINTS = 1000
     msg = (
         "The points file contains more than {} points! ".format(MAX_UPLOAD_POINTS)
         + "Reduce the number of points and try again."
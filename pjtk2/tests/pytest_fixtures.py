@@ -13,6 +13,8 @@ A. Cottrill
 """
 
 from django.contrib.auth.models import Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import pytest
 from .factories import *
 
@@ -92,4 +94,20 @@ def project_image(db, user):
     project = ProjectFactory(prj_cd="LHA_IA12_999")
     projectimage = ProjectImageFactory(project=project, caption="Image Caption Test", alt_text="Image Alt Text Test")
 
-    return projectimage
\ No newline at end of file
+    return projectimage
+
+
+@pytest.fixture(scope=SCOPE)
+def page_query_count(client):
+    """return a function that requests a url with the test client and
+    returns the response along with the number of queries it took to
+    build it.  Used to verify that views (and their templates) do not
+    issue more queries than expected.
+    """
+
+    def count_queries(url):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        return response, len(queries)
+
+    return count_queries
@@ -62,3 +62,85 @@ def test_anon_user_cannot_signoff_project(client, project):
     assert url in response["Location"]
 
     assert project.is_complete() == False
+
+
+@pytest.fixture
+def approval_projects(db, user):
+    """Ten projects owned by homer - the first five have already been
+    approved."""
+
+    MilestoneFactory.create(label="Approved", category="Core", order=1, report=False)
+    MilestoneFactory.create(label="Sign Off", category="Core", order=99, report=False)
+    projects = []
+    for i in range(10):
+        project = ProjectFactory.create(prj_cd="LHA_IA12_{:03d}".format(i), owner=user)
+        if i < 5:
+            project.approve()
+        projects.append(project)
+    return projects
+
+
+def approval_ids(projects):
+    """Return the ids of the 'Approved' project milestones for projects."""
+    return list(
+        ProjectMilestones.objects.filter(
+            project__in=projects, milestone__label="Approved"
+        ).values_list("id", flat=True)
+    )
+
+
+@pytest.mark.django_db
+def test_update_approvals(approval_projects):
+    """update_approvals() should approve and unapprove the projects
+    associated with each list of project milestones and update their
+    status."""
+
+    from ..utils.helpers import update_approvals
+
+    approved = approval_ids(approval_projects[5:])
+    unapproved = approval_ids(approval_projects[:2])
+
+    assert update_approvals(approved, unapproved) == (5, 2)
+
+    statuses = {
+        x.prj_cd: x.status for x in Project.objects.filter(prj_cd__startswith="LHA")
+    }
+    assert [statuses["LHA_IA12_{:03d}".format(i)] for i in range(10)] == [
+        "submitted",
+        "submitted",
+    ] + ["ongoing"] * 8
+    assert Project.objects.approved().count() == 8
+
+    # the notifications were sent too:
+    approved_msgs = Message.objects.filter(msgtxt="Approved")
+    assert approved_msgs.count() == 5
+    revoked_msgs = Message.objects.filter(msgtxt__contains="has been revoked")
+    assert revoked_msgs.count() == 2
+
+
+@pytest.mark.django_db
+def test_update_approvals_ignores_other_milestones(approval_projects):
+    """Only 'Approved' project milestones should be changed by
+    update_approvals()."""
+
+    from ..utils.helpers import update_approvals
+
+    signoff_ids = list(
+        ProjectMilestones.objects.filter(
+            project__in=approval_projects, milestone__label="Sign Off"
+        ).values_list("id", flat=True)
+    )
+
+    assert update_approvals(signoff_ids, []) == (0, 0)
+    assert Project.objects.completed().count() == 0
+
+
+@pytest.mark.django_db
+def test_update_approvals_query_count(approval_projects, django_assert_max_num_queries):
+    """The number of queries should not depend on the number of projects
+    that are approved."""
+
+    from ..utils.helpers import update_approvals
+
+    with django_assert_max_num_queries(20):
+        update_approvals(approval_ids(approval_projects[5:]), [])
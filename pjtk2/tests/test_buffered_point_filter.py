@@ -0,0 +1,136 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_buffered_point_filter.py
+
+DESCRIPTION:
+
+The buffered point filters compare the geometries to the point with
+ST_DWithin (and ST_Covers for 'within') on geography in the same
+query as the rest of the filters ('within' also requires the whole
+geometry - point, multipoint or polygon - to be inside the buffer,
+compared on geometry).  These tests verify that the right
+projects and points are returned, and that the planner can use the
+geography indexes on the sample points and project multipoints.
+
+A. Cottrill
+=============================================================
+"""
+
+import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection
+
+from pjtk2.filters import ProjectFilter, SamplePointFilter
+from pjtk2.models import Project
+from pjtk2.tests.factories import ProjectFactory, SamplePointFactory
+from pjtk2.utils.geography import WithinBuffer
+from pjtk2.tests.pytest_fixtures import *
+
+# a point in Lake Huron and a 5 km buffer around it:
+BUFFERED_POINT = "POINT(-82.0 44.0)[5000]"
+
+
+def add_points(project, points):
+    """Add sample points at each of the (lon, lat) points to project."""
+    for i, (lon, lat) in enumerate(points):
+        SamplePointFactory.create(
+            project=project,
+            label=str(i),
+            geom=GEOSGeometry("POINT({} {})".format(lon, lat), srid=4326),
+        )
+    project.update_multipoints()
+
+
+@pytest.fixture
+def buffered_projects(db, user):
+    """Three projects - one with all of its points within 5 km of the
+    point, one with some, and one with none."""
+
+    near = ProjectFactory.create(prj_cd="LHA_IA16_NER", owner=user)
+    add_points(near, [(-82.01, 44.0), (-82.0, 44.01)])
+    some = ProjectFactory.create(prj_cd="LHA_IA16_SOM", owner=user)
+    add_points(some, [(-82.01, 44.0), (-82.5, 44.0)])
+    far = ProjectFactory.create(prj_cd="LHA_IA16_FAR", owner=user)
+    add_points(far, [(-83.0, 44.0)])
+    return near, some, far
+
+
+def plan_uses_index(queryset, index_name):
+    """Does the query plan for queryset use index_name?  Sequential scans
+    are disabled so the plan doesn't depend on the (tiny) size of the
+    test tables."""
+
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    return index_name in queryset.explain()
+
+
+@pytest.mark.django_db
+def test_project_filter_buffered_point(buffered_projects):
+    """intersects should return projects with any points near the
+    point, within only those with all of their points near it."""
+
+    qs = ProjectFilter({"intersects__buffered_point": BUFFERED_POINT}).qs
+    assert sorted([x.prj_cd for x in qs]) == ["LHA_IA16_NER", "LHA_IA16_SOM"]
+
+    qs = ProjectFilter({"within__buffered_point": BUFFERED_POINT}).qs
+    assert [x.prj_cd for x in qs] == ["LHA_IA16_NER"]
+
+
+@pytest.mark.django_db
+def test_sample_point_filter_buffered_point(buffered_projects):
+    """Only the sample points near the point should be returned."""
+
+    qs = SamplePointFilter({"intersects__buffered_point": BUFFERED_POINT}).qs
+    assert sorted([(x.project.prj_cd, x.label) for x in qs]) == [
+        ("LHA_IA16_NER", "0"),
+        ("LHA_IA16_NER", "1"),
+        ("LHA_IA16_SOM", "0"),
+    ]
+
+
+@pytest.mark.django_db
+def test_within_buffer_multipoints_and_polygons(buffered_projects, user):
+    """WithinBuffer should work for the project multipoints and for
+    the (polygon) convex hulls, not just for single points."""
+
+    point = GEOSGeometry("POINT(-82.0 44.0)", srid=4326)
+
+    qs = Project.objects.filter(WithinBuffer("multipoints__geom", point, 5000))
+    assert [x.prj_cd for x in qs] == ["LHA_IA16_NER"]
+    near = Project.objects.get(prj_cd="LHA_IA16_NER")
+    assert near.multipoints.geom.geom_type == "MultiPoint"
+
+    # two projects with triangular convex hulls - one inside the
+    # buffer and one that crosses its edge:
+    inside = ProjectFactory.create(prj_cd="LHA_IA16_INS", owner=user)
+    add_points(inside, [(-82.01, 44.0), (-82.0, 44.01), (-81.99, 43.99)])
+    inside.update_convex_hull()
+    edge = ProjectFactory.create(prj_cd="LHA_IA16_EDG", owner=user)
+    add_points(edge, [(-82.01, 44.0), (-82.0, 44.01), (-81.9, 44.0)])
+    edge.update_convex_hull()
+
+    qs = Project.objects.filter(
+        convex_hull__isnull=False,
+        prj_cd__in=["LHA_IA16_INS", "LHA_IA16_EDG"],
+    ).filter(WithinBuffer("convex_hull__geom", point, 5000))
+    assert [x.prj_cd for x in qs] == ["LHA_IA16_INS"]
+
+
+@pytest.mark.django_db
+def test_buffered_point_invalid_value(buffered_projects):
+    """A value that isn't a point should be ignored."""
+
+    qs = ProjectFilter({"intersects__buffered_point": "foobar[500]"}).qs
+    assert qs.count() == 3
+
+
+@pytest.mark.django_db
+def test_buffered_point_plans_use_geography_indexes(buffered_projects):
+    """The buffered point filters should be able to use the geography
+    indexes."""
+
+    qs = SamplePointFilter({"intersects__buffered_point": BUFFERED_POINT}).qs
+    assert plan_uses_index(qs, "pjtk2_samplepoint_geog_idx")
+
+    qs = ProjectFilter({"intersects__buffered_point": BUFFERED_POINT}).qs
+    assert plan_uses_index(qs, "pjtk2_multipoints_geog_idx")
@@ -0,0 +1,196 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_milestone_matrix.py
+
+DESCRIPTION:
+
+Tests of the milestone matrix used by my_projects (built from the
+denormalized ProjectMilestoneStatus table), and that the status table
+is refreshed when the reporting requirements are changed with
+ReportsForm - which uses update() and doesn't send any signals.  The
+status rows are updated in place, and aren't refreshed while a
+project is being deleted.
+
+A. Cottrill
+=============================================================
+"""
+
+import datetime
+
+import pytest
+
+from pjtk2.tests.factories import *
+from pjtk2.tests.pytest_fixtures import *
+
+from ..forms import ReportsForm
+from ..models import ProjectMilestoneStatus, milestone_registry
+from ..views.management import get_milestone_matrix
+
+
+@pytest.fixture
+def milestones(db):
+    """The core milestones and reports, plus a custom report."""
+
+    return {
+        "Submitted": MilestoneFactory.create(
+            label="Submitted", category="Core", order=0, report=False
+        ),
+        "Approved": MilestoneFactory.create(
+            label="Approved", category="Core", order=1, report=False
+        ),
+        "Proposal": MilestoneFactory.create(
+            label="Proposal", category="Core", order=2, report=True
+        ),
+        "Aging": MilestoneFactory.create(
+            label="Aging", category="Custom", order=50, report=True
+        ),
+        "Sign off": MilestoneFactory.create(
+            label="Sign off", category="Core", order=99, report=False
+        ),
+    }
+
+
+@pytest.fixture
+def two_projects(user, milestones):
+    """A submitted project and an approved project from this year."""
+
+    yr = datetime.date.today().strftime("%y")
+    submitted = ProjectFactory.create(prj_cd="LHA_IA{}_001".format(yr), owner=user)
+    approved = ProjectFactory.create(prj_cd="LHA_IA{}_002".format(yr), owner=user)
+    approved.approve()
+    return submitted, approved
+
+
+@pytest.mark.django_db
+def test_get_milestone_matrix(user, two_projects):
+    """Each project should be in the right group, with the status of
+    each of its milestones."""
+
+    submitted, approved = two_projects
+    milestones = milestone_registry.filter(category="Core")
+    matrix = get_milestone_matrix([user.id], milestones)
+
+    assert list(matrix["submitted"].keys()) == [submitted.prj_cd]
+    assert list(matrix["approved"].keys()) == [approved.prj_cd]
+    assert list(matrix["cancelled"].keys()) == []
+    assert list(matrix["complete"].keys()) == []
+
+    assert matrix["submitted"][submitted.prj_cd]["milestones"] == {
+        "Approved": {
+            "type": "milestone",
+            "required": True,
+            "completed": False,
+            "status": "required-notDone",
+        },
+        "Proposal": {
+            "type": "report",
+            "required": True,
+            "completed": False,
+            "status": "required-notDone",
+        },
+        "Sign off": {
+            "type": "milestone",
+            "required": True,
+            "completed": False,
+            "status": "required-notDone",
+        },
+        "custom": {
+            "type": "report",
+            "required": False,
+            "completed": False,
+            "status": "notRequired-notDone",
+        },
+    }
+
+    approved_status = matrix["approved"][approved.prj_cd]["milestones"]["Approved"]
+    assert approved_status == {
+        "type": "milestone",
+        "required": True,
+        "completed": True,
+        "status": "required-done",
+    }
+    assert matrix["approved"][approved.prj_cd]["attrs"]["prj_ldr"] == (
+        approved.prj_ldr.username
+    )
+
+
+@pytest.mark.django_db
+def test_reports_form_refreshes_milestone_status(two_projects, milestones):
+    """Turning a report off (and back on) with ReportsForm should update
+    the project's milestone status."""
+
+    project = two_projects[0]
+    proposal = milestones["Proposal"]
+
+    def proposal_code():
+        return ProjectMilestoneStatus.objects.get(project=project).get_code(
+            proposal.id
+        )
+
+    assert proposal_code() == "RN"
+
+    form = ReportsForm(
+        data={"Core": []},
+        reports=project.get_milestone_dicts(),
+        what="Core",
+        project=project,
+    )
+    assert form.is_valid()
+    form.save()
+    assert proposal_code() == "NN"
+
+    form = ReportsForm(
+        data={"Core": [str(proposal.id)]},
+        reports=project.get_milestone_dicts(),
+        what="Core",
+        project=project,
+    )
+    assert form.is_valid()
+    form.save()
+    assert proposal_code() == "RN"
+
+
+@pytest.mark.django_db
+def test_refresh_updates_status_row_in_place(two_projects, milestones):
+    """Refreshing the status should update the existing row rather than
+    replacing it, and should remove the row of a project without any
+    milestones."""
+
+    project = two_projects[0]
+    status = ProjectMilestoneStatus.objects.get(project=project)
+
+    ProjectMilestones.objects.filter(
+        project=project, milestone=milestones["Proposal"]
+    ).update(required=False)
+    ProjectMilestoneStatus.refresh([project.id, project.id])
+
+    refreshed = ProjectMilestoneStatus.objects.get(project=project)
+    assert refreshed.id == status.id
+    assert refreshed.get_code(milestones["Proposal"].id) == "NN"
+
+    ProjectMilestones.objects.filter(project=project).delete()
+    ProjectMilestoneStatus.refresh([project.id])
+    assert not ProjectMilestoneStatus.objects.filter(project=project).exists()
+
+
+@pytest.mark.django_db
+def test_project_delete_does_not_refresh_status(two_projects):
+    """Deleting a project cascades to its project milestones - their
+    post_delete signals shouldn't refresh the status of the project
+    that is being deleted."""
+
+    from unittest.mock import patch
+
+    project = two_projects[0]
+    project_id = project.id
+    with patch.object(ProjectMilestoneStatus, "refresh") as refresh:
+        project.delete()
+
+    assert refresh.call_count == 0
+    assert not ProjectMilestoneStatus.objects.filter(project_id=project_id).exists()
+
+    # milestones deleted on their own still refresh the status:
+    approved = two_projects[1]
+    prjms = ProjectMilestones.objects.filter(project=approved).first()
+    with patch.object(ProjectMilestoneStatus, "refresh") as refresh:
+        prjms.delete()
+    refresh.assert_called_once_with([approved.id])
@@ -8,9 +8,11 @@ from django.test import TestCase
 from pjtk2.models import (
     Bookmark,
     Family,
+    Milestone,
     Project,
     ProjectImage,
     ProjectMilestones,
+    milestone_registry,
     send_notice_prjms_changed,
 )
 from pjtk2.tests.factories import (
@@ -155,6 +157,8 @@ class TestProjectApproveUnapproveMethods(TestCase):
         milestone.completed = datetime.datetime.now(pytz.utc)
 
         milestone.save()
+        # the status column was updated when the milestone was saved
+        self.project1.refresh_from_db()
 
         # verfify that the poject is currently complete
         self.assertTrue(self.project1.is_complete())
@@ -584,6 +588,74 @@ def test_milestone_status_dict_custom_reports_both_done():
     assert tmp["status"] == "required-done"
 
 
+@pytest.mark.django_db
+def test_milestone_status_dicts(django_assert_num_queries):
+    """get_milestone_status_dicts() should return the status dictionary
+    of each project using a single query for all of the projects.  The
+    first project has been approved, the second has a required custom
+    report, and the proposal is not required for the third.
+    """
+
+    approved = MilestoneFactory.create(
+        label="Approved", label_abbrev="approved", category="Core", order=1
+    )
+    proposal = MilestoneFactory.create(
+        label="Proposal",
+        label_abbrev="proposal",
+        category="Core",
+        order=2,
+        report=True,
+    )
+    custom = MilestoneFactory.create(
+        label="Custom Report",
+        label_abbrev="my-custom-report",
+        category="Custom",
+        order=50,
+        report=True,
+    )
+
+    projects = [
+        ProjectFactory.create(prj_cd="LHA_IA12_{:03d}".format(i)) for i in range(3)
+    ]
+
+    pms = ProjectMilestones.objects.get(project=projects[0], milestone=approved)
+    pms.completed = datetime.datetime.now(pytz.utc)
+    pms.save()
+
+    ProjectMilestonesFactory.create(
+        project=projects[1], milestone=custom, required=True, completed=None
+    )
+
+    pms = ProjectMilestones.objects.get(project=projects[2], milestone=proposal)
+    pms.required = False
+    pms.save()
+
+    with django_assert_num_queries(1):
+        statuses = Project.get_milestone_status_dicts(projects)
+
+    assert statuses == {
+        projects[0].id: {
+            "approved": {"status": "required-done", "type": "milestone"},
+            "proposal": {"status": "required-notDone", "type": "report"},
+            "custom": {"status": "notRequired-notDone", "type": "report"},
+        },
+        projects[1].id: {
+            "approved": {"status": "required-notDone", "type": "milestone"},
+            "proposal": {"status": "required-notDone", "type": "report"},
+            "custom": {"status": "required-notDone", "type": "report"},
+        },
+        projects[2].id: {
+            "approved": {"status": "required-notDone", "type": "milestone"},
+            "proposal": {"status": "notRequired-notDone", "type": "report"},
+            "custom": {"status": "notRequired-notDone", "type": "report"},
+        },
+    }
+    assert list(statuses[projects[0].id].keys()) == ["approved", "proposal", "custom"]
+
+    # the single project method should return the same dictionary
+    assert projects[1].get_milestone_status_dict() == statuses[projects[1].id]
+
+
 # @pytest.mark.django_db
 # def test_project_total_cost():
 #    """the total_cost() method should return the sum of salary and odoe
@@ -1452,6 +1524,24 @@ class TestEmployeeFunctions(TestCase):
 
         self.assertListEqual(minions, shouldbe)
 
+    def test_hierarchy_query_count(self):
+        """Resolving the supervisors or minions of an employee should
+        take the same number of queries regardless of how deep they are
+        in the hierarchy - one to walk the tree, one to get the employees.
+        """
+
+        with self.assertNumQueries(2):
+            get_supervisors(self.employee6)
+
+        with self.assertNumQueries(2):
+            get_supervisors(self.employee2)
+
+        with self.assertNumQueries(2):
+            get_minions(self.employee1)
+
+        with self.assertNumQueries(2):
+            get_minions(self.employee6)
+
     def tearDown(self):
 
         self.employee1.delete()
@@ -1754,3 +1844,68 @@ class TestProjectStatus(TestCase):
         self.project1.signoff(self.user)
         self.assertEqual(self.project1._get_status(), "Complete")
         self.assertEqual(self.project1.status, "complete")
+
+
+@pytest.mark.django_db
+def test_milestone_registry(django_assert_num_queries):
+    """The milestone registry should load all of the milestones once,
+    return them by label, id and category, and reload them when a
+    milestone is changed."""
+
+    approved = MilestoneFactory.create(
+        label="Approved", category="Core", order=1, report=False
+    )
+    MilestoneFactory.create(label="Submitted", category="Core", order=0, report=False)
+    MilestoneFactory.create(label="Proposal", category="Core", order=2, report=True)
+    MilestoneFactory.create(label="Aging", category="Custom", order=50, report=True)
+
+    with django_assert_num_queries(1):
+        assert milestone_registry.get("approved") == approved
+        assert milestone_registry.get(id=approved.id) == approved
+        core = milestone_registry.filter(category="Core")
+        assert [x.label for x in core] == ["Approved", "Proposal"]
+        reports = milestone_registry.filter(report=True)
+        assert [x.label for x in reports] == ["Proposal", "Aging"]
+        everything = milestone_registry.filter(exclude=())
+        assert len(everything) == 4
+
+    with pytest.raises(Milestone.DoesNotExist):
+        milestone_registry.get("Sign Off")
+
+    approved.label_abbrev = "Appr."
+    approved.save()
+    assert milestone_registry.get("Approved").label_abbrev == "Appr."
+
+
+@pytest.mark.django_db
+def test_milestone_registry_reloads_missing_milestone(settings):
+    """A milestone created without the registry being cleared (e.g. - by
+    another process with its own cache) should still be found, and the
+    milestones should be reloaded once they expire."""
+
+    settings.MILESTONE_REGISTRY_TIMEOUT = None
+    MilestoneFactory.create(label="Approved", category="Core", order=1, report=False)
+    assert len(milestone_registry.filter(category="Custom")) == 0
+
+    # bypass the signals that would clear the registry:
+    Milestone.objects.bulk_create(
+        [
+            Milestone(
+                label="Aging", label_abbrev="Aging", category="Custom", order=50
+            )
+        ]
+    )
+    aging = Milestone.objects.get(label="Aging")
+    assert milestone_registry.get(id=aging.id).label == "Aging"
+    assert [x.label for x in milestone_registry.filter(category="Custom")] == ["Aging"]
+
+    Milestone.objects.bulk_create(
+        [
+            Milestone(
+                label="Creel", label_abbrev="Creel", category="Custom", order=51
+            )
+        ]
+    )
+    assert len(milestone_registry.filter(category="Custom")) == 1
+    settings.MILESTONE_REGISTRY_TIMEOUT = 0
+    assert len(milestone_registry.filter(category="Custom")) == 2
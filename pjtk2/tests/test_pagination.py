@@ -0,0 +1,184 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_pagination.py
+
+DESCRIPTION:
+
+Tests of the keyset pagination helpers and of the pagination used by
+the project list - projects should be counted rather than loaded into
+memory, following the 'after' cursor should return the next page of
+projects, and the estimated count should only be used for unfiltered
+lists.
+
+A. Cottrill
+=============================================================
+"""
+
+import datetime
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+from ..utils.pagination import (
+    estimated_count,
+    get_keyset_page,
+    is_unfiltered,
+    make_cursor,
+    parse_cursor,
+)
+from ..views.project_lists import ProjectList
+
+
+@pytest.fixture
+def seven_projects(db, user):
+    """Seven projects - two of which share the same end date."""
+
+    projects = []
+    for i in range(7):
+        prj_date0 = datetime.date(2012, 1 + i, 1)
+        prj_date1 = datetime.date(2012, 1 + min(i, 5), 15)
+        projects.append(
+            ProjectFactory.create(
+                prj_cd="LHA_IA12_{:03d}".format(i),
+                prj_date0=prj_date0,
+                prj_date1=prj_date1,
+                owner=user,
+            )
+        )
+    return projects
+
+
+def test_parse_cursor():
+    """A valid cursor should be split into a date and id, anything else
+    should return None."""
+
+    assert parse_cursor("2012-06-15_12") == (datetime.date(2012, 6, 15), 12)
+    assert parse_cursor(None) is None
+    assert parse_cursor("2012-06-15") is None
+    assert parse_cursor("foo_bar") is None
+
+
+@pytest.mark.django_db
+def test_get_keyset_page(seven_projects):
+    """Following the cursors should return every project exactly once,
+    in the same order as the offset pagination."""
+
+    expected = list(Project.objects.order_by("-prj_date1", "-id"))
+
+    seen = []
+    projects, cursor = get_keyset_page(Project.objects.all(), None, 3)
+    seen.extend(projects)
+    while cursor:
+        projects, cursor = get_keyset_page(Project.objects.all(), cursor, 3)
+        seen.extend(projects)
+
+    assert seen == expected
+    assert make_cursor(seen[-1]) == make_cursor(expected[-1])
+
+
+@pytest.mark.django_db
+def test_project_list_count(client, seven_projects):
+    """The project list should report the total number of projects and
+    only include one page of them."""
+
+    response = client.get(reverse("ProjectList"))
+    assert response.status_code == 200
+    assert response.context["project_count"] == 7
+    assert response.context["count_is_estimate"] is False
+    assert len(response.context["object_list"]) == 7
+
+
+@pytest.mark.django_db
+def test_project_list_bad_page_returns_last_page(client, seven_projects):
+    """A page number past the end of the list should return the last
+    page rather than a 404."""
+
+    response = client.get(reverse("ProjectList"), {"page": 99})
+    assert response.status_code == 200
+    assert response.context["page_obj"].number == 1
+
+
+@pytest.mark.django_db
+def test_project_list_keyset_pagination(client, seven_projects):
+    """If the 'after' cursor is included in the request, the projects
+    following it should be returned."""
+
+    expected = list(Project.objects.order_by("-prj_date1", "-id"))
+    cursor = make_cursor(expected[2])
+
+    response = client.get(reverse("ProjectList"), {"after": cursor})
+    assert response.status_code == 200
+    assert list(response.context["object_list"]) == expected[3:]
+    assert response.context["next_cursor"] is None
+    assert "project_count" not in response.context
+
+
+@pytest.mark.django_db
+def test_is_unfiltered():
+    """Only querysets that return the same rows as the manager's base
+    queryset (active projects) are unfiltered."""
+
+    base = Project.objects.all()
+    assert is_unfiltered(Project.objects.select_related("prj_ldr").order_by("-id"), base)
+    assert not is_unfiltered(Project.all_objects.all(), base)
+    assert not is_unfiltered(Project.objects.filter(year="2012"), base)
+    assert not is_unfiltered(Project.objects.none(), base)
+    assert not is_unfiltered(Project.objects.distinct(), base)
+    assert not is_unfiltered(Project.objects.all()[:10], base)
+
+
+@pytest.mark.django_db
+def test_estimated_count_excludes_inactive(seven_projects):
+    """The estimated number of active projects should not include the
+    inactive projects."""
+
+    Project.all_objects.filter(pk__in=[x.pk for x in seven_projects[:2]]).update(
+        active=False
+    )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE pjtk2_project")
+
+    assert estimated_count(Project.objects.all()) == 5
+    assert estimated_count(Project.all_objects.all()) == 7
+
+
+@pytest.mark.django_db
+def test_project_list_estimated_count(client, seven_projects, monkeypatch):
+    """The estimated count should be used for large unfiltered lists, but
+    not when the list is filtered."""
+
+    monkeypatch.setattr(
+        "pjtk2.views.project_lists.estimated_count", lambda queryset: 20000
+    )
+
+    response = client.get(reverse("ProjectList"))
+    assert response.context["project_count"] == 20000
+    assert response.context["count_is_estimate"] is True
+
+    response = client.get(reverse("ProjectList"), {"year": "2012"})
+    assert response.context["project_count"] == 7
+    assert response.context["count_is_estimate"] is False
+
+
+@pytest.mark.django_db
+def test_project_list_first_page_links_to_cursor(client, seven_projects, monkeypatch):
+    """The next link of a numbered page should follow the cursor of its
+    last project and keep the filter parameters."""
+
+    monkeypatch.setattr(ProjectList, "paginate_by", 3)
+    expected = list(Project.objects.order_by("-prj_date1", "-id"))
+
+    response = client.get(reverse("ProjectList"), {"year": "2012", "page": "1"})
+    assert list(response.context["object_list"]) == expected[:3]
+    cursor = make_cursor(expected[2])
+    assert response.context["next_cursor"] == cursor
+    assert 'href="?year=2012&amp;after={}"'.format(cursor) in response.content.decode()
+
+    response = client.get(reverse("ProjectList"), {"year": "2012", "after": cursor})
+    assert list(response.context["object_list"]) == expected[3:6]
+    cursor = make_cursor(expected[5])
+    assert response.context["next_cursor"] == cursor
+    assert 'href="?year=2012&amp;after={}"'.format(cursor) in response.content.decode()
@@ -0,0 +1,168 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_point_validation.py
+
+DESCRIPTION:
+
+Unit tests for the functions used to validate and read uploaded
+spatial points - each type of problem should be reported along with
+the rows it was found in, points inside the lake's bounding box but
+outside of the lake itself should only be rejected if the polygon is
+checked, the rows of csv files should be read one at a time, and
+projects without a lake should be reported rather than raising an
+exception.
+
+A. Cottrill
+=============================================================
+"""
+
+import io
+
+import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from ..forms import SpatialPointUploadForm
+from ..models import Project
+from ..utils.point_ingestion import iter_csv_rows
+from ..utils.point_validation import (
+    MAX_REPORTED_ROWS,
+    PointValidator,
+    format_rows,
+    get_project_lake,
+    validate_points,
+)
+
+
+@pytest.fixture
+def triangle_lake():
+    """A triangular lake - the north west half of the square between
+    -84, 44 and -83, 45."""
+    return GEOSGeometry(
+        "MULTIPOLYGON(((-84.0 44.0, -84.0 45.0, -83.0 45.0, -84.0 44.0)))", srid=4326
+    )
+
+
+def test_format_rows():
+    """Only the first few row numbers should be included."""
+
+    assert format_rows([2, 5]) == "See row(s): 2, 5."
+    rows = list(range(2, MAX_REPORTED_ROWS + 7))
+    assert format_rows(rows).endswith(" and 5 more.")
+
+
+def test_validate_points(triangle_lake):
+    """Valid points should be returned as label, longitude, latitude
+    tuples."""
+
+    rows = [["1", "44.9", "-83.9"], ["2", "44.8", "-83.5"]]
+    points, errors = validate_points(rows, triangle_lake)
+    assert errors == []
+    assert points == [("1", -83.9, 44.9), ("2", -83.5, 44.8)]
+
+
+def test_validate_points_row_errors(triangle_lake):
+    """Each problem should be reported with the rows that contain it -
+    the header is row 1."""
+
+    rows = [
+        ["1", "44.9", "-83.9"],
+        ["", "44.9", "-83.9"],
+        ["3", "north", "-83.9"],
+        ["4", "44.9"],
+        ["5", "41.0", "-83.9"],
+    ]
+    points, errors = validate_points(rows, triangle_lake)
+    assert points is None
+    assert errors == [
+        "At least one point is missing a label. See row(s): 3.",
+        "At least one point has an invalid latitude or longitude. See row(s): 4, 5.",
+        "1 of the supplied points are not within the bounds of the lake "
+        + "associated with this project. See row(s): 6.",
+    ]
+
+
+def test_point_validator_polygon(triangle_lake):
+    """A point in the bounding box but outside the lake should only be
+    reported if check_polygon is True."""
+
+    rows = [["1", "44.9", "-83.9"], ["2", "44.1", "-83.1"], ["3", "44.5", "-80.0"]]
+
+    validator = PointValidator(triangle_lake)
+    assert [x[0] for x in validator.validate(rows)] == ["1", "2"]
+    assert validator.out_of_bounds == [4]
+
+    validator = PointValidator(triangle_lake, check_polygon=True)
+    assert [x[0] for x in validator.validate(rows)] == ["1"]
+    assert validator.out_of_bounds == [3, 4]
+    assert validator.count == 3
+
+
+def test_point_validator_long_label():
+    """Labels that will not fit in the database should be reported."""
+
+    validator = PointValidator()
+    rows = [["x" * (validator.label_length + 1), "44.9", "-83.9"]]
+    assert list(validator.validate(rows)) == []
+    assert validator.errors == [
+        "At least one point has a label longer than {} characters. "
+        "See row(s): 2.".format(validator.label_length)
+    ]
+
+
+def test_iter_csv_rows():
+    """Empty rows, quotes and the byte-order-mark should be removed from
+    the rows of a csv file."""
+
+    csv_file = io.BytesIO(
+        '\ufeffPOINT_LABEL,DD_LAT,DD_LON\n\n"1",44.9,-83.9\n'.encode("utf-8")
+    )
+    rows = iter_csv_rows(csv_file)
+    assert next(rows) == ["POINT_LABEL", "DD_LAT", "DD_LON"]
+    assert list(rows) == [["1", "44.9", "-83.9"]]
+
+
+def test_get_project_lake_without_lake():
+    """A project that isn't associated with a lake should return None
+    rather than raising an exception."""
+
+    assert get_project_lake(Project(prj_cd="LHA_IA12_111", lake_id=None)) is None
+
+
+def test_upload_form_project_without_lake():
+    """The upload form should report a project without a lake as a
+    validation error."""
+
+    upload = SimpleUploadedFile(
+        "points.csv", b"POINT_LABEL,DD_LAT,DD_LON\n1,44.5,-83.5\n"
+    )
+    form = SpatialPointUploadForm(
+        data={"replace": "replace"},
+        files={"points_file": upload},
+        project=Project(prj_cd="LHA_IA12_111", lake_id=None),
+    )
+    assert form.is_valid() is False
+    assert "not associated with a lake" in str(form.errors["points_file"])
+
+
+@pytest.mark.django_db
+def test_load_sample_points_project_without_lake(tmp_path):
+    """load_sample_points should raise a CommandError if the project
+    isn't associated with a lake."""
+
+    from unittest.mock import patch
+
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+
+    from .factories import ProjectFactory
+
+    project = ProjectFactory.create(prj_cd="LHA_IA12_111")
+    points = tmp_path / "points.csv"
+    points.write_text("POINT_LABEL,DD_LAT,DD_LON\n1,44.5,-83.5\n")
+
+    with patch(
+        "pjtk2.management.commands.load_sample_points.get_project_lake",
+        return_value=None,
+    ):
+        with pytest.raises(CommandError, match="not associated with a lake"):
+            call_command("load_sample_points", project.prj_cd, str(points))
@@ -0,0 +1,162 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_project_detail_bundle.py
+
+DESCRIPTION:
+
+The ProjectDetailBundle should return the same information as the
+project methods it replaces on the project detail page, and the
+number of queries used to build it should not grow with the number
+of reports, images or sister projects.
+
+A. Cottrill
+=============================================================
+"""
+
+import datetime
+
+import pytest
+import pytz
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+from ..utils.helpers import get_assignments_with_paths
+from ..utils.project_detail import ProjectDetailBundle
+
+
+@pytest.fixture
+def project_with_reports(db, user):
+    """a project with a two core reports, one custom report (each with
+    a current report) and two sisters."""
+
+    MilestoneFactory.create(label="Approved", category="Core", report=False, order=1)
+    MilestoneFactory.create(label="Sign Off", category="Core", report=False, order=99)
+    core1 = MilestoneFactory.create(
+        label="Completion Report", category="Core", report=True, order=2
+    )
+    core2 = MilestoneFactory.create(
+        label="Summary Report", category="Core", report=True, order=3
+    )
+    custom = MilestoneFactory.create(
+        label="Budget Report", category="Custom", report=True, order=4
+    )
+
+    project = ProjectFactory.create(prj_cd="LHA_IA12_111", owner=user)
+    project.approve()
+
+    for milestone in [core1, core2, custom]:
+        prjms = ProjectMilestonesFactory.create(project=project, milestone=milestone)
+        report = ReportFactory.create(uploaded_by=user)
+        report.projectreport.add(prjms)
+
+    family = FamilyFactory.create()
+    ProjectSisters.create(project=project, family=family)
+    for prj_cd in ["LHA_IA12_222", "LHA_IA12_333"]:
+        sister = ProjectFactory.create(prj_cd=prj_cd, owner=user)
+        ProjectSisters.create(project=sister, family=family)
+
+    return project
+
+
+@pytest.mark.django_db
+def test_bundle_matches_project_methods(project_with_reports, user):
+    """The attributes of the bundle should match the values returned by
+    the project methods used by the project detail page previously."""
+
+    project = project_with_reports
+    bundle = ProjectDetailBundle(project.slug, user=user)
+
+    assert bundle.project == project
+    assert bundle.is_approved == project.is_approved()
+    assert bundle.is_complete == project.is_complete()
+    assert bundle.has_sister == project.has_sister()
+    assert bundle.sisters == list(project.get_sisters())
+    assert bundle.milestones == list(project.get_milestones())
+    assert bundle.core == get_assignments_with_paths(project)
+    assert bundle.custom == get_assignments_with_paths(project, core=False)
+    assert bundle.bookmarked is False
+
+
+@pytest.mark.django_db
+def test_bundle_bookmarked(project_with_reports, user):
+    """If the user has bookmarked the project, bookmarked should be True."""
+
+    project = project_with_reports
+    Bookmark.objects.create(user=user, project=project)
+    bundle = ProjectDetailBundle(project.slug, user=user)
+    assert bundle.bookmarked is True
+
+
+def bundle_query_count(project, user):
+    """Build the bundle for project, access everything the project
+    detail page uses, and return the number of queries it took."""
+
+    with CaptureQueriesContext(connection) as queries:
+        bundle = ProjectDetailBundle(project.slug, user=user)
+        bundle.core
+        bundle.custom
+        bundle.milestones
+        bundle.is_approved
+        bundle.is_complete
+        bundle.project.total_cost
+        list(bundle.project.tags.all())
+        list(bundle.project.images.all())
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_bundle_query_count_is_constant(project_with_reports, user):
+    """Adding more reports, images and sisters to the project should
+    not increase the number of queries required to build the bundle or
+    to access its attributes."""
+
+    project = project_with_reports
+
+    first_count = bundle_query_count(project, user)
+    assert first_count <= 12
+
+    for order, label in enumerate(["Another Report", "Yet Another Report"], 5):
+        milestone = MilestoneFactory.create(
+            label=label, category="Custom", report=True, order=order
+        )
+        prjms = ProjectMilestonesFactory.create(project=project, milestone=milestone)
+        report = ReportFactory.create(uploaded_by=user)
+        report.projectreport.add(prjms)
+    ProjectImageFactory.create(project=project)
+    ProjectImageFactory.create(project=project)
+    family = project.get_family()
+    for prj_cd in ["LHA_IA12_444", "LHA_IA12_555"]:
+        sister = ProjectFactory.create(prj_cd=prj_cd, owner=user)
+        ProjectSisters.create(project=sister, family=family)
+
+    assert bundle_query_count(project, user) <= first_count
+
+
+@pytest.mark.django_db
+def test_assignments_with_paths_query_count(
+    project_with_reports, user, django_assert_num_queries
+):
+    """get_assignments_with_paths() should retrieve the assignments and
+    their current reports with two queries regardless of how many
+    reports have been assigned."""
+
+    project = project_with_reports
+
+    with django_assert_num_queries(2):
+        core = get_assignments_with_paths(project)
+    assert [x["report"] is not None for x in core] == [True, True]
+
+    for label in ["Another Report", "Yet Another Report"]:
+        milestone = MilestoneFactory.create(
+            label=label, category="Custom", report=True, order=5
+        )
+        prjms = ProjectMilestonesFactory.create(project=project, milestone=milestone)
+        report = ReportFactory.create(uploaded_by=user)
+        report.projectreport.add(prjms)
+
+    with django_assert_num_queries(2):
+        custom = get_assignments_with_paths(project, core=False)
+    assert len(custom) == 3
+    assert all(x["report"] is not None for x in custom)
@@ -0,0 +1,108 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_project_facets.py
+
+DESCRIPTION:
+
+get_project_facets() should return the same counts by lake, project
+type, scope and protocol as separate aggregate queries would, along
+with the total number of projects - all in a single query.
+
+A. Cottrill
+=============================================================
+"""
+
+import pytest
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+from ..utils.facets import get_project_facets
+
+
+@pytest.fixture
+def faceted_projects(db, user):
+    """Four projects in two lakes, with two project types (of
+    different scope) and one protocol."""
+
+    huron = LakeFactory.create(lake_name="Lake Huron", abbrev="HU")
+    superior = LakeFactory.create(lake_name="Lake Superior", abbrev="SU")
+
+    offshore = ProjTypeFactory.create(project_type="Offshore Index", scope="FI")
+    creel = ProjTypeFactory.create(project_type="Creel Survey", scope="FD")
+    protocol = ProjProtocolFactory.create(project_type=offshore)
+
+    ProjectFactory.create(
+        prj_cd="LHA_IA12_111",
+        lake=huron,
+        project_type=offshore,
+        protocol=protocol,
+        owner=user,
+    )
+    ProjectFactory.create(
+        prj_cd="LHA_IA12_222",
+        lake=huron,
+        project_type=offshore,
+        protocol=protocol,
+        owner=user,
+    )
+    ProjectFactory.create(
+        prj_cd="LHA_SC12_333", lake=huron, project_type=creel, owner=user
+    )
+    ProjectFactory.create(
+        prj_cd="LSA_SC12_444", lake=superior, project_type=creel, owner=user
+    )
+
+    return dict(huron=huron, superior=superior, offshore=offshore, creel=creel)
+
+
+@pytest.mark.django_db
+def test_project_facets(faceted_projects):
+    """Verify the counts for each facet and the total."""
+
+    facets = get_project_facets(Project.objects.all())
+
+    assert facets["total"] == 4
+
+    lakes = {x["lakeAbbrev"]: x["N"] for x in facets["lakes"]}
+    assert lakes == {"HU": 3, "SU": 1}
+
+    project_types = {x["projType"]: x["N"] for x in facets["project_types"]}
+    assert project_types == {"Offshore Index": 2, "Creel Survey": 2}
+
+    scope = {x["projScope"]: (x["name"], x["N"]) for x in facets["project_scope"]}
+    assert scope == {"FI": ("Fishery Independent", 2), "FD": ("Fishery Dependent", 2)}
+
+    # projects without a protocol are counted as zero - the same as
+    # Count("protocol")
+    protocols = {x["protocolAbbrev"]: x["N"] for x in facets["protocols"]}
+    assert protocols == {"BSM": 2, None: 0}
+
+
+@pytest.mark.django_db
+def test_project_facets_filtered(faceted_projects):
+    """The facets should reflect the filtered queryset."""
+
+    qs = Project.objects.filter(lake=faceted_projects["superior"])
+    facets = get_project_facets(qs)
+
+    assert facets["total"] == 1
+    assert [x["lakeAbbrev"] for x in facets["lakes"]] == ["SU"]
+    assert [x["projType"] for x in facets["project_types"]] == ["Creel Survey"]
+
+
+@pytest.mark.django_db
+def test_project_facets_single_query(faceted_projects, django_assert_num_queries):
+    """All of the facets should be calculated with one query."""
+
+    with django_assert_num_queries(1):
+        get_project_facets(Project.objects.all())
+
+
+@pytest.mark.django_db
+def test_project_facets_empty(db):
+    """If no projects match, the total should be zero and the facets
+    should be empty."""
+
+    facets = get_project_facets(Project.objects.none())
+    assert facets["total"] == 0
+    assert facets["lakes"] == []
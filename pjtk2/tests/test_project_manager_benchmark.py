@@ -0,0 +1,145 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_project_manager_benchmark.py
+
+DESCRIPTION:
+
+The ProjectsManager methods submitted(), approved() and completed()
+use the status column rather than joining to the project milestones
+twice.  These tests verify that they return the same projects as the
+original milestone based querysets (including cancelled projects that
+were never approved, which are submitted), that projects with a stale
+status (legacy rows) are classified correctly once the 0014 data
+migration has been applied, and compare the planner's estimated cost
+of approved() and completed().
+
+A. Cottrill
+=============================================================
+"""
+
+from importlib import import_module
+
+import pytest
+from django.apps import apps
+from django.db import connection
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+
+def milestone_queryset(approved, signed_off):
+    """The original implementation of the manager methods - two
+    filters on the project milestones.  Only approved and completed
+    projects excluded the cancelled projects."""
+
+    queryset = Project.objects.all()
+    if approved:
+        queryset = queryset.filter(cancelled=False)
+    return (
+        queryset.filter(
+            projectmilestones__milestone__label="Approved",
+            projectmilestones__completed__isnull=not approved,
+        )
+        .filter(
+            projectmilestones__milestone__label="Sign off",
+            projectmilestones__completed__isnull=not signed_off,
+        )
+    )
+
+
+def plan_cost(queryset):
+    """Return the total cost of the query plan for queryset.  The plan
+    is fetched with a cursor - on Django 3.2 explain(format="json")
+    returns the repr of the decoded plan rather than json."""
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    return plan[0]["Plan"]["Total Cost"]
+
+
+@pytest.fixture
+def many_projects(db, user):
+    """Sixty projects - a third submitted, a third approved and a third
+    signed off.  Some of the submitted and approved projects are then
+    cancelled."""
+
+    MilestoneFactory.create(label="Approved", category="Core", order=1, report=False)
+    MilestoneFactory.create(label="Sign off", category="Core", order=99, report=False)
+    MilestoneFactory.create(label="Cancelled", category="Core", order=98, report=False)
+
+    for i in range(60):
+        project = ProjectFactory.create(
+            prj_cd="LHA_IA12_{:03d}".format(i), owner=user
+        )
+        if i % 3:
+            project.approve()
+        if i % 3 == 2:
+            project.signoff(user)
+        elif i % 4 == 0:
+            project.cancel(user)
+
+
+@pytest.mark.django_db
+def test_manager_methods_match_milestones(many_projects):
+    """The status based querysets should return the same projects as the
+    milestone based querysets."""
+
+    def prj_cds(queryset):
+        return sorted([x.prj_cd for x in queryset])
+
+    assert len(prj_cds(Project.objects.submitted())) == 20
+    assert Project.objects.submitted().filter(cancelled=True).exists()
+    assert prj_cds(Project.objects.submitted()) == prj_cds(
+        milestone_queryset(approved=False, signed_off=False)
+    )
+    assert prj_cds(Project.objects.approved()) == prj_cds(
+        milestone_queryset(approved=True, signed_off=False)
+    )
+    assert prj_cds(Project.objects.completed()) == prj_cds(
+        milestone_queryset(approved=True, signed_off=True)
+    )
+
+
+@pytest.mark.django_db
+def test_manager_methods_after_status_migration(many_projects):
+    """Projects whose milestones were updated without their status (as
+    the legacy views did) should be in the right lists once the status
+    migration has been applied."""
+
+    def prj_cds(queryset):
+        return sorted([x.prj_cd for x in queryset])
+
+    Project.all_objects.update(status="submitted")
+    assert Project.objects.approved().count() == 0
+    assert Project.objects.completed().count() == 0
+
+    migration = import_module("pjtk2.migrations.0014_sync_project_status")
+    migration.sync_project_status(apps, None)
+
+    assert prj_cds(Project.objects.submitted()) == prj_cds(
+        milestone_queryset(approved=False, signed_off=False)
+    )
+    assert prj_cds(Project.objects.approved()) == prj_cds(
+        milestone_queryset(approved=True, signed_off=False)
+    )
+    assert prj_cds(Project.objects.completed()) == prj_cds(
+        milestone_queryset(approved=True, signed_off=True)
+    )
+    assert Project.objects.approved().exists()
+    assert Project.objects.completed().exists()
+
+
+@pytest.mark.django_db
+def test_manager_methods_plan_cost(many_projects):
+    """The estimated cost of the status based querysets should not be
+    more than the cost of the milestone joins they replace.  submitted()
+    isn't compared - it still checks the milestones of cancelled
+    projects."""
+
+    assert plan_cost(Project.objects.approved()) <= plan_cost(
+        milestone_queryset(approved=True, signed_off=False)
+    )
+    assert plan_cost(Project.objects.completed()) <= plan_cost(
+        milestone_queryset(approved=True, signed_off=True)
+    )
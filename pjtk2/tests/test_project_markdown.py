@@ -0,0 +1,105 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_project_markdown.py
+
+DESCRIPTION:
+
+The markdown in the abstract, comment and risk fields of a project
+should only be converted to html when it changes.  Status changes
+(approve, cancel, sign off...) only save the fields they change and
+shouldn't render any markdown at all.  The render_markdown management
+command should re-render the html of every project.
+
+A. Cottrill
+=============================================================
+"""
+
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+
+from pjtk2 import models as pjtk2_models
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+
+@pytest.fixture
+def render_count():
+    """Patch the markdown function used by Project.save() so we can
+    count how many times it is called."""
+    with patch.object(
+        pjtk2_models, "markdown", wraps=pjtk2_models.markdown
+    ) as mocked_markdown:
+        yield mocked_markdown
+
+
+@pytest.mark.django_db
+def test_unchanged_markdown_not_rendered(project, render_count):
+    """Saving a project without changing its markdown should not
+    render it again."""
+
+    project = Project.objects.get(pk=project.pk)
+    project.prj_nm = "A new name"
+    project.save()
+    assert render_count.call_count == 0
+
+
+@pytest.mark.django_db
+def test_changed_markdown_rendered(project, render_count):
+    """Only the fields that have changed should be rendered."""
+
+    project = Project.objects.get(pk=project.pk)
+    project.abstract = "A **new** abstract"
+    project.save()
+    assert render_count.call_count == 1
+
+    project.refresh_from_db()
+    assert "<strong>new</strong>" in project.abstract_html
+
+
+@pytest.mark.django_db
+def test_refreshed_markdown_not_rendered(project, render_count):
+    """Markdown changed in the database by someone else should not be
+    rendered again after the project is refreshed, and neither should
+    deferred fields once they have been loaded."""
+
+    project = Project.objects.get(pk=project.pk)
+    Project.objects.filter(pk=project.pk).update(abstract="An updated abstract")
+    project.refresh_from_db()
+    project.save()
+    assert render_count.call_count == 0
+
+    project = Project.objects.defer("abstract").get(pk=project.pk)
+    assert project.abstract == "An updated abstract"
+    project.save()
+    assert render_count.call_count == 0
+
+
+@pytest.mark.django_db
+def test_status_changes_not_rendered(project, render_count):
+    """Approving and signing off a project should not render any
+    markdown."""
+
+    project.approve()
+    project.signoff(project.owner)
+    assert render_count.call_count == 0
+
+    project.refresh_from_db()
+    assert project.status == "complete"
+
+
+@pytest.mark.django_db
+def test_render_markdown_command(project):
+    """The command should rebuild stale html without changing the
+    markdown."""
+
+    abstract = Project.objects.get(pk=project.pk).abstract
+    Project.objects.filter(pk=project.pk).update(abstract_html="stale")
+
+    call_command("render_markdown", stdout=StringIO())
+
+    project.refresh_from_db()
+    assert project.abstract == abstract
+    assert project.abstract_html != "stale"
+    assert abstract in project.abstract_html
@@ -0,0 +1,162 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_project_search_vector.py
+
+DESCRIPTION:
+
+The full text search vector (Project.content_search) should be
+maintained whenever a project is saved or tagged, and search queries
+built with make_prefix_search_query() should match word prefixes and
+rank matches in the project name above matches in the comment.  The
+vectors of existing projects are rebuilt by migration 0010, and
+saving fields that aren't searched shouldn't rebuild them.
+
+A. Cottrill
+=============================================================
+"""
+
+import pytest
+
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+from ..utils.helpers import make_prefix_search_query
+
+
+def search_projects(text):
+    """Return the project codes matching the search string in order of
+    relevance."""
+    query = make_prefix_search_query(text)
+    qs = (
+        Project.objects.filter(content_search=query)
+        .annotate(rank=SearchRank(F("content_search"), query))
+        .order_by("-rank", "prj_cd")
+    )
+    return [x.prj_cd for x in qs]
+
+
+@pytest.fixture
+def search_projects_fixture(db, user):
+    """Three projects - one with walleye in the name, one with walleye
+    in the comment, and one tagged 'lake trout'."""
+
+    ProjectFactory.create(
+        prj_cd="LHA_IA12_111", prj_nm="Walleye Index Netting", owner=user
+    )
+    ProjectFactory.create(
+        prj_cd="LHA_IA12_222",
+        prj_nm="Fish Community Index",
+        comment="A few walleye were caught too.",
+        owner=user,
+    )
+    project = ProjectFactory.create(
+        prj_cd="LHA_IA13_333", prj_nm="Nearshore Community Index", owner=user
+    )
+    project.tags.add("lake trout")
+
+
+def test_make_prefix_search_query_empty():
+    """An empty search string, or one without any words, should not
+    produce a search query."""
+
+    assert make_prefix_search_query("") is None
+    assert make_prefix_search_query(None) is None
+    assert make_prefix_search_query(" - ") is None
+
+
+@pytest.mark.django_db
+def test_search_vector_populated_on_save(search_projects_fixture):
+    """Every project should have a search vector after it is saved."""
+
+    assert Project.objects.filter(content_search__isnull=True).count() == 0
+
+
+@pytest.mark.django_db
+def test_search_by_prefix(search_projects_fixture):
+    """Partial words should match projects containing words that
+    start with them."""
+
+    assert search_projects("walle") == ["LHA_IA12_111", "LHA_IA12_222"]
+    assert search_projects("near comm") == ["LHA_IA13_333"]
+
+
+@pytest.mark.django_db
+def test_search_by_project_code(search_projects_fixture):
+    """The project code is part of the search vector."""
+
+    assert search_projects("LHA_IA13") == ["LHA_IA13_333"]
+
+
+@pytest.mark.django_db
+def test_search_by_tag(search_projects_fixture):
+    """Tags are part of the search vector and should be updated when
+    they are added or removed."""
+
+    assert search_projects("trout") == ["LHA_IA13_333"]
+
+    project = Project.objects.get(prj_cd="LHA_IA13_333")
+    project.tags.remove("lake trout")
+    assert search_projects("trout") == []
+
+
+@pytest.mark.django_db
+def test_search_ranked_by_relevance(search_projects_fixture):
+    """Matches in the project name should rank ahead of matches in the
+    comment."""
+
+    assert search_projects("walleye") == ["LHA_IA12_111", "LHA_IA12_222"]
+
+
+@pytest.mark.django_db
+def test_search_vector_updated_on_change(search_projects_fixture):
+    """Changing the project name should update the search vector."""
+
+    project = Project.objects.get(prj_cd="LHA_IA12_111")
+    project.prj_nm = "Percid Index Netting"
+    project.save()
+
+    assert search_projects("percid") == ["LHA_IA12_111"]
+    assert search_projects("walleye") == ["LHA_IA12_222"]
+
+
+@pytest.mark.django_db
+def test_status_changes_do_not_update_search_vector(project):
+    """Approving, signing off and cancelling a project only save fields
+    that are not part of the search vector, so it shouldn't be rebuilt."""
+
+    from unittest.mock import patch
+
+    MilestoneFactory.create(label="Cancelled", category="Core", report=False)
+    with patch.object(Project, "update_content_search") as update:
+        project.approve()
+        project.signoff(project.owner)
+        project.cancel(project.owner)
+    assert update.call_count == 0
+
+    with patch.object(Project, "update_content_search") as update:
+        project.prj_nm = "A new name"
+        project.save(update_fields=["prj_nm"])
+    update.assert_called_once_with([project.id])
+
+
+@pytest.mark.django_db
+def test_migration_rebuilds_search_vectors(search_projects_fixture):
+    """The vectors rebuilt by migration 0010 should be the same as the
+    ones maintained by Project.update_content_search()."""
+
+    from importlib import import_module
+
+    from django.db import connection
+
+    migration = import_module("pjtk2.migrations.0010_drop_fulltextsearch_trigger")
+
+    expected = dict(Project.all_objects.values_list("prj_cd", "content_search"))
+    Project.all_objects.update(content_search=None)
+    with connection.cursor() as cursor:
+        cursor.execute(migration.REBUILD_SEARCH_VECTORS)
+
+    rebuilt = dict(Project.all_objects.values_list("prj_cd", "content_search"))
+    assert rebuilt == expected
+    assert search_projects("walleye") == ["LHA_IA12_111", "LHA_IA12_222"]
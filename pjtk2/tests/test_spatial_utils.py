@@ -229,6 +229,21 @@ def test_find_project_roi_both_contained_and_overlapping(
     assert list(projects["overlapping"]) == [project_some_in]
 
 
+@pytest.mark.django_db
+def test_find_project_roi_single_query(
+    roi, project_some_in, project_all_in, project_disjoint, django_assert_num_queries
+):
+    """The contained and overlapping projects (and their project types)
+    should be found with a single query."""
+
+    with django_assert_num_queries(1):
+        projects = find_roi_projects(roi)
+        assert [x.project_type.project_type for x in projects["contained"]] == [
+            project_all_in.project_type.project_type
+        ]
+        assert projects["overlapping"] == [project_some_in]
+
+
 @pytest.mark.django_db
 def test_find_project_roi_filter_project_type(roi, four_projects):
     """If a list of project types are provided, they should be used to
@@ -0,0 +1,190 @@
+"""=============================================================
+~/pjtk2/pjtk2/tests/test_status_predicates.py
+
+DESCRIPTION:
+
+The project status predicates (is_approved(), is_complete()) are
+read from the status column and the permission helpers (can_edit(),
+is_manager(), is_dba()) should only hit the database the first time
+they are evaluated for a project or user instance - each should be
+evaluated once per request.  The
+number of queries needed to render the project detail and edit pages
+should not change as reports and milestones are added.
+
+A. Cottrill
+=============================================================
+"""
+
+import datetime
+
+import pytest
+import pytz
+from django.urls import reverse
+
+from pjtk2.tests.pytest_fixtures import *
+from pjtk2.tests.factories import *
+
+from ..utils.helpers import can_edit, is_dba, is_manager
+
+
+@pytest.mark.django_db
+def test_status_predicates_use_status(project, django_assert_num_queries):
+    """is_approved() and is_complete() are derived from the status
+    column and should not query the project milestones."""
+
+    with django_assert_num_queries(0):
+        for i in range(3):
+            project.is_approved()
+            project.is_complete()
+
+
+@pytest.mark.django_db
+def test_status_cache_cleared_on_change(project):
+    """Approving or signing off a project should update the cached
+    status predicates."""
+
+    assert project.is_approved() is False
+    project.approve()
+    assert project.is_approved() is True
+
+    assert project.is_complete() is False
+    project.signoff(project.owner)
+    assert project.is_complete() is True
+
+
+@pytest.mark.django_db
+def test_role_predicates_evaluated_once(manager, django_assert_num_queries):
+    """is_manager() and is_dba() should only look up the employee once
+    for each user instance."""
+
+    user = User.objects.get(pk=manager.pk)
+    with django_assert_num_queries(1):
+        for i in range(3):
+            assert is_manager(user) is True
+            assert is_dba(user) is False
+
+
+@pytest.mark.django_db
+def test_can_edit_evaluated_once(project, user, django_assert_num_queries):
+    """can_edit() should be remembered for each user and project."""
+
+    can_edit(user, project)
+    with django_assert_num_queries(0):
+        assert can_edit(user, project) is True
+
+
+def add_reports(project, user, n):
+    """Add n custom reports (each with an uploaded report) to project."""
+
+    for i in range(n):
+        milestone = MilestoneFactory.create(
+            label="Report {}".format(i), category="Custom", report=True
+        )
+        prjms = ProjectMilestonesFactory.create(project=project, milestone=milestone)
+        report = ReportFactory.create(uploaded_by=user)
+        report.projectreport.add(prjms)
+
+
+@pytest.mark.django_db
+def test_project_detail_query_count(client, project, user, page_query_count):
+    """The number of queries needed to render the project detail page
+    should not depend on the number of reports."""
+
+    client.login(username=user.username, password="Abcd1234")
+    url = reverse("project_detail", kwargs={"slug": project.slug})
+
+    add_reports(project, user, 1)
+    response, first_count = page_query_count(url)
+    assert response.status_code == 200
+
+    add_reports(project, user, 3)
+    response, second_count = page_query_count(url)
+    assert response.status_code == 200
+    assert second_count == first_count
+
+
+@pytest.mark.django_db
+def test_project_edit_query_count(client, project, user, page_query_count):
+    """The number of queries needed to render the edit form should not
+    depend on the number of reports."""
+
+    client.login(username=user.username, password="Abcd1234")
+    url = reverse("EditProject", kwargs={"slug": project.slug})
+
+    add_reports(project, user, 1)
+    response, first_count = page_query_count(url)
+    assert response.status_code == 200
+
+    add_reports(project, user, 3)
+    response, second_count = page_query_count(url)
+    assert response.status_code == 200
+    assert second_count == first_count
+
+
+@pytest.mark.django_db
+def test_sync_status_repairs_drift(project):
+    """If the status column does not agree with the milestones,
+    get_status_drift() should report it and sync_status() should fix it."""
+
+    project.approve()
+    Project.objects.filter(pk=project.pk).update(status="submitted")
+
+    drift = Project.get_status_drift()
+    assert drift == [
+        dict(
+            id=project.id,
+            prj_cd=project.prj_cd,
+            status="submitted",
+            expected_status="ongoing",
+        )
+    ]
+
+    Project.sync_status()
+    project.refresh_from_db()
+    assert project.status == "ongoing"
+    assert Project.get_status_drift() == []
+
+
+@pytest.mark.django_db
+def test_milestone_save_updates_status(project):
+    """Completing the sign off milestone directly should update the
+    status column of the project."""
+
+    prjms = ProjectMilestones.objects.get(
+        project=project, milestone__label__iexact="Sign Off"
+    )
+    prjms.completed = datetime.datetime.now(pytz.utc)
+    prjms.save()
+
+    project.refresh_from_db()
+    assert project.status == "complete"
+    assert project.is_complete() is True
+
+
+@pytest.mark.django_db
+def test_status_migration_repairs_legacy_rows(project):
+    """Projects approved or signed off by updating their milestones
+    directly (without updating the status) should report the right
+    status after the 0014 data migration has been applied."""
+
+    from django.apps import apps
+    from importlib import import_module
+
+    migration = import_module("pjtk2.migrations.0014_sync_project_status")
+
+    now = datetime.datetime.now(pytz.utc)
+    ProjectMilestones.objects.filter(
+        project=project, milestone__label="Approved"
+    ).update(completed=now)
+    Project.objects.filter(pk=project.pk).update(status="submitted")
+
+    project = Project.objects.get(pk=project.pk)
+    assert project.is_approved() is False
+
+    migration.sync_project_status(apps, None)
+
+    project = Project.objects.get(pk=project.pk)
+    assert project.status == "ongoing"
+    assert project.is_approved() is True
+    assert project.is_complete() is False
+    assert Project.get_status_drift() == []
@@ -3,15 +3,23 @@ import datetime
 import pytest
 import pytz
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.db.models.signals import pre_save
-from pjtk2.models import ProjectMilestones, send_notice_prjms_changed
+from django.template import Context, Template
+from pjtk2.models import Bookmark, ProjectMilestones, send_notice_prjms_changed
 from pjtk2.templatetags.pjtk2_tags import (
     fisheye_button,
     highlight_status,
     milestone_status_glyph,
+    with_milestone_status,
 )
 
-from .factories import MilestoneFactory, ProjectFactory, ProjTypeFactory
+from .factories import (
+    MilestoneFactory,
+    ProjectFactory,
+    ProjTypeFactory,
+    UserFactory,
+)
 
 
 def get_project_link_url(label):
@@ -219,3 +227,73 @@ def test_milestone_status_glyph():
 
     for pair in should_be:
         assert milestone_status_glyph(pair[0]) == pair[1]
+
+
+BOOKMARK_TEMPLATE = (
+    "{% load pjtk2_tags %}"
+    "{% for project in projects %}"
+    "{% if_bookmarked user project %}Y{% else %}N{% endif_bookmarked %}"
+    "{% endfor %}"
+)
+
+
+@pytest.mark.django_db
+def test_if_bookmarked(django_assert_num_queries):
+    """The if_bookmarked tag should render the first block for bookmarked
+    projects and the else block for the others - the user's bookmarks
+    should only be retrieved once."""
+
+    user = UserFactory.create(username="hsimpson")
+    projects = [
+        ProjectFactory.create(prj_cd="LHA_IA12_{:03d}".format(i), owner=user)
+        for i in range(4)
+    ]
+    Bookmark.objects.create(user=user, project=projects[1])
+    Bookmark.objects.create(user=user, project=projects[3])
+
+    template = Template(BOOKMARK_TEMPLATE)
+    with django_assert_num_queries(1):
+        rendered = template.render(Context({"user": user, "projects": projects}))
+    assert rendered == "NYNY"
+
+
+@pytest.mark.django_db
+def test_if_bookmarked_anonymous_user(django_assert_num_queries):
+    """Anonymous users haven't bookmarked anything."""
+
+    project = ProjectFactory.create(prj_cd="LHA_IA12_111")
+
+    template = Template(BOOKMARK_TEMPLATE)
+    with django_assert_num_queries(0):
+        rendered = template.render(
+            Context({"user": AnonymousUser(), "projects": [project]})
+        )
+    assert rendered == "N"
+
+
+@pytest.mark.django_db
+def test_with_milestone_status(django_assert_num_queries):
+    """with_milestone_status should attach the milestone status
+    dictionary to each project using one query for all of them."""
+
+    approved = MilestoneFactory.create(
+        label="Approved", label_abbrev="approved", category="Core", order=1
+    )
+    projects = [
+        ProjectFactory.create(prj_cd="LHA_IA12_{:03d}".format(i)) for i in range(2)
+    ]
+    merge_data(projects[1], approved)
+
+    with django_assert_num_queries(1):
+        projects = with_milestone_status(projects)
+
+    assert [x.milestone_status for x in projects] == [
+        {
+            "approved": {"status": "required-notDone", "type": "milestone"},
+            "custom": {"status": "notRequired-notDone", "type": "report"},
+        },
+        {
+            "approved": {"status": "required-done", "type": "milestone"},
+            "custom": {"status": "notRequired-notDone", "type": "report"},
+        },
+    ]
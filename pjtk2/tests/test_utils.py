@@ -1,6 +1,14 @@
+import datetime
+
 import pytest
+import pytz
 
-from ..utils.helpers import strip_carriage_returns, make_possessive
+from ..utils.helpers import (
+    LinkRewriter,
+    build_milestone_status,
+    strip_carriage_returns,
+    make_possessive,
+)
 
 
 def test_strip_carriage_returns():
@@ -41,3 +49,104 @@ def test_make_posssive():
     """
     assert make_possessive("Bob") == "Bob's"
     assert make_possessive("Chris") == "Chris'"
+
+
+def test_build_milestone_status():
+    """build_milestone_status should return a dictionary of two letter
+    status codes keyed by project id and then milestone id.  Custom
+    milestones are combined into a single 'custom' entry.
+    """
+
+    now = datetime.datetime.now(pytz.utc)
+
+    project_milestones = [
+        dict(
+            project_id=1,
+            milestone_id=10,
+            milestone__category="Core",
+            required=True,
+            completed=now,
+        ),
+        dict(
+            project_id=1,
+            milestone_id=11,
+            milestone__category="Core",
+            required=True,
+            completed=None,
+        ),
+        dict(
+            project_id=1,
+            milestone_id=12,
+            milestone__category="Core",
+            required=False,
+            completed=now,
+        ),
+        dict(
+            project_id=1,
+            milestone_id=20,
+            milestone__category="Custom",
+            required=True,
+            completed=None,
+        ),
+        dict(
+            project_id=2,
+            milestone_id=10,
+            milestone__category="Core",
+            required=False,
+            completed=None,
+        ),
+        dict(
+            project_id=2,
+            milestone_id=20,
+            milestone__category="Custom",
+            required=True,
+            completed=now,
+        ),
+        dict(
+            project_id=3,
+            milestone_id=10,
+            milestone__category="Core",
+            required=True,
+            completed=None,
+        ),
+    ]
+
+    status = build_milestone_status(project_milestones)
+
+    assert status[1] == {"10": "RD", "11": "RN", "12": "ND", "custom": "RN"}
+    assert status[2] == {"10": "NN", "custom": "RD"}
+    assert status[3] == {"10": "RN", "custom": "NN"}
+
+
+LINK_PATTERNS = [
+    {
+        "pattern": r"project: ?([a-zA-Z]{3}\_[a-zA-Z]{2}\d{2}\_[a-zA-Z0-9]{3})",
+        "url": r'<a href="/projects/projectdetail/{0}">{1}</a>',
+    },
+    {"pattern": r"ticket:\s?(\d+)", "url": r'<a href="/tickets/\1">ticket \1</a>'},
+]
+
+
+def test_link_rewriter():
+    """Project codes and tickets should be replaced with links - project
+    codes with underscores that markdown converted to ems too."""
+
+    rewriter = LinkRewriter(LINK_PATTERNS)
+    text = "<p>see project: LHA<em>IA11</em>123 and ticket: 12</p>"
+
+    shouldbe = (
+        '<p>see project: <a href="/projects/projectdetail/lha_ia11_123">'
+        + 'LHA_IA11_123</a> and <a href="/tickets/12">ticket 12</a></p>'
+    )
+    assert rewriter.rewrite(text) == shouldbe
+
+
+def test_link_rewriter_repeated_project():
+    """A project code that appears more than once should be replaced
+    with one link each time - links should not be nested."""
+
+    rewriter = LinkRewriter(LINK_PATTERNS)
+    text = "project: LHA_IA11_123, project:lha_ia11_123"
+
+    link = '<a href="/projects/projectdetail/lha_ia11_123">LHA_IA11_123</a>'
+    assert rewriter.rewrite(text) == "project: {0}, project:{0}".format(link)
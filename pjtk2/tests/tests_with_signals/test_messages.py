@@ -9,7 +9,9 @@ ProjectMilestones table.
 import datetime
 import pytz
 import time
+from io import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase
 
 from pjtk2.models import *
@@ -1078,3 +1080,197 @@ class TestSumbittedMessage(TestCase):
 
         self.assertEqual(1, len(Georges_msgs))
         self.assertIn("Submitted", Jerrys_msgs[0].message.msgtxt)
+
+
+@pytest.fixture
+def transition_project(db):
+    """A project owned by an employee (with a supervisor) and with three
+    project milestones that have not been completed."""
+
+    boss = UserFactory(first_name="Jerry", last_name="Seinfield", username="jseinfield")
+    owner = UserFactory(first_name="George", last_name="Costanza", username="gcostanza")
+    dba = UserFactory(first_name="Cosmo", last_name="Kramer", username="ckramer")
+    boss_employee = EmployeeFactory(user=boss)
+    EmployeeFactory(user=owner, supervisor=boss_employee)
+
+    for i, label in enumerate(["Field Work", "Data Scrubbed", "Data Merged"]):
+        MilestoneFactory.create(label=label, category="Core", order=i, report=False)
+
+    project = ProjectFactory.create(
+        prj_cd="LHA_IA12_111", prj_ldr=owner, owner=owner, dba=dba
+    )
+    return project
+
+
+@pytest.mark.django_db
+def test_transition_sends_one_batch_of_messages(transition_project):
+    """Completing several project milestones with transition() should
+    update them together and send one message per milestone to each
+    recipient."""
+
+    project = transition_project
+    prjms_ids = list(
+        ProjectMilestones.objects.filter(
+            project=project,
+            milestone__label__in=["Field Work", "Data Scrubbed", "Data Merged"],
+        ).values_list("id", flat=True)
+    )
+    now = datetime.datetime.now(pytz.utc)
+
+    changed = ProjectMilestones.objects.transition(prjms_ids, completed=now)
+    assert len(changed) == 3
+
+    completed = ProjectMilestones.objects.filter(
+        id__in=prjms_ids, completed__isnull=False
+    )
+    assert completed.count() == 3
+
+    messages = Message.objects.filter(project_milestone__project=project)
+    assert sorted([x.msgtxt for x in messages]) == [
+        "Data Merged",
+        "Data Scrubbed",
+        "Field Work",
+    ]
+    # owner, supervisor and dba for each message
+    assert Messages2Users.objects.filter(message__in=messages).count() == 9
+
+    # nothing should change if they are completed again:
+    assert ProjectMilestones.objects.transition(prjms_ids, completed=now) == []
+    assert Message.objects.filter(project_milestone__project=project).count() == 3
+
+
+@pytest.mark.django_db
+def test_transition_revoked_message(transition_project):
+    """Clearing completed milestones should send a 'revoked' message."""
+
+    project = transition_project
+    prjms = ProjectMilestones.objects.get(
+        project=project, milestone__label="Field Work"
+    )
+    now = datetime.datetime.now(pytz.utc)
+    ProjectMilestones.objects.transition([prjms.id], completed=now)
+    ProjectMilestones.objects.transition([prjms.id], completed=None)
+
+    prjms.refresh_from_db()
+    assert prjms.completed is None
+
+    msgtxt = Message.objects.filter(project_milestone=prjms).values_list(
+        "msgtxt", flat=True
+    )
+    assert "The milestone 'Field Work' has been revoked" in msgtxt
+
+
+@pytest.mark.django_db
+def test_update_milestones_sends_one_batch(transition_project):
+    """Completing some milestones and clearing others with
+    update_milestones() should send milestones_transitioned once, with
+    the recipients found once for the project."""
+
+    from unittest.mock import patch
+
+    from pjtk2.utils.helpers import update_milestones
+
+    project = transition_project
+    milestones = ProjectMilestones.objects.filter(
+        project=project,
+        milestone__label__in=["Field Work", "Data Scrubbed", "Data Merged"],
+    )
+    field_work = milestones.get(milestone__label="Field Work")
+    scrubbed = milestones.get(milestone__label="Data Scrubbed")
+    ProjectMilestones.objects.transition(
+        [field_work.id], completed=datetime.datetime.now(pytz.utc)
+    )
+
+    calls = []
+
+    def receiver(sender, project_milestones, **kwargs):
+        calls.append(sorted([x.milestone.label for x in project_milestones]))
+
+    milestones_transitioned.connect(receiver, sender=ProjectMilestones)
+    try:
+        with patch(
+            "pjtk2.models.build_msg_recipients_by_project",
+            wraps=build_msg_recipients_by_project,
+        ) as recipients:
+            update_milestones([scrubbed.id], milestones)
+    finally:
+        milestones_transitioned.disconnect(receiver, sender=ProjectMilestones)
+
+    assert calls == [["Data Scrubbed", "Field Work"]]
+    assert recipients.call_count == 1
+
+    field_work.refresh_from_db()
+    scrubbed.refresh_from_db()
+    assert field_work.completed is None
+    assert scrubbed.completed is not None
+
+
+@pytest.mark.django_db
+def test_update_milestones_is_atomic(transition_project):
+    """If the changes can't all be applied, none of them should be."""
+
+    from unittest.mock import patch
+
+    from pjtk2.utils.helpers import update_milestones
+
+    project = transition_project
+    milestones = ProjectMilestones.objects.filter(
+        project=project,
+        milestone__label__in=["Field Work", "Data Scrubbed", "Data Merged"],
+    )
+    field_work = milestones.get(milestone__label="Field Work")
+    scrubbed = milestones.get(milestone__label="Data Scrubbed")
+    ProjectMilestones.objects.transition(
+        [field_work.id], completed=datetime.datetime.now(pytz.utc)
+    )
+
+    with patch(
+        "pjtk2.models.ProjectMilestoneStatus.refresh", side_effect=RuntimeError
+    ):
+        with pytest.raises(RuntimeError):
+            update_milestones([scrubbed.id], milestones)
+
+    field_work.refresh_from_db()
+    scrubbed.refresh_from_db()
+    assert field_work.completed is not None
+    assert scrubbed.completed is None
+
+
+@pytest.mark.django_db
+def test_send_message_single_insert(transition_project, django_assert_num_queries):
+    """The recipients of a message should be inserted together and
+    duplicate recipients should be ignored."""
+
+    project = transition_project
+    milestone = Milestone.objects.get(label="Field Work")
+    ProjectMilestones.objects.get_or_create(project=project, milestone=milestone)
+    recipients = build_msg_recipients(project)
+
+    # get_or_create the project milestone, the message and its recipients:
+    with django_assert_num_queries(3):
+        send_message("a fake message.", recipients + recipients, project, milestone)
+
+    message = Message.objects.get(msgtxt="a fake message.")
+    assert Messages2Users.objects.filter(message=message).count() == len(recipients)
+
+
+@pytest.mark.django_db
+def test_send_message_deferred(transition_project, settings):
+    """If delivery is deferred, the message should be queued until
+    send_queued_messages is run."""
+
+    settings.DEFER_MESSAGE_DELIVERY = True
+
+    project = transition_project
+    milestone = Milestone.objects.get(label="Field Work")
+    recipients = build_msg_recipients(project)
+    send_message("a fake message.", recipients, project, milestone)
+
+    message = Message.objects.get(msgtxt="a fake message.")
+    assert Messages2Users.objects.filter(message=message).count() == 0
+    assert MessageJob.objects.filter(message=message).count() == 1
+
+    call_command("send_queued_messages", stdout=StringIO())
+
+    assert Messages2Users.objects.filter(message=message).count() == len(recipients)
+    assert MessageJob.objects.count() == 0
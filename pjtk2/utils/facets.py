@@ -0,0 +1,133 @@
+"""=============================================================
+ ~/pjtk2/utils/facets.py
+
+ DESCRIPTION:
+
+  Faceted counts for the project search page.  The filtered project
+  queryset is wrapped in a common table expression and counted by
+  lake, project type, scope and protocol (plus the grand total) with
+  a single GROUP BY GROUPING SETS query - the filtered set is only
+  scanned once regardless of how many facets are displayed.
+
+  The dictionaries returned for each facet use the same keys as the
+  separate aggregate queries they replace, so the templates do not
+  need to change.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import F
+
+from ..models import ProjectType
+
+
+FACETS_SQL = """
+    WITH filtered AS ({filtered_sql})
+    SELECT
+        GROUPING(lake_id) = 0 AS by_lake,
+        GROUPING(project_type_id) = 0 AS by_project_type,
+        GROUPING(scope) = 0 AS by_scope,
+        GROUPING(protocol_id) = 0 AS by_protocol,
+        lake_id, lake_name, lake_abbrev,
+        project_type_id, project_type_name,
+        scope,
+        protocol_id, protocol_name, protocol_abbrev,
+        COUNT(*) AS total,
+        COUNT(lake_name) AS n_lake,
+        COUNT(project_type_id) AS n_project_type,
+        COUNT(scope) AS n_scope,
+        COUNT(protocol_id) AS n_protocol
+    FROM filtered
+    GROUP BY GROUPING SETS (
+        (lake_id, lake_name, lake_abbrev),
+        (project_type_id, project_type_name),
+        (scope),
+        (protocol_id, protocol_name, protocol_abbrev),
+        ()
+    )
+"""
+
+
+def _get_facet(rows, grouping, key):
+    """Return the rows belonging to one of the grouping sets, sorted by
+    `key` with empty values last - the same order postgres would use."""
+    rows = [x for x in rows if x[grouping]]
+    return sorted(rows, key=lambda x: (x[key] is None, x[key]))
+
+
+def get_project_facets(queryset):
+    """Given a filtered project queryset, return a dictionary containing
+    the total number of projects and the faceted counts by lake,
+    project type, scope and protocol.  Everything is calculated in one
+    query.
+
+    Arguments:
+    - `queryset`: a (filtered) Project queryset.
+
+    """
+
+    filtered = queryset.order_by().values(
+        "lake_id",
+        "project_type_id",
+        "protocol_id",
+        lake_name=F("lake__lake_name"),
+        lake_abbrev=F("lake__abbrev"),
+        project_type_name=F("project_type__project_type"),
+        scope=F("project_type__scope"),
+        protocol_name=F("protocol__protocol"),
+        protocol_abbrev=F("protocol__abbrev"),
+    )
+    try:
+        filtered_sql, params = filtered.query.sql_with_params()
+    except EmptyResultSet:
+        # the filters can't match anything (e.g. - an empty __in list)
+        rows = []
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute(FACETS_SQL.format(filtered_sql=filtered_sql), params)
+            columns = [col[0] for col in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    scope_lookup = dict(ProjectType.PROJECT_SCOPE_CHOICES)
+
+    facets = dict(total=0)
+
+    facets["lakes"] = [
+        dict(lakeName=x["lake_name"], lakeAbbrev=x["lake_abbrev"], N=x["n_lake"])
+        for x in _get_facet(rows, "by_lake", "lake_id")
+    ]
+
+    facets["project_types"] = [
+        dict(
+            projType=x["project_type_name"],
+            projTypeId=x["project_type_id"],
+            N=x["n_project_type"],
+        )
+        for x in _get_facet(rows, "by_project_type", "project_type_id")
+    ]
+
+    facets["project_scope"] = [
+        dict(projScope=x["scope"], name=scope_lookup.get(x["scope"]), N=x["n_scope"])
+        for x in _get_facet(rows, "by_scope", "scope")
+    ]
+
+    facets["protocols"] = [
+        dict(
+            projProtocol=x["protocol_name"],
+            protocolAbbrev=x["protocol_abbrev"],
+            N=x["n_protocol"],
+        )
+        for x in _get_facet(rows, "by_protocol", "protocol_id")
+    ]
+
+    # the empty grouping set is the grand total
+    groupings = ["by_lake", "by_project_type", "by_scope", "by_protocol"]
+    for row in rows:
+        if not any([row[x] for x in groupings]):
+            facets["total"] = row["total"]
+
+    return facets
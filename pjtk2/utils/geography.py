@@ -0,0 +1,81 @@
+"""=============================================================
+ ~/pjtk2/utils/geography.py
+
+ DESCRIPTION:
+
+  Database functions used to compare our geometries (all stored in
+  WGS84 - srid 4326) using distances in metres.  The geometries are
+  cast to geography so PostGIS calculates the distances on the
+  spheroid, rather than transforming and buffering the geometries in
+  a separate query.  Geography is also used in the expression indexes
+  on the sample point and multipoint geometries, so that ST_DWithin
+  can use them.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.contrib.gis.db.models import GeometryField
+from django.db.models import BooleanField, Func, Value
+
+
+class Geography(Func):
+    """Cast a geometry to geography - (geom)::geography."""
+
+    template = "(%(expressions)s)::geography"
+    output_field = GeometryField(geography=True)
+
+
+class Geometry(Func):
+    """Cast a geography back to geometry - (geog)::geometry."""
+
+    template = "(%(expressions)s)::geometry"
+    output_field = GeometryField(srid=4326)
+
+
+class GeogFromText(Func):
+    """Create a geography from (e)wkt."""
+
+    function = "ST_GeogFromText"
+    output_field = GeometryField(geography=True)
+
+
+def geog_from_geometry(geom):
+    """Return an expression for a geos geometry as geography."""
+    return GeogFromText(Value(geom.ewkt))
+
+
+class DWithin(Func):
+    """Is field within distance metres of geom (a geos geometry)?"""
+
+    function = "ST_DWithin"
+    output_field = BooleanField()
+
+    def __init__(self, field, geom, distance):
+        super().__init__(
+            Geography(field), geog_from_geometry(geom), Value(float(distance))
+        )
+
+
+class WithinBuffer(Func):
+    """Is all of field within distance metres of geom (a geos geometry)?
+
+    The point is buffered on geography (so the buffer is distance
+    metres wide everywhere) and the buffer is cast back to geometry.
+    ST_Within is then evaluated on geometry - unlike the geography
+    version of ST_Covers, it works for points, multipoints and
+    polygons alike.
+    """
+
+    function = "ST_Within"
+    output_field = BooleanField()
+
+    def __init__(self, field, geom, distance):
+        buffer = Func(
+            geog_from_geometry(geom),
+            Value(float(distance)),
+            function="ST_Buffer",
+            output_field=GeometryField(geography=True),
+        )
+        super().__init__(field, Geometry(buffer))
@@ -0,0 +1,90 @@
+"""=============================================================
+ ~/pjtk2/utils/geojson_stream.py
+
+ DESCRIPTION:
+
+  Functions used to stream sample points as a GeoJSON feature
+  collection.  Each feature is built by PostGIS (with
+  json_build_object and ST_AsGeoJSON) and the rows are read from a
+  server-side cursor a chunk at a time, so neither the SamplePoint
+  instances nor the complete response are ever held in memory.  The
+  properties of each feature match the fields of
+  ProjectPointSerializer.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.db import connection
+
+from ..models import Project, ProjectType, SamplePoint
+
+# the number of features read from the database at a time:
+CHUNK_SIZE = 2000
+
+
+FEATURE_SQL = """
+SELECT json_build_object(
+    'type', 'Feature',
+    'geometry', ST_AsGeoJSON(pt.geom)::json,
+    'properties', json_build_object(
+        'prj_cd', prj.prj_cd,
+        'label', pt.label,
+        'dd_lat', ST_Y(pt.geom),
+        'dd_lon', ST_X(pt.geom),
+        'popup_text', CASE WHEN COALESCE(pt.label, '') = '' THEN prj.prj_cd
+            ELSE prj.prj_cd || ' - ' || pt.label END,
+        'project_type', ptype.project_type
+    )
+)::text
+FROM {points} pt
+JOIN {projects} prj ON prj.id = pt.project_id
+LEFT JOIN {project_types} ptype ON ptype.id = prj.project_type_id
+WHERE pt.id IN ({ids})
+"""
+
+
+def iter_point_features(points, chunk_size=CHUNK_SIZE):
+    """Yield the GeoJSON feature (as a string) of each sample point in
+    the queryset points."""
+
+    ids_sql, ids_params = points.order_by().values("id").query.sql_with_params()
+    sql = FEATURE_SQL.format(
+        points=connection.ops.quote_name(SamplePoint._meta.db_table),
+        projects=connection.ops.quote_name(Project._meta.db_table),
+        project_types=connection.ops.quote_name(ProjectType._meta.db_table),
+        ids=ids_sql,
+    )
+
+    # a named (server-side) cursor so the rows are sent in chunks:
+    cursor = connection.chunked_cursor()
+    try:
+        cursor.execute(sql, ids_params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+    finally:
+        cursor.close()
+
+
+def stream_feature_collection(points, chunk_size=CHUNK_SIZE):
+    """Yield the pieces of a GeoJSON feature collection containing the
+    sample points in the queryset points - one string for every
+    chunk_size features."""
+
+    yield '{"type": "FeatureCollection", "features": ['
+    chunk = []
+    separator = ""
+    for feature in iter_point_features(points, chunk_size):
+        chunk.append(feature)
+        if len(chunk) >= chunk_size:
+            yield separator + ",".join(chunk)
+            separator = ","
+            chunk = []
+    if chunk:
+        yield separator + ",".join(chunk)
+    yield "]}"
@@ -63,16 +63,153 @@ def strip_carriage_returns(my_string):
     return "".join(my_lines).strip()
 
 
+def make_prefix_search_query(search, config="english"):
+    """
+    Convert the text entered in a search box into a full text search
+    query that matches projects containing every word (or word prefix)
+    that was entered.  "walleye ind" will match projects that contain
+    both 'walleye' and a word that starts with 'ind'.
+
+    Punctuation (including the underscores in project codes) is used
+    to split the search string into words, so searching for
+    "LHA_IA12" matches the vector built from the project code.
+
+    Returns None if the search string does not contain any words.
+
+    Arguments:
+    - `search`: the string entered by the user.
+    - `config`: the text search configuration used to normalize the terms.
+
+    """
+    from django.contrib.postgres.search import SearchQuery
+
+    terms = re.findall(r"[^\W_]+", search or "")
+    if not terms:
+        return None
+    query = " & ".join(["{}:*".format(term.lower()) for term in terms])
+    return SearchQuery(query, config=config, search_type="raw")
+
+
+HIERARCHY_CACHE_VERSION_KEY = "pjtk2_employee_hierarchy_version"
+
+SUPERVISORS_SQL = """
+    WITH RECURSIVE bosses(id, supervisor_id, depth, ids) AS (
+        SELECT id, supervisor_id, 0, ARRAY[id]
+        FROM {employee}
+        WHERE id = %s
+      UNION ALL
+        SELECT emp.id, emp.supervisor_id, bosses.depth + 1, bosses.ids || emp.id
+        FROM {employee} emp
+        JOIN bosses ON emp.id = bosses.supervisor_id
+        WHERE NOT emp.id = ANY(bosses.ids)
+    )
+    SELECT id FROM bosses ORDER BY depth
+"""
+
+MINIONS_SQL = """
+    WITH RECURSIVE minions(id, path, ids) AS (
+        SELECT emp.id, ARRAY[usr.username::text], ARRAY[emp.id]
+        FROM {employee} emp
+        JOIN {user} usr ON usr.id = emp.user_id
+        WHERE emp.id = %s
+      UNION ALL
+        SELECT emp.id, minions.path || usr.username::text, minions.ids || emp.id
+        FROM {employee} emp
+        JOIN {user} usr ON usr.id = emp.user_id
+        JOIN minions ON emp.supervisor_id = minions.id
+        WHERE NOT emp.id = ANY(minions.ids)
+    )
+    SELECT id FROM minions ORDER BY path
+"""
+
+HIERARCHY_SQL = {"supervisors": SUPERVISORS_SQL, "minions": MINIONS_SQL}
+
+
+def _hierarchy_cache_timeout():
+    """Return the number of seconds that resolved employee hierarchies
+    should be cached for.  Caching is off unless
+    EMPLOYEE_HIERARCHY_CACHE_TIMEOUT is set - it should only be turned
+    on if all of the processes share the same cache backend, otherwise
+    changes to an employee's supervisor will not be seen by the other
+    processes until the timeout expires.
+    """
+    from django.conf import settings
+
+    return getattr(settings, "EMPLOYEE_HIERARCHY_CACHE_TIMEOUT", 0)
+
+
+def clear_employee_hierarchy_cache():
+    """Invalidate any cached supervisor and minion lists.  Called
+    whenever an employee is saved or deleted.  Rather than tracking
+    every key, the version number embedded in the keys is incremented.
+    """
+    from django.core.cache import cache
+
+    if not _hierarchy_cache_timeout():
+        return
+    try:
+        cache.incr(HIERARCHY_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(HIERARCHY_CACHE_VERSION_KEY, 1, None)
+
+
+def _get_hierarchy_ids(direction, employee_id):
+    """Run the recursive query for `direction` (either "supervisors" or
+    "minions") for the employee with the given id and return the list of employee ids in the
+    order they were returned.  If caching is enabled, the list is
+    stored under a key that includes the current hierarchy version.
+    """
+
+    from django.core.cache import cache
+    from django.db import connection
+    from pjtk2.models import Employee, User
+
+    sql = HIERARCHY_SQL[direction].format(
+        employee=connection.ops.quote_name(Employee._meta.db_table),
+        user=connection.ops.quote_name(User._meta.db_table),
+    )
+
+    timeout = _hierarchy_cache_timeout()
+    if timeout:
+        version = cache.get_or_set(HIERARCHY_CACHE_VERSION_KEY, 1, None)
+        key = "pjtk2_employee_hierarchy:{}:{}:{}".format(
+            version, direction, employee_id
+        )
+        ids = cache.get(key)
+        if ids is not None:
+            return ids
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [employee_id])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    if timeout:
+        cache.set(key, ids, timeout)
+
+    return ids
+
+
+def _get_employees_by_id(ids):
+    """Given a list of employee ids, return the corresponding employees
+    (with their users) in the same order - using one query."""
+
+    from pjtk2.models import Employee
+
+    employees = Employee.all_objects.select_related("user").in_bulk(ids)
+    return [employees[x] for x in ids if x in employees]
+
+
 def get_supervisors(employee):
     """
     Given an employee object, return a list of supervisors.  the first
     element of list will be the intial employee.
+
+    The whole chain of supervisors is resolved with a single recursive
+    query, regardless of how deep the employee is in the hierarchy.
     """
 
-    if employee.supervisor:
-        return [employee] + get_supervisors(employee.supervisor)
-    else:
-        return [employee]
+    ids = _get_hierarchy_ids("supervisors", employee.id)
+    return _get_employees_by_id(ids)
 
 
 def get_minions(employee):
@@ -80,13 +217,15 @@ def get_minions(employee):
     Given an employee objects, return a list of employees under his/her
     supervision.  The first element of list will be the intial
     employee.
+
+    Like get_supervisors(), the entire tree below the employee is
+    resolved with one recursive query.  Employees are returned depth
+    first, with employees reporting to the same supervisor sorted by
+    username.
     """
 
-    ret = [employee]
-    for minion in employee.employee_set.all():
-        # ret.append(get_minions(minion))
-        ret.extend(get_minions(minion))
-    return ret
+    ids = _get_hierarchy_ids("minions", employee.id)
+    return _get_employees_by_id(ids)
 
 
 def my_messages(user, all=False):
@@ -137,38 +276,83 @@ given  notification message, pull out the project, url, id and
     return initial
 
 
+class LinkRewriter(object):
+    """
+    Replace string patterns in text with hyperlinks.  link_patterns is
+    a list of two element dictionaries.  Each dictionary must have keys
+    'pattern' and 'url'.  'pattern' is the regular expression to apply
+    to the text while url is the text to be used as its replacement.
+    Regular expression call backs are supported.  See the python
+    documentation for re.sub for more details.
+
+    Patterns that refer to projects ('project: LHA_IA12_123') are
+    treated differently - the project code (the first group in the
+    pattern) is replaced with a link built from url using the lower
+    case project code for the link and the upper case project code for
+    its text.
+
+    The regular expressions are compiled once when the rewriter is
+    created, and each pattern is applied to the text in a single pass
+    so that the same rewriter can be used to render the html of any
+    number of projects.
+
+    Note: The rewriter does not make any attempt to validate the link or
+    the regex pattern.
+
+    """
+
+    # markdown replaces _ with ems - they need to be replaced first:
+    EM_REGEX = re.compile(r"</?em>")
+
+    def __init__(self, link_patterns):
+        self.patterns = []
+        for pattern in link_patterns or []:
+            regex = re.compile(pattern.get("pattern"), re.IGNORECASE)
+            is_project = "project:" in pattern.get("pattern")
+            self.patterns.append((regex, pattern["url"], is_project))
+
+    def _project_link(self, url):
+        """Return a callback for regex.sub() that replaces the project code
+        in the match with a link."""
+
+        def link(match):
+            prj_cd = match.group(1)
+            href = url.format(prj_cd.lower(), prj_cd.upper())
+            start = match.start(1) - match.start(0)
+            end = match.end(1) - match.start(0)
+            return match.group(0)[:start] + href + match.group(0)[end:]
+
+        return link
+
+    def rewrite(self, text):
+        """Return text with each of our patterns replaced by its link."""
+        for regex, url, is_project in self.patterns:
+            if is_project:
+                text = self.EM_REGEX.sub("_", text)
+                text = regex.sub(self._project_link(url), text)
+            else:
+                text = regex.sub(url, text)
+        return text
+
+
+_link_rewriters = {}
+
+
 def replace_links(text, link_patterns):
     """
     A little function that will replace string patterns in text with
     supplied hyperlinks.  'text' is just a string, most often a field
-    in a django or flask model.  link_pattern is a list of two element
-    dictionaries.  Each dicationary must have keys 'pattern' and
-    'url'.  'pattern' is the regular expression to apply to the text
-    while url is the text to be used as its replacement.  Regular
-    expression call backs are supported.  See the python documentation
-    for re.sub for more details.
-
-    Note: The function does not make any attempt to validate the link or
-    the regex pattern.
+    in a django or flask model.  See LinkRewriter for the format of
+    link_patterns.  A rewriter is compiled the first time a set of link
+    patterns is used and re-used after that.
 
     """
 
-    import re
-    from markdown2 import markdown
-
-    for pattern in link_patterns:
-        regex = re.compile(pattern.get("pattern"), re.IGNORECASE)
-        if "project:" in pattern.get("pattern"):
-            # mark down replace _ with ems - replace them first:
-            text = re.sub(r"</?em>", "_", text)
-            prj_codes = regex.findall(text)
-            for x in prj_codes:
-                link = pattern["url"]
-                href = link.format(x.lower(), x.upper())
-                text = text.replace(x, href)
-        else:
-            text = re.sub(regex, pattern["url"], text)
-    return text
+    key = tuple((x.get("pattern"), x.get("url")) for x in link_patterns or [])
+    rewriter = _link_rewriters.get(key)
+    if rewriter is None:
+        rewriter = _link_rewriters[key] = LinkRewriter(link_patterns)
+    return rewriter.rewrite(text)
 
 
 def get_or_none(model, **kwargs):
@@ -213,10 +397,7 @@ def is_manager(user):
     #     #    manager = False
     # return manager
 
-    manager = False
-    if hasattr(user, "employee"):
-        manager = True if user.employee.role == "manager" else False
-    return manager
+    return get_employee_role(user) == "manager"
 
 
 def is_dba(user):
@@ -224,10 +405,50 @@ def is_dba(user):
     A simple little function to find out if the supplied user is a
     project tracker dba.
     """
-    dba = False
-    if hasattr(user, "employee"):
-        dba = True if user.employee.role == "dba" else False
-    return dba
+    return get_employee_role(user) == "dba"
+
+
+def get_employee_role(user):
+    """
+    Return the role of the employee associated with user, or None if
+    the user is not an employee.  The role is remembered on the user
+    object so is_manager() and is_dba() only look up the employee once
+    per request regardless of how often they are called.
+    """
+
+    if user is None:
+        return None
+
+    role = getattr(user, "_employee_role", False)
+    if role is False:
+        role = user.employee.role if hasattr(user, "employee") else None
+        user._employee_role = role
+    return role
+
+
+def get_bookmarked_ids(user):
+    """
+    Return the set of ids of the projects that user has bookmarked.
+    Like the employee role, the set is remembered on the user object so
+    the bookmarks are retrieved at most once per request no matter how
+    many projects are checked.  Anonymous users don't have any
+    bookmarks.
+    """
+
+    from pjtk2.models import Bookmark
+
+    if user is None or user.id is None:
+        return set()
+
+    bookmarked = getattr(user, "_bookmarked_ids", None)
+    if bookmarked is None:
+        bookmarked = set(
+            Bookmark.objects.filter(user__pk=user.id).values_list(
+                "project_id", flat=True
+            )
+        )
+        user._bookmarked_ids = bookmarked
+    return bookmarked
 
 
 def can_edit(user, project):
@@ -235,12 +456,19 @@ def can_edit(user, project):
     Another helper function to see if this user should be allowed
     to edit this project.  In order to edit the use must be either the
     project owner or lead, a manager, a superuser, a dba, or the field lead.
+
+    The answer is cached with the project's other status predicates
+    (see Project.get_status_cache()).
     """
 
-    if project.is_complete():
-        return False
+    status_cache = project.get_status_cache()
+    key = ("can_edit", getattr(user, "pk", None))
+    if key in status_cache:
+        return status_cache[key]
 
-    if user:
+    if project.is_complete():
+        canedit = False
+    elif user:
         canedit = (
             # (user.groups.filter(name="manager").count() > 0)
             (user.is_superuser)
@@ -252,10 +480,8 @@ def can_edit(user, project):
     else:
         canedit = False
 
-    if canedit:
-        return True
-    else:
-        return False
+    status_cache[key] = bool(canedit)
+    return status_cache[key]
 
 
 def get_assignments_with_paths(project, core=True):
@@ -265,8 +491,12 @@ def get_assignments_with_paths(project, core=True):
     report is, whether or not it has been requested for this
     project, and if it is available, a path to the associated
     report.
+
+    The current report of every assignment is retrieved with a single
+    prefetch query rather than one query for each assignment.
     """
 
+    from django.db.models import Prefetch
     from ..models import Report
 
     if core:
@@ -274,12 +504,18 @@ def get_assignments_with_paths(project, core=True):
     else:
         assignments = project.get_custom_assignments()
 
+    assignments = assignments.prefetch_related(
+        Prefetch(
+            "report_set",
+            queryset=Report.objects.filter(current=True),
+            to_attr="current_reports",
+        )
+    )
+
     assign_dicts = []
     for assignment in assignments:
-        try:
-            report = Report.objects.get(projectreport=assignment, current=True)
-        except Report.DoesNotExist:
-            report = None
+        reports = assignment.current_reports
+        report = reports[0] if reports else None
         required = assignment.required
         milestone = assignment.milestone
         category = assignment.milestone.category
@@ -312,32 +548,48 @@ def update_milestones(form_ms, milestones):
     # convert the list of milestones from the form to a set of integers:
     form_ms = set([int(x) for x in form_ms])
 
-    old_completed = milestones.filter(completed__isnull=False)
-    old_outstanding = milestones.filter(completed__isnull=True)
+    now = datetime.datetime.now(pytz.utc)
 
-    old_completed = set([x.id for x in old_completed])
-    old_outstanding = set([x.id for x in old_outstanding])
+    # these ones are now complete (transition_many() ignores any that
+    # already were):
+    added_ms = milestones.filter(id__in=form_ms).values_list("id", flat=True)
+
+    # these ones were done, but now they aren't
+    removed_ms = milestones.exclude(id__in=form_ms).values_list("id", flat=True)
+
+    # both are applied together and send a single batch of notifications:
+    ProjectMilestones.objects.transition_many(
+        completed=added_ms, cleared=removed_ms, timestamp=now
+    )
 
-    now = datetime.datetime.now(pytz.utc)
 
-    # these ones are now complete:
-    added_ms = old_outstanding.intersection(form_ms)
-    # ProjectMilestones.objects.filter(id__in=added_ms).update(completed=now)
+def update_approvals(approved, unapproved):
+    """
+    a helper function to approve and unapprove many projects at once.
+    Both arguments are lists of the ids of 'Approved' project
+    milestones (as used by ApproveProjectsForm2).  All of the changes
+    are applied in a single transaction with one update statement for
+    each list - the status of the affected projects is synced and
+    their notifications are sent as a single batch.  Any ids that are
+    not 'Approved' project milestones are ignored.
 
-    # in order to trigger a signal - we need to loop over each project
-    # milestone, and mannually save them:
-    for prjms_id in added_ms:
-        prjms = ProjectMilestones.objects.get(id=prjms_id)
-        prjms.completed = now
-        prjms.save()
+    Returns a tuple containing the number of project milestones that
+    were approved and unapproved.
 
-    # these ones were done, but now they aren't
-    removed_ms = old_completed.difference(form_ms)
-    # ProjectMilestones.objects.filter(id__in=removed_ms).update(completed=None)
-    for prjms_id in removed_ms:
-        prjms = ProjectMilestones.objects.get(id=prjms_id)
-        prjms.completed = None
-        prjms.save()
+    """
+
+    from ..models import ProjectMilestones
+
+    approval_ms = ProjectMilestones.objects.filter(milestone__label="Approved")
+    approved = approval_ms.filter(id__in=approved).values_list("id", flat=True)
+    unapproved = approval_ms.filter(id__in=unapproved).values_list("id", flat=True)
+
+    now = datetime.datetime.now(pytz.utc)
+    approved, unapproved = ProjectMilestones.objects.transition_many(
+        completed=approved, cleared=unapproved, timestamp=now
+    )
+
+    return len(approved), len(unapproved)
 
 
 def get_sisters_dict(slug):
@@ -383,83 +635,58 @@ def get_sisters_dict(slug):
     return initial
 
 
-def make_proj_ms_dict(proj_ms, milestones):
+def get_milestone_status_code(required, completed):
     """
+    Return the two letter code used by ProjectMilestoneStatus to
+    represent the status of a single project milestone.  The first
+    letter indicates whether or not the milestone is required (R or
+    N), the second whether or not it has been done (D or N).
 
-    # given a list of dictionaries containing project
-    # milesstones return a dictionary keyed by project code that contains
-    # the status of each milestone (represents a row in 'my projects table')
+    """
 
+    code = "R" if required else "N"
+    code += "D" if completed else "N"
+    return code
 
-    Arguments:
-    - `proj_ms`:
-    """
-
-    ms_dict = {}
-    for ms in milestones:
-        ms_dict[ms.label] = {
-            "type": "report" if ms.report else "milestone",
-            "required": False,
-            "completed": False,
-            "status": "notRequired-notDone",
-        }
-
-    # add an empty custom report
-    ms_dict["custom"] = {
-        "type": "report",
-        "required": False,
-        "completed": False,
-        "status": "notRequired-notDone",
-    }
-
-    proj_ms_dict = {}
-
-    for item in proj_ms:
-        prj_cd = item.get("project__prj_cd")
-        proj = proj_ms_dict.get(prj_cd)
-        if proj is None:
-            prj_attrs = {
-                "prj_nm": item["project__prj_nm"],
-                "year": item["project__year"],
-                "slug": item["project__slug"],
-                "prj_cd": item["project__prj_cd"],
-                "prj_ldr": item["project__prj_ldr__username"],
-                "prj_lead": "{} {}".format(
-                    item["project__prj_ldr__first_name"],
-                    item["project__prj_ldr__last_name"],
-                ),
-                "project_type": item["project__project_type__project_type"],
-            }
-            # add our empty milestone entries here. they will be updated on subsequent iterations:
-            proj_ms_dict[prj_cd] = {"attrs": prj_attrs, "milestones": dict(ms_dict)}
+
+def build_milestone_status(project_milestones):
+    """
+    Given an iterable of dictionaries representing project milestones,
+    return a dictionary keyed by project id.  The value for each
+    project is a dictionary of status codes keyed by milestone id (as
+    a string so that it can be stored as json).  Custom milestones are
+    not reported individually - they are combined into a single
+    'custom' entry that is required-done if all of the required custom
+    milestones have been completed.
+
+    Each project milestone dictionary must contain the keys:
+    project_id, milestone_id, milestone__category, required and
+    completed.
+
+    """
+
+    status = {}
+    custom = {}
+
+    for item in project_milestones:
+        project_id = item["project_id"]
+        project_status = status.setdefault(project_id, {})
+        if item["milestone__category"] == "Custom":
+            custom.setdefault(project_id, []).append(item)
+            continue
+        code = get_milestone_status_code(item["required"], item["completed"])
+        project_status[str(item["milestone_id"])] = code
+
+    for project_id, project_status in status.items():
+        milestones = custom.get(project_id)
+        if not milestones:
+            project_status["custom"] = "NN"
+        elif all(x["completed"] is not None for x in milestones if x["required"]):
+            project_status["custom"] = "RD"
         else:
-            proj = proj_ms_dict.pop(prj_cd)
-            # build a dictionary that contains the status of this milestone:
-            status = {
-                "type": "report" if item["milestone__report"] else "milestone",
-                "required": item["required"],
-                "completed": True if item["completed"] else False,
-            }
-            # add status code here - keep logic out of templates:
-            if status["completed"] is True:
-                if status["required"] is True:
-                    status["status"] = "required-done"
-                else:
-                    status["status"] = "notRequired-done"
-            else:
-                if status["required"] is True:
-                    status["status"] = "required-notDone"
-                else:
-                    status["status"] = "notRequired-notDone"
-            # get the project milestones
-            ms = proj.pop("milestones")
-
-            # add our current mileone
-            ms[item["milestone__label"]] = status
-            proj["milestones"] = ms
-            proj_ms_dict[prj_cd] = dict(proj)
-
-    return proj_ms_dict
+            project_status["custom"] = "RN"
+
+    return status
 
 
 def get_projects_for_approval(year, this_year=True):
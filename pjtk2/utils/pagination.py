@@ -0,0 +1,138 @@
+"""=============================================================
+ ~/pjtk2/utils/pagination.py
+
+ DESCRIPTION:
+
+  Helpers used to paginate long project lists without loading every
+  matching project into memory:
+
+  + estimated_count() returns the planner's estimate of the number of
+    rows a queryset will return - used instead of count(*) when an
+    unfiltered list is very large.
+
+  + is_unfiltered() - does a queryset return the same rows as the
+    manager's base queryset (e.g. every active project)?  The estimate
+    is only used if it does - the planner's estimates for filtered
+    queries are much less reliable.
+
+  + get_keyset_page() returns the page of projects that follow a
+    cursor (the prj_date1 and id of the last project on the previous
+    page) - the database can seek directly to the cursor rather than
+    scanning and discarding all of the projects before an offset.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+import datetime
+import json
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+
+
+def estimated_count(queryset):
+    """Return the planner's estimate of the number of rows that queryset
+    will return.  Only the plan is calculated - the query isn't run.
+    Unlike pg_class.reltuples, the estimate accounts for the filters in
+    the manager's base queryset (e.g. active=True).
+
+    Arguments:
+    - `queryset`: a django queryset.
+
+    """
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+
+    # psycopg2 decodes json columns, but not every driver does:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def where_sql(queryset):
+    """Return the compiled where clause (and its parameters) of queryset,
+    or None if the queryset can't return any rows."""
+
+    compiler = queryset.query.get_compiler(using=queryset.db)
+    try:
+        sql, params = compiler.compile(queryset.query.where)
+    except EmptyResultSet:
+        return None
+    return sql, list(params)
+
+
+def is_unfiltered(queryset, base):
+    """Return True if queryset will return the same rows as base - the
+    manager's base queryset (e.g. Project.objects.all(), which only
+    includes active projects).  The where clauses have to match, and
+    queryset can't be distinct or sliced.  select_related() and
+    ordering don't change the rows that are returned.
+
+    Arguments:
+    - `queryset`: a django queryset.
+    - `base`: the unfiltered queryset to compare it to.
+
+    """
+
+    query = queryset.query
+    if query.distinct or query.low_mark != 0 or query.high_mark is not None:
+        return False
+    sql = where_sql(queryset)
+    return sql is not None and sql == where_sql(base)
+
+
+def make_cursor(project):
+    """Return the cursor string for a project - its end date and id."""
+    return "{:%Y-%m-%d}_{}".format(project.prj_date1, project.id)
+
+
+def parse_cursor(cursor):
+    """Split a cursor string into a date and an id.  Returns None if the
+    cursor is not valid."""
+
+    try:
+        prj_date1, id = cursor.split("_")
+        prj_date1 = datetime.datetime.strptime(prj_date1, "%Y-%m-%d").date()
+        id = int(id)
+    except (AttributeError, ValueError):
+        return None
+    return prj_date1, id
+
+
+def get_keyset_page(queryset, cursor, page_size):
+    """Return the projects in queryset that come after the cursor (ordered
+    by -prj_date1, -id), and the cursor for the next page (or None if
+    this is the last page).
+
+    Arguments:
+    - `queryset`: a Project queryset
+    - `cursor`: a cursor string returned by make_cursor() or None for
+       the first page.
+    - `page_size`: the number of projects to return.
+
+    """
+
+    queryset = queryset.order_by("-prj_date1", "-id")
+
+    position = parse_cursor(cursor)
+    if position is not None:
+        prj_date1, id = position
+        queryset = queryset.filter(
+            Q(prj_date1__lt=prj_date1) | Q(prj_date1=prj_date1, id__lt=id)
+        )
+
+    # get one extra project so we know if there is another page:
+    projects = list(queryset[: page_size + 1])
+    if len(projects) > page_size:
+        projects = projects[:page_size]
+        next_cursor = make_cursor(projects[-1])
+    else:
+        next_cursor = None
+
+    return projects, next_cursor
@@ -0,0 +1,118 @@
+"""=============================================================
+ ~/pjtk2/utils/point_ingestion.py
+
+ DESCRIPTION:
+
+  Functions used to read spatial points from uploaded csv or xlsx
+  files and insert them into the sample point table without holding
+  the whole file (or every SamplePoint instance) in memory.  The rows
+  of each file are returned by a generator and the points are written
+  to the database in chunks using PostgreSQL's COPY.  These are used
+  by SpatialPointUploadForm and the load_sample_points management
+  command.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+import csv
+import io
+from itertools import islice
+
+from django.db import connection, transaction
+from openpyxl import load_workbook
+
+from ..models import SamplePoint
+
+# the number of points written with each COPY statement:
+CHUNK_SIZE = 5000
+
+
+def iter_csv_rows(csv_file):
+    """Yield the rows of a (binary) csv file one at a time - skipping
+    empty rows and removing any stray quotes."""
+
+    # encoding catches the byte-order-mark that can cause issues:
+    text = io.TextIOWrapper(csv_file, encoding="utf-8-sig")
+    try:
+        for row in csv.reader(text, delimiter=",", quotechar='"'):
+            if row:
+                yield [x.replace('"', "") for x in row]
+    finally:
+        # don't close the underlying file when the wrapper is collected:
+        text.detach()
+
+
+def iter_xlsx_rows(xlsx_file):
+    """Yield the cell values of each row on the first worksheet of an
+    xlsx file.  The workbook is opened in read-only mode so rows are
+    read as they are needed.  Empty rows are skipped."""
+
+    wb = load_workbook(filename=xlsx_file, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            if any(x is not None for x in row):
+                yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_point_rows(points_file, name):
+    """Return a generator over the rows of points_file - xlsx files are
+    identified by the extension of name, anything else is treated as
+    a csv file."""
+
+    if name.endswith("xlsx"):
+        return iter_xlsx_rows(points_file)
+    return iter_csv_rows(points_file)
+
+
+def copy_sample_points(project_id, points):
+    """Write the points - an iterable of (label, dd_lon, dd_lat) tuples -
+    to the sample point table with a single COPY statement.  Returns
+    the number of points written."""
+
+    srid = SamplePoint._meta.get_field("geom").srid
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for label, dd_lon, dd_lat in points:
+        ewkt = "SRID={};POINT({!r} {!r})".format(srid, dd_lon, dd_lat)
+        writer.writerow([project_id, label, ewkt])
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+
+    sql = "COPY {} (project_id, label, geom) FROM STDIN WITH (FORMAT csv)".format(
+        connection.ops.quote_name(SamplePoint._meta.db_table)
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+    return count
+
+
+def insert_sample_points(project, points, replace=False, chunk_size=CHUNK_SIZE):
+    """Insert the points (an iterable of (label, dd_lon, dd_lat) tuples)
+    for project in chunks so that only chunk_size points are in memory
+    at any one time.  If replace is True, the existing points are
+    deleted first.  Everything happens in a single transaction, and
+    the project's multipoints and convex hull are updated at the end.
+    Returns the number of points inserted."""
+
+    points = iter(points)
+    inserted = 0
+    with transaction.atomic():
+        if replace:
+            SamplePoint.objects.filter(project=project).delete()
+        while True:
+            count = copy_sample_points(project.id, islice(points, chunk_size))
+            if not count:
+                break
+            inserted += count
+
+        project.update_multipoints()
+        project.update_convex_hull()
+
+    return inserted
@@ -0,0 +1,181 @@
+"""=============================================================
+ ~/pjtk2/utils/point_validation.py
+
+ DESCRIPTION:
+
+  Functions used to validate the spatial points uploaded for a
+  project.  Rows are checked one at a time as they are read (so the
+  rows can come from a generator) - the label and coordinates of each
+  row are checked, and the coordinates of the valid rows are compared
+  to the extent of the lake with plain comparisons rather than
+  building a GEOS point and envelope test for each row.  If requested,
+  the points within the extent are also tested against the lake
+  polygon itself using a prepared geometry.
+
+  The errors for each type of problem include the row numbers of the
+  offending points (the header is row 1) so that they can be found
+  and fixed in the original file.
+
+  get_project_lake() returns the lake of a project (or None) so the
+  upload form and load_sample_points command can report projects
+  without a lake rather than failing with an AttributeError.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from common.models import Lake
+from django.contrib.gis.geos import Point
+
+from ..models import SamplePoint
+
+# the number of row numbers to include in each error message:
+MAX_REPORTED_ROWS = 10
+
+
+def format_rows(rows):
+    """Return a string containing the first few row numbers in rows."""
+
+    shown = ", ".join([str(x) for x in rows[:MAX_REPORTED_ROWS]])
+    if len(rows) > MAX_REPORTED_ROWS:
+        shown += " and {} more".format(len(rows) - MAX_REPORTED_ROWS)
+    return "See row(s): {}.".format(shown)
+
+
+def get_project_lake(project):
+    """Return the lake associated with project, or None if it isn't
+    associated with one (or the lake no longer exists)."""
+
+    try:
+        return project.lake
+    except Lake.DoesNotExist:
+        return None
+
+
+class PointValidator(object):
+    """Check uploaded [label, dd_lat, dd_lon] rows and keep track of the
+    rows with problems.  validate() is a generator that yields a
+    (label, dd_lon, dd_lat) tuple for each valid row so that the
+    points can be saved as they are read - errors will contain a
+    message for each type of problem once all of the rows have been
+    checked.
+
+    Arguments:
+    - `lake_geom`: the points must fall within the extent of this
+      geometry (if it isn't None).
+    - `check_polygon`: if True, the points must also fall within
+      lake_geom itself.
+
+    """
+
+    def __init__(self, lake_geom=None, check_polygon=False):
+        self.lake_geom = lake_geom
+        self.extent = lake_geom.extent if lake_geom else None
+        self.prepared = lake_geom.prepared if lake_geom and check_polygon else None
+        self.label_length = SamplePoint._meta.get_field("label").max_length
+
+        self.count = 0
+        self.missing_label = []
+        self.long_label = []
+        self.invalid = []
+        self.out_of_bounds = []
+
+    def in_lake(self, dd_lon, dd_lat):
+        """Is the point within the extent (and polygon if we are
+        checking it) of the lake?"""
+
+        if self.extent is None:
+            return True
+        xmin, ymin, xmax, ymax = self.extent
+        if not (xmin < dd_lon < xmax and ymin < dd_lat < ymax):
+            return False
+        if self.prepared is not None:
+            point = Point(dd_lon, dd_lat, srid=self.lake_geom.srid)
+            return self.prepared.contains(point)
+        return True
+
+    def check(self, row_number, row):
+        """Check a single row.  Return (label, dd_lon, dd_lat) if it is
+        valid, otherwise record the problem and return None."""
+
+        self.count += 1
+        valid = True
+
+        label = row[0] if row else None
+        if label == "" or label is None:
+            self.missing_label.append(row_number)
+            valid = False
+        elif len(str(label)) > self.label_length:
+            self.long_label.append(row_number)
+            valid = False
+
+        try:
+            dd_lat = float(row[1])
+            dd_lon = float(row[2])
+        except (ValueError, TypeError, IndexError):
+            self.invalid.append(row_number)
+            return None
+        if dd_lat != dd_lat or dd_lon != dd_lon:
+            # nan
+            self.invalid.append(row_number)
+            return None
+
+        if not self.in_lake(dd_lon, dd_lat):
+            self.out_of_bounds.append(row_number)
+            valid = False
+
+        return (str(label), dd_lon, dd_lat) if valid else None
+
+    def validate(self, rows, start=2):
+        """Check each of the rows (without the header) and yield the
+        valid points."""
+
+        for row_number, row in enumerate(rows, start=start):
+            point = self.check(row_number, row)
+            if point is not None:
+                yield point
+
+    @property
+    def errors(self):
+        """A list of messages describing the problems found so far."""
+
+        errors = []
+        if self.missing_label:
+            errors.append(
+                "At least one point is missing a label. "
+                + format_rows(self.missing_label)
+            )
+        if self.long_label:
+            errors.append(
+                "At least one point has a label longer than {} characters. ".format(
+                    self.label_length
+                )
+                + format_rows(self.long_label)
+            )
+        if self.invalid:
+            errors.append(
+                "At least one point has an invalid latitude or longitude. "
+                + format_rows(self.invalid)
+            )
+        if self.out_of_bounds:
+            errors.append(
+                "{} of the supplied points are not within the bounds of the lake "
+                "associated with this project. ".format(len(self.out_of_bounds))
+                + format_rows(self.out_of_bounds)
+            )
+        return errors
+
+
+def validate_points(rows, lake_geom=None, check_polygon=False):
+    """Validate the uploaded point rows (without the header).  Returns a
+    two element tuple - the list of (label, dd_lon, dd_lat) tuples for
+    the points if all of the rows are valid (otherwise None), and a list
+    of error messages."""
+
+    validator = PointValidator(lake_geom, check_polygon)
+    points = list(validator.validate(rows))
+    errors = validator.errors
+    if errors:
+        return None, errors
+    return points, errors
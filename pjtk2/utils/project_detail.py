@@ -0,0 +1,176 @@
+"""=============================================================
+ ~/pjtk2/utils/project_detail.py
+
+ DESCRIPTION:
+
+  The ProjectDetailBundle gathers everything needed to render the
+  project detail page - the project, its milestones and reports,
+  funding, tags, images, sisters and the bookmark status of the
+  current user - in a fixed number of queries.  The values are
+  calculated once and exposed as attributes so that the template does
+  not need to call model methods that hit the database each time
+  they are evaluated.
+
+ A. Cottrill
+=============================================================
+
+"""
+
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+
+from ..models import (
+    AssociatedFile,
+    Project,
+    ProjectFunding,
+    ProjectMilestones,
+    Report,
+)
+from .helpers import get_bookmarked_ids
+
+
+class ProjectDetailBundle(object):
+    """A read-only collection of the project attributes used by the
+    project detail page.  All of the project milestones (with their
+    current reports) are retrieved in a single query and then split
+    into milestones, core and custom reporting requirements in python.
+
+    Arguments:
+    - `slug`: the slug of the project to retrieve.
+    - `user`: the user requesting the page - used to determine if the
+       project has been bookmarked.  Can be None.
+
+    """
+
+    def __init__(self, slug, user=None):
+
+        self.project = get_object_or_404(
+            Project.objects.select_related(
+                "prj_ldr",
+                "field_ldr",
+                "owner",
+                "dba",
+                "signoff_by",
+                "project_type",
+                "protocol",
+                "master_database",
+                "lake",
+            ).prefetch_related(
+                "project_team",
+                "tags",
+                "images",
+                Prefetch(
+                    "funding_sources",
+                    queryset=ProjectFunding.objects.select_related("source"),
+                ),
+            ),
+            slug=slug,
+        )
+
+        self.user = user
+
+        project_milestones = (
+            ProjectMilestones.objects.filter(project=self.project)
+            .select_related("milestone")
+            .prefetch_related(
+                Prefetch(
+                    "report_set",
+                    queryset=Report.objects.filter(current=True),
+                    to_attr="current_reports",
+                )
+            )
+            .order_by("milestone__order")
+        )
+        self.project_milestones = list(project_milestones)
+
+        # we already know if the project was approved - so
+        # is_approved() doesn't need to query the project milestones
+        # again if the project has been cancelled.
+        self.project.get_status_cache()["approved"] = self.is_approved
+
+        self.sisters = list(
+            Project.objects.filter(
+                projectsisters__family__projectsisters__project=self.project
+            )
+            .exclude(slug=self.project.slug)
+            .order_by("prj_cd")
+        )
+        self.has_sister = len(self.sisters) > 0
+
+        self.associated_files = list(
+            AssociatedFile.objects.filter(project=self.project)
+        )
+
+        self.bookmarked = self.project.id in get_bookmarked_ids(user)
+
+    def _get_project_milestone(self, label):
+        """Return the project milestone with the given label (case
+        insensitive) or None if it has not been assigned to this project."""
+        label = label.lower()
+        for prjms in self.project_milestones:
+            if prjms.milestone.label.lower() == label:
+                return prjms
+        return None
+
+    def _milestone_completed(self, label):
+        """Return True if the milestone with the given label has been
+        completed for this project, otherwise False."""
+        prjms = self._get_project_milestone(label)
+        return prjms is not None and prjms.completed is not None
+
+    @property
+    def is_approved(self):
+        """Same as Project.is_approved() but without the query."""
+        return self._milestone_completed("Approved")
+
+    @property
+    def is_complete(self):
+        """Same as Project.is_complete() but without the query."""
+        return self._milestone_completed("Sign Off")
+
+    @property
+    def data_merged(self):
+        """Has the 'Data Merged' milestone been completed? Used by the
+        fisheye_button template filter."""
+        return self._milestone_completed("Data Merged")
+
+    @cached_property
+    def milestones(self):
+        """The required milestones that are not reports - equivalent to
+        Project.get_milestones()."""
+        return [
+            x
+            for x in self.project_milestones
+            if x.required and x.milestone.report is False
+        ]
+
+    def _assignment_dict(self, assignment):
+        """Build the same dictionary returned by
+        get_assignments_with_paths() for a single project milestone."""
+        reports = assignment.current_reports
+        return dict(
+            required=assignment.required,
+            category=assignment.milestone.category,
+            milestone=assignment.milestone,
+            report=reports[0] if reports else None,
+        )
+
+    @cached_property
+    def core(self):
+        """The core reporting requirements and their reports (if any)."""
+        return [
+            self._assignment_dict(x)
+            for x in self.project_milestones
+            if x.milestone.report and x.milestone.category == "Core"
+        ]
+
+    @cached_property
+    def custom(self):
+        """The required custom reporting requirements and their reports
+        (if any)."""
+        return [
+            self._assignment_dict(x)
+            for x in self.project_milestones
+            if x.milestone.report and x.required and x.milestone.category != "Core"
+        ]
@@ -12,7 +12,7 @@ A. Cottrill
 =============================================================
 """
 
-from django.db.models import Q
+from django.db.models import BooleanField, Case, Q, Value, When
 from django.contrib.gis.db.models import Collect
 from pjtk2.models import SamplePoint, Project, ProjectPolygon
 
@@ -155,34 +155,38 @@ def find_roi_projects(roi, project_types=None, first_year=None, last_year=None):
             # the convex hull because pojects with less than three points
             # can't have a polygon.
 
-            projects = {}
+            # each candidate project is classified as contained or
+            # overlapping in a single query - the bounding box test
+            # (&&) uses the spatial index on the multipoints to find
+            # the candidates before the exact tests are applied.
 
-            contained = (
-                Project.objects.filter(multipoints__geom__within=roi)
-                .select_related("project_type")
-                .distinct()
-            )
-
-            overlapping = (
-                Project.objects.filter(multipoints__geom__intersects=roi)
-                .exclude(multipoints__geom__within=roi)
+            candidates = (
+                Project.objects.filter(
+                    multipoints__geom__bboverlaps=roi,
+                    multipoints__geom__intersects=roi,
+                )
+                .annotate(
+                    roi_contained=Case(
+                        When(multipoints__geom__within=roi, then=Value(True)),
+                        default=Value(False),
+                        output_field=BooleanField(),
+                    )
+                )
                 .select_related("project_type")
-                .distinct()
             )
 
             if project_types:
-                contained = contained.filter(project_type__in=project_types)
-                overlapping = overlapping.filter(project_type__in=project_types)
-
+                candidates = candidates.filter(project_type__in=project_types)
             if first_year:
-                contained = contained.filter(year__gte=first_year)
-                overlapping = overlapping.filter(year__gte=first_year)
+                candidates = candidates.filter(year__gte=first_year)
             if last_year:
-                contained = contained.filter(year__lte=last_year)
-                overlapping = overlapping.filter(year__lte=last_year)
+                candidates = candidates.filter(year__lte=last_year)
 
-            projects["contained"] = contained
-            projects["overlapping"] = overlapping
+            for project in candidates:
+                if project.roi_contained:
+                    projects["contained"].append(project)
+                else:
+                    projects["overlapping"].append(project)
 
     except AttributeError:
         pass
@@ -0,0 +1,92 @@
+"""=============================================================
+ ~/pjtk2/utils/vector_tiles.py
+
+ DESCRIPTION:
+
+  Functions used to build Mapbox vector tiles (MVT) of the sample
+  points in PostGIS with ST_AsMVT.  The points are filtered with the
+  usual django querysets, but the tile is encoded by the database so
+  the points never have to be loaded into python or serialized as
+  json - this makes it possible to map all of the sample points in
+  a lake at once.
+
+  Requires PostGIS 3.0 or later (for ST_TileEnvelope).
+
+ A. Cottrill
+=============================================================
+
+"""
+
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+
+from ..models import Project, ProjectType, SamplePoint
+
+# the size of each tile in tile coordinates, and the number of those
+# units around the tile that points are included in:
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# the name of the layer in the tiles:
+POINT_LAYER = "points"
+
+
+def tile_bounds(z, x, y, buffer=0):
+    """Return the (west, south, east, north) bounds in decimal degrees of
+    tile z/x/y, expanded by buffer tile units.  Raises a ValueError if
+    the tile does not exist."""
+
+    n = 2 ** z
+    if z < 0 or not (0 <= x < n and 0 <= y < n):
+        raise ValueError("Tile {}/{}/{} does not exist.".format(z, x, y))
+
+    margin = buffer / TILE_EXTENT
+
+    def lon(tile_x):
+        return max(-180.0, min(180.0, tile_x / n * 360.0 - 180.0))
+
+    def lat(tile_y):
+        tile_y = max(0, min(n, tile_y))
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return (lon(x - margin), lat(y + 1 + margin), lon(x + 1 + margin), lat(y - margin))
+
+
+def get_sample_point_tile(points, z, x, y):
+    """Return the vector tile z/x/y (as bytes) of the sample points in
+    the queryset points.  Each point includes its label along with the
+    project code, name, slug and type of its project.  An empty tile is
+    returned if there aren't any points in it."""
+
+    bbox = Polygon.from_bbox(tile_bounds(z, x, y, TILE_BUFFER))
+    bbox.srid = 4326
+    ids_sql, ids_params = (
+        points.filter(geom__bboverlaps=bbox).order_by().values("id").query.sql_with_params()
+    )
+
+    sql = """
+    SELECT ST_AsMVT(tile, %s, %s, 'geom') FROM (
+        SELECT pt.label, prj.prj_cd, prj.prj_nm, prj.slug, ptype.project_type,
+            ST_AsMVTGeom(
+                ST_Transform(pt.geom, 3857), ST_TileEnvelope(%s, %s, %s), %s, %s, true
+            ) AS geom
+        FROM {points} pt
+        JOIN {projects} prj ON prj.id = pt.project_id
+        LEFT JOIN {project_types} ptype ON ptype.id = prj.project_type_id
+        WHERE pt.id IN ({ids})
+    ) AS tile
+    """.format(
+        points=connection.ops.quote_name(SamplePoint._meta.db_table),
+        projects=connection.ops.quote_name(Project._meta.db_table),
+        project_types=connection.ops.quote_name(ProjectType._meta.db_table),
+        ids=ids_sql,
+    )
+    params = [POINT_LAYER, TILE_EXTENT, z, x, y, TILE_EXTENT, TILE_BUFFER]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + list(ids_params))
+        tile = cursor.fetchone()[0]
+
+    return bytes(tile) if tile else b""
@@ -34,7 +34,14 @@ from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 
-from ..models import Project, ProjectMilestones, Milestone, Employee, Bookmark
+from ..models import (
+    Project,
+    ProjectMilestoneStatus,
+    Milestone,
+    milestone_registry,
+    Employee,
+    Bookmark,
+)
 
 from ..forms import (
     ApproveProjectsForm,
@@ -53,47 +60,120 @@ from ..utils.helpers import (
     my_messages,
     get_minions,
     get_sisters_dict,
-    make_proj_ms_dict,
     get_project_filters,
+    update_approvals,
 )
 
 User = get_user_model()
 
 
-def get_proj_ms(project_ids, milestones):
-    """
+def get_milestone_matrix(owner_ids, milestones):
+    """Return a dictionary containing the submitted, approved,
+    cancelled and completed projects owned by the users in owner_ids.
+    Each element is an ordered dictionary keyed by project code that
+    contains the project attributes and the status of each milestone
+    (a row in the 'my projects' table).
+
+    The status of each project is read from the denormalized
+    ProjectMilestoneStatus table so all of the projects and their
+    milestones are retrieved in a single query.  Submitted, approved
+    and cancelled projects are limited to the last five years,
+    completed projects to the last fifteen.
 
     Arguments:
-    - `project_ids`:
+    - `owner_ids`: list of user ids
+    - `milestones`: ordered list of the milestones to report
     """
 
-    project_milestones = (
-        ProjectMilestones.objects.select_related("project", "milestone")
-        # .exclude(
-        #    milestone__label__in=["Approved", "Submitted", "Cancelled", "Sign off"]
-        # )
-        .filter(milestone__in=milestones)
-        .filter(project__pk__in=project_ids)
-        .prefetch_related("project__project_type", "project__prj_ldr")
-        .order_by("-project__year", "project__prj_cd", "milestone__order")
-        .values(
-            "project__prj_cd",
-            "project__prj_nm",
-            "project__year",
-            "project__slug",
-            "project__prj_ldr__first_name",
-            "project__prj_ldr__last_name",
-            "project__prj_ldr__username",
-            "project__project_type__project_type",
-            "milestone__category",
-            "milestone__report",
-            "milestone__label",
-            "required",
-            "completed",
+    this_year = datetime.datetime.now(pytz.utc).year
+
+    status_ids = {}
+    for label in ["Approved", "Sign off"]:
+        try:
+            status_ids[label] = milestone_registry.get(label).id
+        except Milestone.DoesNotExist:
+            status_ids[label] = None
+    approved_id = status_ids["Approved"]
+    signoff_id = status_ids["Sign off"]
+
+    rows = (
+        ProjectMilestoneStatus.objects.filter(
+            project__active=True,
+            project__owner__pk__in=owner_ids,
+            project__year__gte=this_year - 15,
         )
+        .select_related("project", "project__prj_ldr", "project__project_type")
+        .order_by("-project__year", "project__prj_cd")
     )
 
-    return project_milestones
+    matrix = {
+        "submitted": collections.OrderedDict(),
+        "approved": collections.OrderedDict(),
+        "cancelled": collections.OrderedDict(),
+        "complete": collections.OrderedDict(),
+    }
+
+    for row in rows:
+        project = row.project
+        recent = int(project.year) >= this_year - 5
+
+        approved_code = row.get_code(approved_id)
+        signoff_code = row.get_code(signoff_id)
+        approved = row.is_done(approved_id)
+        signedoff = row.is_done(signoff_id)
+
+        groups = []
+        if recent and approved_code and signoff_code and not approved and not signedoff:
+            groups.append("submitted")
+        if project.cancelled:
+            if recent:
+                groups.append("cancelled")
+        elif approved and signoff_code:
+            if not signedoff and recent:
+                groups.append("approved")
+            elif signedoff:
+                groups.append("complete")
+
+        if not groups:
+            continue
+
+        ms_status = collections.OrderedDict()
+        for ms in milestones:
+            code = row.get_code(ms.id) or "NN"
+            ms_status[ms.label] = {
+                "type": "report" if ms.report else "milestone",
+                "required": code[0] == "R",
+                "completed": code[1] == "D",
+                "status": row.STATUS_CODES[code],
+            }
+        ms_status["custom"] = {
+            "type": "report",
+            "required": row.get_code("custom") in ("RD", "RN"),
+            "completed": row.get_code("custom") == "RD",
+            "status": row.get_status("custom"),
+        }
+
+        prj_attrs = {
+            "prj_nm": project.prj_nm,
+            "year": project.year,
+            "slug": project.slug,
+            "prj_cd": project.prj_cd,
+            "prj_ldr": project.prj_ldr.username,
+            "prj_lead": "{} {}".format(
+                project.prj_ldr.first_name, project.prj_ldr.last_name
+            ),
+            "project_type": (
+                project.project_type.project_type if project.project_type else None
+            ),
+        }
+
+        for group in groups:
+            matrix[group][project.prj_cd] = {
+                "attrs": prj_attrs,
+                "milestones": ms_status,
+            }
+
+    return matrix
 
 
 # ==========================
@@ -137,10 +217,21 @@ def approveprojects2(request):
         )
 
         if this_year_formset.is_valid() and last_year_formset.is_valid():
-            for form in this_year_formset:
-                form.save()
-            for form in last_year_formset:
-                form.save()
+            # apply all of the changes together rather than saving
+            # each form (and sending its notifications) one at a time:
+            changed = [
+                form
+                for form in list(this_year_formset) + list(last_year_formset)
+                if form.has_changed()
+            ]
+            update_approvals(
+                [x.cleaned_data["id"] for x in changed if x.cleaned_data["approved"]],
+                [
+                    x.cleaned_data["id"]
+                    for x in changed
+                    if not x.cleaned_data["approved"]
+                ],
+            )
 
             return HttpResponseRedirect(reverse("ApprovedProjectsList"))
         else:
@@ -440,11 +531,8 @@ def my_projects(request):
 
     user = User.objects.get(pk=request.user.id)
 
-    milestones = (
-        Milestone.objects.filter(category="Core")
-        .exclude(label__in=["Approved", "Submitted", "Cancelled", "Sign off"])
-        .order_by("order")
-        .all()
+    milestones = milestone_registry.filter(
+        category="Core", exclude=["Approved", "Submitted", "Cancelled", "Sign off"]
     )
 
     milestone_dict = collections.OrderedDict()
@@ -475,47 +563,8 @@ def my_projects(request):
     if len(employees) > 1:
         boss = True
 
-    # get the submitted, approved and completed projects from the last five years
-    this_year = datetime.datetime.now(pytz.utc).year
-
-    submitted_projects = (
-        Project.objects.submitted()
-        .filter(owner__pk__in=employees)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(submitted_projects, milestones)
-    submitted = make_proj_ms_dict(prj_milestones, milestones)
-
-    approved_projects = (
-        Project.objects.approved()
-        .filter(owner__pk__in=employees)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-    prj_milestones = get_proj_ms(approved_projects, milestones)
-    approved = make_proj_ms_dict(prj_milestones, milestones)
-
-    cancelled_projects = (
-        Project.objects.cancelled()
-        .filter(owner__pk__in=employees)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(cancelled_projects, milestones)
-    cancelled = make_proj_ms_dict(prj_milestones, milestones)
-
-    completed_projects = (
-        Project.objects.completed()
-        .filter(owner__pk__in=employees)
-        .filter(year__gte=this_year - 15)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(completed_projects, milestones)
-    complete = make_proj_ms_dict(prj_milestones, milestones)
+    # get the submitted, approved and completed projects
+    matrix = get_milestone_matrix(employees, milestones)
 
     notices = get_messages_dict(my_messages(user))
     notices_count = len(notices)
@@ -540,14 +589,14 @@ def my_projects(request):
         {
             "bookmarks": bookmarks,
             "formset": notices_formset,
-            "complete": complete,
-            "complete_count": len(completed_projects),
-            "approved": approved,
-            "approved_count": len(approved_projects),
-            "cancelled": cancelled,
-            "cancelled_count": len(cancelled_projects),
-            "submitted": submitted,
-            "submitted_count": len(submitted_projects),
+            "complete": matrix["complete"],
+            "complete_count": len(matrix["complete"]),
+            "approved": matrix["approved"],
+            "approved_count": len(matrix["approved"]),
+            "cancelled": matrix["cancelled"],
+            "cancelled_count": len(matrix["cancelled"]),
+            "submitted": matrix["submitted"],
+            "submitted_count": len(matrix["submitted"]),
             "boss": boss,
             "notices_count": notices_count,
             "milestones": milestone_dict,
@@ -575,11 +624,8 @@ def employee_projects(request, employee_name):
     # if I am the employees supervisor - get their projects and
     # associated milestones:
 
-    milestones = (
-        Milestone.objects.filter(category="Core")
-        .exclude(label__in=["Approved", "Submitted", "Cancelled", "Sign off"])
-        .order_by("order")
-        .all()
+    milestones = milestone_registry.filter(
+        category="Core", exclude=["Approved", "Submitted", "Cancelled", "Sign off"]
     )
 
     milestone_dict = collections.OrderedDict()
@@ -595,47 +641,8 @@ def employee_projects(request, employee_name):
 
     # core_reports = Milestone.objects.filter(category='Core', report=True)
 
-    # get the submitted, approved and completed projects from the last five years
-    this_year = datetime.datetime.now(pytz.utc).year
-
-    submitted_projects = (
-        Project.objects.submitted()
-        .filter(owner=my_employee)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(submitted_projects, milestones)
-    submitted = make_proj_ms_dict(prj_milestones, milestones)
-
-    approved_projects = (
-        Project.objects.approved()
-        .filter(owner=my_employee)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-    prj_milestones = get_proj_ms(approved_projects, milestones)
-    approved = make_proj_ms_dict(prj_milestones, milestones)
-
-    cancelled_projects = (
-        Project.objects.cancelled()
-        .filter(owner=my_employee)
-        .filter(year__gte=this_year - 5)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(cancelled_projects, milestones)
-    cancelled = make_proj_ms_dict(prj_milestones, milestones)
-
-    completed_projects = (
-        Project.objects.completed()
-        .filter(owner=my_employee)
-        .filter(year__gte=this_year - 15)
-        .values_list("pk")
-    )
-
-    prj_milestones = get_proj_ms(completed_projects, milestones)
-    complete = make_proj_ms_dict(prj_milestones, milestones)
+    # get the submitted, approved and completed projects
+    matrix = get_milestone_matrix([my_employee.id], milestones)
 
     template_name = "pjtk2/employee_projects.html"
 
@@ -651,14 +658,14 @@ def employee_projects(request, employee_name):
         {
             "employee": my_employee,
             "label": label,
-            "complete": complete,
-            "approved": approved,
-            "cancelled": cancelled,
-            "submitted": submitted,
-            "complete_count": len(completed_projects),
-            "approved_count": len(approved_projects),
-            "cancelled_count": len(cancelled_projects),
-            "submitted_count": len(submitted_projects),
+            "complete": matrix["complete"],
+            "approved": matrix["approved"],
+            "cancelled": matrix["cancelled"],
+            "submitted": matrix["submitted"],
+            "complete_count": len(matrix["complete"]),
+            "approved_count": len(matrix["approved"]),
+            "cancelled_count": len(matrix["cancelled"]),
+            "submitted_count": len(matrix["submitted"]),
             "milestones": milestone_dict,
             "edit": True,
         },
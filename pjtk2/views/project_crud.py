@@ -40,41 +40,40 @@ from ..utils.helpers import (
     is_manager,
     update_milestones,
 )
+from ..utils.project_detail import ProjectDetailBundle
 
 
 # @login_required
 def project_detail(request, slug):
     """
-    View project details.
+    View project details.  All of the information presented on the
+    detail page is gathered by ProjectDetailBundle so that the number
+    of queries does not depend on the number of reports or sisters.
     """
 
-    project = get_object_or_404(Project, slug=slug)
-
-    milestones = project.get_milestones()
-    core = get_assignments_with_paths(project)
-    custom = get_assignments_with_paths(project, core=False)
-
     # user = User.objects.get(pk=request.user.id)
     user = get_or_none(User, pk=request.user.id)
+    bundle = ProjectDetailBundle(slug, user=user)
+    project = bundle.project
+
     edit = can_edit(user, project)
     manager = is_manager(user)
 
     if project.cancelled:
         edit = False
 
-    has_sister = project.has_sister()
-
     return render(
         request,
         "pjtk2/projectdetail.html",
         {
-            "milestones": milestones,
-            "Core": core,
-            "Custom": custom,
+            "bundle": bundle,
+            "milestones": bundle.milestones,
+            "Core": bundle.core,
+            "Custom": bundle.custom,
             "project": project,
             "edit": edit,
             "manager": manager,
-            "has_sister": has_sister,
+            "has_sister": bundle.has_sister,
         },
     )
 
@@ -93,7 +92,7 @@ def edit_project(request, slug):
     if can_edit(request.user, project) is False:
         return HttpResponseRedirect(project.get_absolute_url())
 
-    return crud_project(request, slug, action="Edit")
+    return crud_project(request, slug, action="Edit", instance=project)
 
 
 def copy_project(request, slug):
@@ -114,14 +113,16 @@ def new_project(request):
 
 
 @login_required
-def crud_project(request, slug, action="New"):
+def crud_project(request, slug, action="New", instance=None):
     """
     A view to create, copy and edit projects, depending on the
-    value of 'action'.
+    value of 'action'.  If the project has already been retrieved
+    (e.g. - by edit_project()), it can be passed in as instance.
     """
 
     if slug:
-        instance = Project.objects.get(slug=slug)
+        if instance is None:
+            instance = Project.objects.get(slug=slug)
         orig_owner = instance.owner
         milestones = instance.get_milestones()
     else:
@@ -22,9 +22,10 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.gis.geos import Polygon
+from django.contrib.postgres.search import SearchRank
 from django.core.exceptions import ImproperlyConfigured
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Count, F
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db.models import Q, F
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView
 from django.views.generic.base import TemplateView
@@ -34,12 +35,19 @@ from taggit.models import Tag
 
 from common.models import Lake
 
-from ..models import Project, ProjectType
+from ..models import Project
 from ..forms import GeoForm
 
 from ..filters import ProjectFilter
 
-from ..utils.helpers import is_manager
+from ..utils.facets import get_project_facets
+from ..utils.helpers import is_manager, make_prefix_search_query
+from ..utils.pagination import (
+    estimated_count,
+    get_keyset_page,
+    is_unfiltered,
+    make_cursor,
+)
 
 from ..utils.spatial_utils import find_roi_projects  # ,  get_map
 
@@ -124,7 +132,38 @@ class ListFilteredMixin(object):
         return super(ListFilteredMixin, self).get_context_data(**kwargs)
 
 
-class ProjectSearch(ListView):
+class FallbackPaginationMixin(object):
+    """Mixin for paginated list views - rather than raising a 404,
+    page numbers that are not integers return the first page and page
+    numbers that are too large return the last page.  Views can
+    provide the number of objects by overriding get_object_count() if
+    they have a cheaper way to get it than the paginator's count().
+    """
+
+    def get_object_count(self, queryset):
+        """Return the number of objects in queryset, or None to let the
+        paginator count them."""
+        return None
+
+    def paginate_queryset(self, queryset, page_size):
+
+        paginator = self.get_paginator(queryset, page_size)
+        count = self.get_object_count(queryset)
+        if count is not None:
+            paginator.count = count
+
+        page = self.request.GET.get("page")
+        try:
+            paged_qs = paginator.page(page)
+        except PageNotAnInteger:
+            paged_qs = paginator.page(1)
+        except EmptyPage:
+            paged_qs = paginator.page(paginator.num_pages)
+
+        return (paginator, paged_qs, paged_qs.object_list, paged_qs.has_other_pages())
+
+
+class ProjectSearch(FallbackPaginationMixin, ListView):
     """
     """
 
@@ -141,12 +180,30 @@ class ProjectSearch(ListView):
 
         qs = Project.objects.select_related("project_type", "prj_ldr").all()
 
-        if search:
-            qs = qs.filter(content_search=search)
+        query = make_prefix_search_query(search)
+        if query is not None:
+            qs = (
+                qs.filter(content_search=query)
+                .annotate(rank=SearchRank(F("content_search"), query))
+                .order_by("-rank", "-prj_date1")
+            )
+
+        self.filterset = ProjectFilter(self.request.GET, qs)
 
-        filtered_qs = ProjectFilter(self.request.GET, qs)
+        return self.filterset.qs
 
-        return filtered_qs.qs
+    def get_facets(self):
+        """Calculate the faceted counts for the filtered projects the
+        first time they are needed - the total is used by the paginator
+        and the counts by the template."""
+        if getattr(self, "facets", None) is None:
+            self.facets = get_project_facets(self.object_list)
+        return self.facets
+
+    def get_object_count(self, queryset):
+        """The total number of matching projects is calculated with the
+        facets - no need to count them again."""
+        return self.get_facets()["total"]
 
     def get_context_data(self, **kwargs):
         """
@@ -165,75 +222,37 @@ class ProjectSearch(ListView):
         if lake_abbrev:
             context["lake"] = Lake.objects.filter(abbrev=lake_abbrev).first()
 
-        # need to add our factetted counts:
-        qs = self.get_queryset()
-        # calculate our facets by lake:
-        lakes = (
-            qs.select_related("lake")
-            .all()
-            .values(lakeName=F("lake__lake_name"), lakeAbbrev=F("lake__abbrev"))
-            .order_by("lake")
-            .annotate(N=Count("lake__lake_name"))
-        )
-        context["lakes"] = lakes
-
-        project_types = (
-            qs.select_related("project_type")
-            .all()
-            .values(
-                projType=F("project_type__project_type"),
-                projTypeId=F("project_type__id"),
-            )
-            .order_by("project_type")
-            .annotate(N=Count("project_type"))
-        )
-        context["project_types"] = project_types
-
-        project_scope = (
-            qs.select_related("project_type")
-            .all()
-            .values(projScope=F("project_type__scope"))
-            .order_by("project_type__scope")
-            .annotate(N=Count("project_type__scope"))
-        )
-
-        scope_lookup = dict(ProjectType.PROJECT_SCOPE_CHOICES)
-        for scope in project_scope:
-            scope["name"] = scope_lookup.get(scope["projScope"])
-
-        context["project_scope"] = project_scope
-
-        protocols = (
-            qs.select_related("protocol")
-            .all()
-            .values(
-                projProtocol=F("protocol__protocol"),
-                protocolAbbrev=F("protocol__abbrev"),
-            )
-            .order_by("protocol")
-            .annotate(N=Count("protocol"))
-        )
-        context["protocols"] = protocols
-
-        paginator = Paginator(self.object_list, self.paginate_by)
-        page = self.request.GET.get("page")
-        try:
-            paged_qs = paginator.page(page)
-        except PageNotAnInteger:
-            paged_qs = paginator.page(1)
-        except EmptyPage:
-            paged_qs = paginator.page(paginator.num_pages)
-
-        context["project_count"] = qs.count()
-        context["object_list"] = paged_qs.object_list
+        # the faceted counts and the total are calculated in a
+        # single pass over the filtered projects:
+        facets = self.get_facets()
+        context["lakes"] = facets["lakes"]
+        context["project_types"] = facets["project_types"]
+        context["project_scope"] = facets["project_scope"]
+        context["protocols"] = facets["protocols"]
+        context["project_count"] = facets["total"]
 
         return context
 
 
-class ProjectList(ListFilteredMixin, ListView):
+class ProjectList(FallbackPaginationMixin, ListFilteredMixin, ListView):
     # class ProjectList(FilterMixin, FilterView):
     """
-    A list view that can be filtered by django-filter
+    A list view that can be filtered by django-filter.
+
+    Projects are paginated by page number by default.  If the request
+    includes an 'after' parameter (a cursor made from the end date and
+    id of the last project seen), the page of projects following the
+    cursor is returned using keyset pagination instead - deep pages
+    do not get slower and the projects do not need to be counted.
+
+    The 'next' link of every page uses the cursor of the last project
+    on the page - following it switches to keyset pagination, and the
+    page numbers are no longer shown (cursor pages only link to the
+    next page and back to the first page).
+
+    When the list is not filtered and there are a lot of active
+    projects, the number of projects is the planner's estimate rather
+    than a count.
     """
     # modified to accept tag argument
     queryset = (
@@ -243,6 +262,45 @@ class ProjectList(ListFilteredMixin, ListView):
     # filterset_class = ProjectFilter
     template_name = "pjtk2/ProjectList.html"
     paginate_by = 50
+    # unfiltered lists larger than this will use an estimated count:
+    estimated_count_threshold = 10000
+
+    def get_object_count(self, queryset):
+        """Use the planner's estimate of the number of projects if the
+        queryset returns every active project (no tag, user or filter
+        parameters were applied) and there are a lot of them, otherwise
+        let the paginator count them."""
+
+        self.count_is_estimate = False
+        if not is_unfiltered(queryset, Project.objects.all()):
+            return None
+        estimate = estimated_count(queryset)
+        if estimate > self.estimated_count_threshold:
+            self.count_is_estimate = True
+            return estimate
+        return None
+
+    def get_queryset(self):
+        # add the id so the order is stable between pages
+        return super(ProjectList, self).get_queryset().order_by("-prj_date1", "-id")
+
+    def paginate_queryset(self, queryset, page_size):
+
+        self.next_cursor = None
+        cursor = self.request.GET.get("after")
+        if cursor is None:
+            paginator, page, projects, is_paginated = super(
+                ProjectList, self
+            ).paginate_queryset(queryset, page_size)
+            # the link to the next page follows the cursor of the last
+            # project so deep pages don't need an offset:
+            projects = page.object_list = list(projects)
+            if page.has_next() and projects:
+                self.next_cursor = make_cursor(projects[-1])
+            return (paginator, page, projects, is_paginated)
+
+        projects, self.next_cursor = get_keyset_page(queryset, cursor, page_size)
+        return (None, None, projects, False)
 
     def get_context_data(self, **kwargs):
         """
@@ -259,20 +317,15 @@ class ProjectList(ListFilteredMixin, ListView):
         else:
             prj_ldr = None
 
-        paginator = Paginator(self.object_list, self.paginate_by)
-        page = self.request.GET.get("page")
-        try:
-            paged_qs = paginator.page(page)
-        except PageNotAnInteger:
-            paged_qs = paginator.page(1)
-        except EmptyPage:
-            paged_qs = paginator.page(paginator.num_pages)
-
         context = super(ProjectList, self).get_context_data(**kwargs)
         context["tag"] = self.tag
         context["prj_ldr"] = prj_ldr
-        context["project_count"] = len(self.object_list)
-        context["object_list"] = paged_qs.object_list
+
+        paginator = context.get("paginator")
+        if paginator is not None:
+            context["project_count"] = paginator.count
+            context["count_is_estimate"] = self.count_is_estimate
+        context["next_cursor"] = self.next_cursor
 
         return context
 